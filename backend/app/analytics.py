@@ -0,0 +1,340 @@
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+from datetime import date
+from typing import Dict, List, Optional
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from .database import SessionLocal, Company, PEData, PERollingStat, PEIndexAggregate, PERollup, init_db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rolling windows in trading days (about 1 month, 1 quarter, 1 year and 5 years)
+ROLLING_WINDOWS = tuple(int(w) for w in os.getenv("ANALYTICS_WINDOWS", "20,60,252,1260").split(","))
+# Fewest points a window needs before statistics are stored for it
+MIN_PERIODS = int(os.getenv("ANALYTICS_MIN_PERIODS", "5"))
+
+ROLLING_COLUMNS = ["mean", "std", "p25", "median", "p75", "pct_rank", "zscore"]
+
+# Rollup period codes and the pandas periods they map to (weeks start on Monday)
+ROLLUP_PERIODS = {"W": "W-SUN", "M": "M"}
+ROLLUP_COLUMNS = ["first", "last", "min", "max", "mean", "count"]
+
+
+def _none_for_nan(records: List[Dict]) -> List[Dict]:
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, float) and np.isnan(value):
+                record[key] = None
+    return records
+
+
+def compute_rolling_stats(frame: pd.DataFrame, window: int) -> pd.DataFrame:
+    """
+    Rolling statistics of P/E series, computed for all companies at once.
+
+    Args:
+        frame: DataFrame with company_id, date and pe_ratio, sorted by company_id and date
+        window: Window size in rows (trading days)
+
+    Returns:
+        DataFrame aligned with frame with ROLLING_COLUMNS
+    """
+    rolling = frame.groupby("company_id", sort=False)["pe_ratio"].rolling(
+        window, min_periods=min(MIN_PERIODS, window)
+    )
+
+    def aligned(values: pd.Series) -> np.ndarray:
+        return values.reset_index(level=0, drop=True).reindex(frame.index).to_numpy()
+
+    mean = aligned(rolling.mean())
+    std = aligned(rolling.std())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zscore = np.where(std > 0, (frame["pe_ratio"].to_numpy() - mean) / std, np.nan)
+    return pd.DataFrame({
+        "mean": mean,
+        "std": std,
+        "p25": aligned(rolling.quantile(0.25)),
+        "median": aligned(rolling.median()),
+        "p75": aligned(rolling.quantile(0.75)),
+        "pct_rank": aligned(rolling.rank(pct=True)),
+        "zscore": zscore,
+    }, index=frame.index)
+
+
+def _load_history(db: Session, company_ids: List[int], since: date, lookback: int) -> pd.DataFrame:
+    """
+    P/E rows of several companies from `since` onwards, plus the `lookback`
+    rows before `since` that the rolling windows need. Each company is read
+    from its own lookback start, so a newly listed company with a short
+    history does not widen the read for the others.
+    """
+    # Date of the lookback-th row before `since`, per company: an index seek
+    # that walks at most `lookback` entries back, never the whole history
+    start = (
+        select(PEData.date)
+        .where(PEData.company_id == Company.id, PEData.date < since)
+        .order_by(PEData.date.desc())
+        .offset(lookback - 1)
+        .limit(1)
+        .scalar_subquery()
+    )
+    starts = {
+        company_id: first
+        for company_id, first in db.execute(select(Company.id, start).where(Company.id.in_(company_ids))).all()
+        if first is not None
+    }
+
+    # Companies sharing a trading calendar share their start, so this is usually one range per date
+    by_start: Dict[date, List[int]] = {}
+    for company_id, first in starts.items():
+        by_start.setdefault(first, []).append(company_id)
+    queries = [
+        select(PEData.company_id, PEData.date, PEData.pe_ratio)
+        .where(or_(*(and_(PEData.company_id.in_(ids), PEData.date >= first) for first, ids in by_start.items())))
+    ] if by_start else []
+
+    # Fewer than `lookback` rows before `since`: all of them are needed
+    unbounded = [company_id for company_id in company_ids if company_id not in starts]
+    if unbounded:
+        queries.append(
+            select(PEData.company_id, PEData.date, PEData.pe_ratio).where(PEData.company_id.in_(unbounded))
+        )
+
+    rows = [row for query in queries for row in db.execute(query).all()]
+    frame = pd.DataFrame(rows, columns=["company_id", "date", "pe_ratio"])
+    frame = frame.sort_values(["company_id", "date"], kind="stable")
+    frame["pe_ratio"] = frame["pe_ratio"].astype("float64")
+    return frame.reset_index(drop=True)
+
+
+def update_rolling_stats(db: Session, touched: Dict[int, date]) -> int:
+    """
+    Recompute rolling statistics from the earliest changed date onwards.
+    Only the windows that contain a changed date are rewritten, so a daily
+    ingest appends one row per company and window.
+
+    Args:
+        db: Database session
+        touched: Dict of company id -> earliest date written
+
+    Returns:
+        Number of rows written
+    """
+    lookback = max(ROLLING_WINDOWS) - 1
+    written = 0
+
+    # Companies touched from the same date (the usual case) are loaded and computed together
+    by_since: Dict[date, List[int]] = {}
+    for company_id, since in touched.items():
+        by_since.setdefault(since, []).append(company_id)
+
+    for since, company_ids in by_since.items():
+        frame = _load_history(db, company_ids, since, lookback)
+        if frame.empty:
+            continue
+
+        keep = (frame["date"] >= since).to_numpy()
+        parts = []
+        for window in ROLLING_WINDOWS:
+            stats = compute_rolling_stats(frame, window)[keep]
+            stats["company_id"] = frame["company_id"].to_numpy()[keep]
+            stats["date"] = frame["date"].to_numpy()[keep]
+            stats["window_size"] = window
+            parts.append(stats[stats["mean"].notna()])
+        rows = pd.concat(parts).to_dict("records")
+
+        db.execute(delete(PERollingStat).where(
+            PERollingStat.company_id.in_(company_ids),
+            PERollingStat.date >= since
+        ))
+        if rows:
+            db.execute(insert(PERollingStat), _none_for_nan(rows))
+        written += len(rows)
+
+    db.commit()
+    return written
+
+
+def update_index_aggregates(db: Session, since: date) -> int:
+    """
+    Recompute cross-sectional aggregates for every date from `since` onwards.
+
+    Returns:
+        Number of dates written
+    """
+    rows = db.execute(
+        select(PEData.date, PEData.pe_ratio).where(PEData.date >= since, PEData.pe_ratio > 0)
+    ).all()
+    frame = pd.DataFrame(rows, columns=["date", "pe_ratio"])
+
+    db.execute(delete(PEIndexAggregate).where(PEIndexAggregate.date >= since))
+    if frame.empty:
+        db.commit()
+        return 0
+
+    frame["earnings_yield"] = 1.0 / frame["pe_ratio"]
+    grouped = frame.groupby("date")
+    aggregates = pd.DataFrame({
+        "constituents": grouped["pe_ratio"].count(),
+        "mean_pe": grouped["pe_ratio"].mean(),
+        "median_pe": grouped["pe_ratio"].median(),
+        "harmonic_pe": grouped["pe_ratio"].count() / grouped["earnings_yield"].sum(),
+    })
+    aggregates["date"] = aggregates.index
+
+    db.execute(insert(PEIndexAggregate), _none_for_nan(aggregates.to_dict("records")))
+    db.commit()
+    return len(aggregates)
+
+
+def period_start(day: date, period: str) -> date:
+    """First day of the rollup period ("W" or "M") containing `day`"""
+    return pd.Timestamp(day).to_period(ROLLUP_PERIODS[period]).start_time.date()
+
+
+def update_rollups(db: Session, touched: Dict[int, date]) -> int:
+    """
+    Recompute weekly and monthly rollups for every period from the one
+    containing the earliest changed date onwards.
+
+    Returns:
+        Number of rollup rows written
+    """
+    by_since: Dict[date, List[int]] = {}
+    for company_id, since in touched.items():
+        by_since.setdefault(since, []).append(company_id)
+
+    written = 0
+    for since, company_ids in by_since.items():
+        for period, pandas_period in ROLLUP_PERIODS.items():
+            start = period_start(since, period)
+            frame = pd.DataFrame(
+                db.execute(
+                    select(PEData.company_id, PEData.date, PEData.pe_ratio)
+                    .where(PEData.company_id.in_(company_ids), PEData.date >= start)
+                    .order_by(PEData.company_id, PEData.date)
+                ).all(),
+                columns=["company_id", "date", "pe_ratio"]
+            )
+
+            db.execute(delete(PERollup).where(
+                PERollup.company_id.in_(company_ids),
+                PERollup.period == period,
+                PERollup.period_start >= start
+            ))
+            if frame.empty:
+                continue
+
+            frame["period_start"] = pd.to_datetime(frame["date"]).dt.to_period(pandas_period).dt.start_time.dt.date
+            rollups = (
+                frame.groupby(["company_id", "period_start"])["pe_ratio"]
+                .agg(["first", "last", "min", "max", "mean", "count"])
+                .reset_index()
+            )
+            rollups["period"] = period
+            rows = rollups.to_dict("records")
+            db.execute(insert(PERollup), _none_for_nan(rows))
+            written += len(rows)
+
+    db.commit()
+    return written
+
+
+def update_analytics(db: Session, touched: Dict[int, date]):
+    """Bring all analytics tables up to date after an ingest. Called by bulk_upsert_pe_data."""
+    if not touched:
+        return
+    rolling_rows = update_rolling_stats(db, touched)
+    index_rows = update_index_aggregates(db, min(touched.values()))
+    rollup_rows = update_rollups(db, touched)
+    logger.info(
+        f"Updated analytics: {rolling_rows} rolling stat rows, {index_rows} index dates, {rollup_rows} rollups"
+    )
+
+
+def rebuild_analytics(db: Session):
+    """Recompute all analytics from the full history"""
+    touched = dict(db.execute(
+        select(PEData.company_id, func.min(PEData.date)).group_by(PEData.company_id)
+    ).all())
+    update_analytics(db, touched)
+
+
+def get_rollups(
+    db: Session,
+    period: str,
+    company_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    """
+    Select rollup rows of one period, ordered by company and period start.
+    start_date selects from the period containing it.
+    """
+    query = select(
+        PERollup.company_id, PERollup.period_start, *[getattr(PERollup, column) for column in ROLLUP_COLUMNS]
+    ).where(PERollup.period == period)
+    if company_id is not None:
+        query = query.where(PERollup.company_id == company_id)
+    if start_date:
+        query = query.where(PERollup.period_start >= period_start(start_date, period))
+    if end_date:
+        query = query.where(PERollup.period_start <= end_date)
+    return db.execute(query.order_by(PERollup.company_id, PERollup.period_start)).all()
+
+
+def get_rolling_stats(
+    db: Session,
+    company_id: int,
+    window: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> List[Dict]:
+    query = select(
+        PERollingStat.date, *[getattr(PERollingStat, column) for column in ROLLING_COLUMNS]
+    ).where(PERollingStat.company_id == company_id, PERollingStat.window_size == window)
+    if start_date:
+        query = query.where(PERollingStat.date >= start_date)
+    if end_date:
+        query = query.where(PERollingStat.date <= end_date)
+
+    return [
+        {"date": row.date.isoformat(), **{column: getattr(row, column) for column in ROLLING_COLUMNS}}
+        for row in db.execute(query.order_by(PERollingStat.date)).all()
+    ]
+
+
+def get_index_aggregates(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[Dict]:
+    query = select(PEIndexAggregate)
+    if start_date:
+        query = query.where(PEIndexAggregate.date >= start_date)
+    if end_date:
+        query = query.where(PEIndexAggregate.date <= end_date)
+
+    return [
+        {
+            "date": row.date.isoformat(),
+            "constituents": row.constituents,
+            "mean_pe": row.mean_pe,
+            "median_pe": row.median_pe,
+            "harmonic_pe": row.harmonic_pe,
+        }
+        for row in db.execute(query.order_by(PEIndexAggregate.date)).scalars()
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the P/E analytics tables from the full history")
+    parser.parse_args()
+    init_db()
+    db = SessionLocal()
+    try:
+        rebuild_analytics(db)
+    finally:
+        db.close()
@@ -0,0 +1,405 @@
+"""
+Historical P/E backfill.
+
+Loads P/E history for a date range from a pluggable source and streams it
+into the database: fetch -> parse -> validate -> bulk write. Sources split
+their work into partitions which are fetched concurrently; a single writer
+drains a bounded queue so memory stays flat, and each partition's progress is
+checkpointed so a killed run resumes where it stopped.
+
+Usage (from the backend directory):
+    python -m app.backfill --source csv --path "dumps/*.csv" --start 2010-01-01 --end 2024-12-31
+    python -m app.backfill --source nse-service --universe NIFTY100 --start 2015-01-01
+"""
+import argparse
+import glob
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .database import SessionLocal, BackfillCheckpoint, init_db
+from .ingest import bulk_upsert_pe_data, resolve_company_ids, after_ingest
+from .scraper import NSE_SERVICE_URL, NIFTY_50_SYMBOLS, service_session
+from .universes import member_symbols
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns every source must provide
+COLUMNS = ["symbol", "date", "pe_ratio"]
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_CONCURRENCY = 4
+# Seconds between throughput reports
+REPORT_INTERVAL = 10
+
+
+class BackfillSource:
+    """
+    Base class for P/E history sources.
+
+    A source splits its work into partitions, the unit of concurrency and
+    checkpointing, and yields each partition as DataFrame batches with
+    symbol, date and pe_ratio columns.
+    """
+    name = "source"
+
+    def partitions(self, start: date, end: date) -> List[str]:
+        raise NotImplementedError
+
+    def fetch(self, partition: str, start: date, end: date, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+        """
+        Yield the partition's rows in batches.
+
+        Args:
+            partition: One of the keys returned by partitions()
+            start: First date of the backfill
+            end: Last date of the backfill
+            skip_rows: Source rows already written by an earlier run
+        """
+        raise NotImplementedError
+
+
+class CSVSource(BackfillSource):
+    """CSV dump(s) with symbol, date and pe_ratio columns; one partition per file"""
+    name = "csv"
+
+    def __init__(self, pattern: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.paths = sorted(glob.glob(pattern))
+        if not self.paths:
+            raise FileNotFoundError(f"No files match {pattern}")
+        self.batch_size = batch_size
+
+    def partitions(self, start: date, end: date) -> List[str]:
+        return self.paths
+
+    def fetch(self, partition: str, start: date, end: date, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+        yield from pd.read_csv(
+            partition,
+            usecols=COLUMNS,
+            dtype={"symbol": str},
+            chunksize=self.batch_size,
+            skiprows=range(1, skip_rows + 1)
+        )
+
+
+class ParquetSource(BackfillSource):
+    """Parquet dump(s) with symbol, date and pe_ratio columns; one partition per file"""
+    name = "parquet"
+
+    def __init__(self, pattern: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.paths = sorted(glob.glob(pattern))
+        if not self.paths:
+            raise FileNotFoundError(f"No files match {pattern}")
+        self.batch_size = batch_size
+
+    def partitions(self, start: date, end: date) -> List[str]:
+        return self.paths
+
+    def fetch(self, partition: str, start: date, end: date, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet backfills need pyarrow: pip install pyarrow")
+
+        parquet_file = pq.ParquetFile(partition)
+        for batch in parquet_file.iter_batches(batch_size=self.batch_size, columns=COLUMNS):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            if skip_rows:
+                batch = batch.slice(skip_rows)
+                skip_rows = 0
+            yield batch.to_pandas()
+
+
+class NSEServiceSource(BackfillSource):
+    """
+    P/E history from the NSE service, one partition per symbol per calendar year.
+
+    Expects GET {NSE_SERVICE_URL}/api/pe/history/{symbol}?from=YYYY-MM-DD&to=YYYY-MM-DD
+    to answer with {"success": true, "data": [{"date": ..., "pe_ratio": ...}, ...]}.
+    """
+    name = "nse-service"
+
+    def __init__(self, symbols: Optional[List[str]] = None, base_url: str = NSE_SERVICE_URL):
+        self.symbols = symbols or NIFTY_50_SYMBOLS
+        self.base_url = base_url
+
+    def partitions(self, start: date, end: date) -> List[str]:
+        return [
+            f"{symbol}:{year}"
+            for symbol in self.symbols
+            for year in range(start.year, end.year + 1)
+        ]
+
+    def fetch(self, partition: str, start: date, end: date, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+        symbol, year = partition.rsplit(":", 1)
+        window_start = max(start, date(int(year), 1, 1))
+        window_end = min(end, date(int(year), 12, 31))
+
+        response = service_session.get(
+            f"{self.base_url}/api/pe/history/{symbol}",
+            params={"from": window_start.isoformat(), "to": window_end.isoformat()},
+            timeout=60
+        )
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("success"):
+            raise ValueError(f"NSE service returned no history for {symbol}: {data.get('message', 'Unknown error')}")
+
+        frame = pd.DataFrame(data.get("data", []), columns=["date", "pe_ratio"])
+        frame["symbol"] = symbol
+        yield frame.iloc[skip_rows:]
+
+
+def clean_batch(
+    frame: pd.DataFrame,
+    start: date,
+    end: date,
+    symbols: Optional[List[str]] = None
+) -> Tuple[List[Dict], int]:
+    """
+    Parse and validate a raw batch.
+
+    Returns:
+        Tuple of (rows ready for bulk_upsert_pe_data, number of rows skipped)
+    """
+    symbol = frame["symbol"].astype(str).str.strip().str.upper()
+    dates = pd.to_datetime(frame["date"], errors="coerce")
+    pe_ratio = pd.to_numeric(frame["pe_ratio"], errors="coerce")
+
+    valid = (
+        dates.notna()
+        & np.isfinite(pe_ratio)
+        & (pe_ratio > 0)
+        & (dates >= pd.Timestamp(start))
+        & (dates <= pd.Timestamp(end))
+        & (symbol != "")
+    )
+    if symbols:
+        valid &= symbol.isin(symbols)
+
+    rows = [
+        {"symbol": s, "date": d, "pe_ratio": float(p)}
+        for s, d, p in zip(symbol[valid], dates[valid].dt.date, pe_ratio[valid])
+    ]
+    return rows, int((~valid).sum())
+
+
+@dataclass
+class _Batch:
+    partition: str
+    position: int  # Source rows consumed, including this batch
+    rows: List[Dict]
+    skipped: int = 0
+    done: bool = False
+    error: Optional[Exception] = None
+
+
+def _put(batches: queue.Queue, batch: _Batch, stop: threading.Event):
+    """Put a batch on the bounded queue, giving up if the run is being stopped"""
+    while not stop.is_set():
+        try:
+            batches.put(batch, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _produce(source, partition, start, end, skip_rows, symbols, batches, stop):
+    """Fetch, parse and validate one partition, handing batches to the writer"""
+    position = skip_rows
+    try:
+        for frame in source.fetch(partition, start, end, skip_rows=skip_rows):
+            if stop.is_set():
+                return
+            position += len(frame)
+            rows, skipped = clean_batch(frame, start, end, symbols)
+            _put(batches, _Batch(partition, position, rows, skipped), stop)
+        _put(batches, _Batch(partition, position, [], done=True), stop)
+    except Exception as e:
+        _put(batches, _Batch(partition, position, [], error=e), stop)
+
+
+def _save_checkpoint(db, checkpoints: Dict[str, BackfillCheckpoint], job: str, batch: _Batch, rows_written: int):
+    checkpoint = checkpoints.get(batch.partition)
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint(job=job, partition=batch.partition, rows_written=0)
+        db.add(checkpoint)
+        checkpoints[batch.partition] = checkpoint
+
+    checkpoint.position = batch.position
+    checkpoint.rows_written = (checkpoint.rows_written or 0) + rows_written
+    checkpoint.completed = batch.done
+    checkpoint.updated_at = datetime.now()
+    db.commit()
+
+
+def run_backfill(
+    source: BackfillSource,
+    start: date,
+    end: date,
+    job: Optional[str] = None,
+    symbols: Optional[List[str]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_conflict: str = "ignore",
+    report_interval: float = REPORT_INTERVAL
+) -> Dict:
+    """
+    Backfill P/E history from a source, resuming from earlier checkpoints.
+
+    Args:
+        source: Where to load history from
+        start: First date to load
+        end: Last date to load
+        job: Checkpoint name; runs with the same name resume each other
+             (default: derived from the source and date range)
+        symbols: Only load these symbols (default: everything the source has)
+        concurrency: Partitions fetched in parallel
+        on_conflict: "ignore" or "update", see bulk_upsert_pe_data
+        report_interval: Seconds between throughput log lines
+
+    Returns:
+        Dict with rows written, rows skipped, partition counts and rows/s
+    """
+    job = job or f"{source.name}:{start.isoformat()}:{end.isoformat()}"
+    symbols = [s.upper() for s in symbols] if symbols else None
+
+    db = SessionLocal()
+    stop = threading.Event()
+    # Bounded so fetchers can never run more than a few batches ahead of the writer
+    batches: queue.Queue = queue.Queue(maxsize=concurrency * 2)
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="backfill")
+
+    try:
+        checkpoints = {
+            checkpoint.partition: checkpoint
+            for checkpoint in db.query(BackfillCheckpoint).filter(BackfillCheckpoint.job == job).all()
+        }
+        partitions = source.partitions(start, end)
+        pending = [p for p in partitions if not (p in checkpoints and checkpoints[p].completed)]
+        logger.info(
+            f"Backfill {job}: {len(pending)}/{len(partitions)} partitions to load"
+            + (f" (resuming, {len(partitions) - len(pending)} already complete)" if checkpoints else "")
+        )
+
+        for partition in pending:
+            skip_rows = checkpoints[partition].position if partition in checkpoints else 0
+            pool.submit(_produce, source, partition, start, end, skip_rows, symbols, batches, stop)
+
+        started = time.monotonic()
+        last_report = started
+        rows_written = 0
+        rows_skipped = 0
+        failed = 0
+        remaining = len(pending)
+        # Earliest date loaded per symbol, analytics are refreshed from there once at the end
+        earliest: Dict[str, date] = {}
+
+        while remaining:
+            batch = batches.get()
+            if batch.error is not None:
+                logger.error(f"Backfill {job}: partition {batch.partition} failed: {str(batch.error)}")
+                failed += 1
+                remaining -= 1
+                continue
+
+            written = bulk_upsert_pe_data(db, batch.rows, on_conflict=on_conflict, refresh=False) if batch.rows else 0
+            _save_checkpoint(db, checkpoints, job, batch, written)
+            for row in batch.rows:
+                if row["symbol"] not in earliest or row["date"] < earliest[row["symbol"]]:
+                    earliest[row["symbol"]] = row["date"]
+            rows_written += written
+            rows_skipped += batch.skipped
+            if batch.done:
+                remaining -= 1
+
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                last_report = now
+                logger.info(
+                    f"Backfill {job}: {rows_written} rows written, {rows_written / (now - started):.0f} rows/s, "
+                    f"{len(pending) - remaining}/{len(pending)} partitions done"
+                )
+
+        elapsed = time.monotonic() - started
+        if earliest:
+            company_ids = resolve_company_ids(db, earliest.keys())
+            after_ingest(db, {company_ids[symbol]: first for symbol, first in earliest.items()})
+
+        summary = {
+            "job": job,
+            "rows_written": rows_written,
+            "rows_skipped": rows_skipped,
+            "partitions": len(partitions),
+            "partitions_loaded": len(pending) - failed,
+            "partitions_failed": failed,
+            "elapsed_seconds": round(elapsed, 2),
+            "rows_per_second": round(rows_written / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        logger.info(f"Backfill {job} finished: {summary}")
+        return summary
+
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        db.close()
+
+
+def _build_source(args) -> BackfillSource:
+    if args.source == "csv":
+        return CSVSource(args.path, batch_size=args.batch_size)
+    if args.source == "parquet":
+        return ParquetSource(args.path, batch_size=args.batch_size)
+    return NSEServiceSource(symbols=args.symbols)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill historical P/E data")
+    # nse-service needs a service that serves /api/pe/history/{symbol}, such as benchmarks/stub_nse.py
+    parser.add_argument("--source", choices=["csv", "parquet", "nse-service"], default="csv")
+    parser.add_argument("--path", help="File or glob pattern for csv/parquet sources")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(), help="Last date (default: today)")
+    parser.add_argument("--symbols", type=lambda value: value.split(","), help="Comma-separated symbols to load")
+    parser.add_argument("--universe", help="Load the members of this universe as of --end, e.g. NIFTY100")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--job", help="Checkpoint name, reuse it to resume a run")
+    parser.add_argument("--update", action="store_true", help="Overwrite existing P/E values")
+    args = parser.parse_args()
+
+    if args.source in ("csv", "parquet") and not args.path:
+        parser.error(f"--path is required for the {args.source} source")
+
+    init_db()
+    if args.universe:
+        db = SessionLocal()
+        try:
+            args.symbols = member_symbols(db, args.universe, args.end)
+        finally:
+            db.close()
+        if not args.symbols:
+            parser.error(f"Universe {args.universe} has no members on {args.end}")
+    run_backfill(
+        _build_source(args),
+        args.start,
+        args.end,
+        job=args.job,
+        symbols=args.symbols,
+        concurrency=args.concurrency,
+        on_conflict="update" if args.update else "ignore"
+    )
+
+
+if __name__ == "__main__":
+    main()
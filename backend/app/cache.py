@@ -0,0 +1,211 @@
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import logging
+import os
+import threading
+import time
+import zlib
+from fastapi import Request
+from fastapi.responses import Response
+from .database import DataVersion
+from .profiling import current_timings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Seconds a worker trusts its last read of the shared data version
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "1.0"))
+
+# Request headers that change the representation and so are part of the cache key
+VARY_HEADERS = ("accept", "accept-encoding")
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str
+    status_code: int = 200
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class ResponseCache:
+    """
+    LRU cache of encoded responses, bounded by entry count and total body size.
+    Entries belong to one data version; a newer version empties the cache.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._size = 0
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sync_version(self, version: int):
+        if version != self._version:
+            self._entries.clear()
+            self._size = 0
+            self._version = version
+
+    def get(self, key: str, version: int) -> Optional[CachedResponse]:
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, version: int, entry: CachedResponse):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._sync_version(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[key] = entry
+            self._size += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+response_cache = ResponseCache()
+
+_version_lock = threading.Lock()
+_cached_version: Optional[Tuple[int, datetime]] = None
+_version_checked_at = 0.0
+
+
+def get_data_version(db: Session) -> Tuple[int, datetime]:
+    """
+    Current (version, last modified) of the data, re-read from the database
+    at most every DATA_VERSION_TTL seconds.
+    """
+    global _cached_version, _version_checked_at
+
+    now = time.monotonic()
+    with _version_lock:
+        if _cached_version is not None and now - _version_checked_at < DATA_VERSION_TTL:
+            return _cached_version
+
+    row = db.get(DataVersion, 1, populate_existing=True)
+    current = (row.version, row.updated_at) if row else (0, datetime(1970, 1, 1))
+
+    with _version_lock:
+        _cached_version = current
+        _version_checked_at = now
+    return current
+
+
+def bump_data_version(db: Session):
+    """Mark the data as changed for every worker. Call after an ingest commits."""
+    global _version_checked_at
+
+    db.execute(
+        update(DataVersion)
+        .where(DataVersion.id == 1)
+        .values(version=DataVersion.version + 1, updated_at=datetime.utcnow())
+    )
+    db.commit()
+
+    # Make this worker pick up the new version on its next request
+    with _version_lock:
+        _version_checked_at = 0.0
+    response_cache.clear()
+
+
+def _cache_key(request: Request) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    varying = "|".join(request.headers.get(name, "") for name in VARY_HEADERS)
+    return f"{request.url.path}?{query}|{varying}"
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).astimezone(timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+async def cached_response(request: Request, db: AsyncSession, build: Callable[[], Awaitable[Response]]) -> Response:
+    """
+    Serve a response from the cache, or build it and cache it.
+    Adds ETag/Last-Modified and answers 304 to matching conditional requests.
+
+    Args:
+        request: Incoming request; path, query params and Accept headers form the key
+        db: Session used to read the shared data version
+        build: Coroutine function producing the response on a cache miss
+    """
+    version, last_modified = await db.run_sync(get_data_version)
+    key = _cache_key(request)
+
+    entry = response_cache.get(key, version)
+    timings = current_timings()
+    if timings is not None:
+        timings.cache = "miss" if entry is None else "hit"
+    if entry is None:
+        response = await build()
+        entry = CachedResponse(
+            body=response.body,
+            media_type=response.media_type,
+            status_code=response.status_code,
+            headers={
+                name: value for name, value in response.headers.items()
+                if name.lower() not in ("content-length", "content-type")
+            }
+        )
+        if response.status_code == 200:
+            response_cache.put(key, version, entry)
+
+    etag = f'W/"{version}-{zlib.crc32(key.encode()):08x}"'
+    headers = dict(entry.headers)
+    headers.update({
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+    })
+
+    if _not_modified(request, etag, last_modified):
+        headers.pop("content-encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, status_code=entry.status_code, media_type=entry.media_type, headers=headers)
@@ -1,13 +1,176 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, Date, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Boolean, Column, Integer, Float, String, Text, Date, DateTime, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import IntegrityError, NoSuchModuleError
 from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+import logging
 import os
+import threading
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Database path
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nifty50_pe_data.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# SQLite tuning, see DEPLOYMENT.md
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+
+# Connections per worker process
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+DB_WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "2"))
+
+_url = make_url(DATABASE_URL)
+IS_SQLITE = _url.get_backend_name() == "sqlite"
+
+
+def _sqlite_pragmas(read_only: bool):
+    """Connect-event listener applying the SQLite pragmas to every new connection"""
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            # Persistent in the database file; readers pick it up from there
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return set_pragmas
+
+
+def _create_sqlite_engine(pool_size: int, read_only: bool):
+    sqlite_engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=pool_size
+    )
+    event.listen(sqlite_engine, "connect", _sqlite_pragmas(read_only))
+    return sqlite_engine
+
+
+if IS_SQLITE and _url.database not in (None, "", ":memory:"):
+    # In WAL mode readers see the last committed data while a write transaction
+    # is open, so API reads get their own engine and never wait on an ingest
+    engine = _create_sqlite_engine(DB_WRITE_POOL_SIZE, read_only=False)
+    read_engine = _create_sqlite_engine(DB_READ_POOL_SIZE, read_only=True)
+else:
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if IS_SQLITE else {})
+    read_engine = engine
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# asyncio drivers for the API's read path; the scheduler and ingest stay on the sync engines
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def _async_url():
+    backend = _url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for the {backend} dialect")
+    return _url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def _create_async_read_engine():
+    """
+    The asyncio read engine, or None when no asyncio driver is available for
+    the database (not installed, or none known for the dialect).
+    create_async_engine imports the driver, so this runs on first use rather
+    than at import, and a missing driver only affects the read endpoints.
+    """
+    try:
+        url = os.getenv("ASYNC_DATABASE_URL") or _async_url()
+        if IS_SQLITE:
+            # aiosqlite runs each connection on its own thread, so queries no longer
+            # hold up the event loop; pooled like the sync read engine
+            async_engine = create_async_engine(
+                url,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=DB_READ_POOL_SIZE,
+                max_overflow=DB_READ_POOL_SIZE
+            )
+            event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas(read_only=True))
+        else:
+            async_engine = create_async_engine(url, pool_size=DB_READ_POOL_SIZE, max_overflow=DB_READ_POOL_SIZE)
+    except (ImportError, NoSuchModuleError, ValueError) as e:
+        logger.warning(f"No asyncio database driver ({str(e)}), read endpoints use the sync read pool on worker threads")
+        return None
+    return async_engine
+
+
+_async_read_engine = None
+_async_read_sessions = None
+_async_engine_created = False
+_async_engine_lock = threading.Lock()
+
+
+def get_async_read_sessionmaker():
+    """Session factory of the asyncio read engine, None without an asyncio driver"""
+    global _async_read_engine, _async_read_sessions, _async_engine_created
+    with _async_engine_lock:
+        if not _async_engine_created:
+            _async_read_engine = _create_async_read_engine()
+            if _async_read_engine is not None:
+                _async_read_sessions = async_sessionmaker(bind=_async_read_engine, autoflush=False, expire_on_commit=False)
+            _async_engine_created = True
+    return _async_read_sessions
+
+
+async def dispose_async_read_engine():
+    """Close the asyncio read engine's connections, if it was created"""
+    if _async_read_engine is not None:
+        await _async_read_engine.dispose()
+
+
+class _BufferedStream:
+    """Rows of a query fetched in full, with the partitions() of an AsyncResult"""
+
+    def __init__(self, rows: list):
+        self._rows = rows
+
+    async def partitions(self, size: int):
+        for start in range(0, len(self._rows), size):
+            yield self._rows[start:start + size]
+
+
+class ThreadedReadSession:
+    """
+    Stand-in for AsyncSession when no asyncio driver is installed: the same
+    execute/scalar/stream/run_sync calls, run on a sync read session in the
+    threadpool so they do not block the event loop.
+    """
+
+    def __init__(self):
+        self._session = ReadSessionLocal()
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(lambda: self._session.execute(statement, *args, **kwargs))
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self._session.scalar, statement, *args, **kwargs)
+
+    async def stream(self, statement, *args, **kwargs):
+        rows = await run_in_threadpool(lambda: self._session.execute(statement, *args, **kwargs).all())
+        return _BufferedStream(rows)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self._session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self._session.close)
+
 
 Base = declarative_base()
 
@@ -19,21 +182,305 @@ class Company(Base):
     symbol = Column(String, unique=True, index=True)
     name = Column(String)
     sector = Column(String)
+    industry = Column(String)  # As in the NSE constituent lists
+    isin = Column(String)
+
+
+class Universe(Base):
+    """A set of tracked companies: an index (NIFTY50, NIFTY100, ...) or a custom watchlist"""
+    __tablename__ = "universes"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    kind = Column(String, nullable=False, default="index")  # index or watchlist
+    description = Column(String)
+
+
+class UniverseMember(Base):
+    """A company's membership of a universe from start_date up to, not including, end_date"""
+    __tablename__ = "universe_members"
+    __table_args__ = (
+        # As-of lookups: one universe, memberships started on or before a date
+        Index("ix_universe_members_universe_start", "universe_id", "start_date", "end_date", "company_id"),
+        Index("ix_universe_members_company", "company_id"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    universe_id = Column(Integer, nullable=False)
+    company_id = Column(Integer, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date)  # None while still a member
 
 
 class PEData(Base):
     __tablename__ = "pe_data"
+    __table_args__ = (
+        # One P/E value per company per day; also the ON CONFLICT target for bulk upserts
+        Index("uq_pe_data_company_date", "company_id", "date", unique=True),
+        # Covers the per-company date range reads, which then never touch the table
+        Index("ix_pe_data_company_date_pe", "company_id", "date", "pe_ratio"),
+        # Delta sync reads rows written after a cursor timestamp
+        Index("ix_pe_data_timestamp", "timestamp"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    company_id = Column(Integer, index=True)
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer)
     date = Column(Date, index=True)
     pe_ratio = Column(Float)
     timestamp = Column(DateTime)
 
 
+class PERollingStat(Base):
+    """Rolling P/E statistics per company, window (in trading days) and date"""
+    __tablename__ = "pe_rolling_stats"
+    __table_args__ = (
+        Index("uq_pe_rolling_stats_company_window_date", "company_id", "window_size", "date", unique=True),
+        # Cross-sectional reads: every company's statistics of one window on one date
+        Index("ix_pe_rolling_stats_window_date", "window_size", "date"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, nullable=False)
+    window_size = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    mean = Column(Float)
+    std = Column(Float)
+    p25 = Column(Float)
+    median = Column(Float)
+    p75 = Column(Float)
+    pct_rank = Column(Float)  # Percentile of the day's P/E within the window, 0-1
+    zscore = Column(Float)
+
+
+class PEIndexAggregate(Base):
+    """Cross-sectional P/E aggregates over all companies for one date"""
+    __tablename__ = "pe_index_aggregates"
+    
+    date = Column(Date, primary_key=True)
+    constituents = Column(Integer)
+    mean_pe = Column(Float)
+    median_pe = Column(Float)
+    harmonic_pe = Column(Float)  # Equal-weight harmonic mean, how index-level P/E aggregates
+
+
+class PERollup(Base):
+    """Weekly ("W") or monthly ("M") OHLC-style P/E aggregates per company"""
+    __tablename__ = "pe_rollups"
+    __table_args__ = (
+        Index("uq_pe_rollups_company_period_start", "company_id", "period", "period_start", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, nullable=False)
+    period = Column(String(1), nullable=False)
+    period_start = Column(Date, nullable=False)
+    first = Column(Float)
+    last = Column(Float)
+    min = Column(Float)
+    max = Column(Float)
+    mean = Column(Float)
+    count = Column(Integer)
+
+
+class BackfillCheckpoint(Base):
+    __tablename__ = "backfill_checkpoints"
+    __table_args__ = (
+        UniqueConstraint("job", "partition", name="uq_backfill_checkpoints_job_partition"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String, index=True)
+    partition = Column(String)
+    position = Column(Integer, default=0)  # Source rows already written
+    rows_written = Column(Integer, default=0)
+    completed = Column(Boolean, default=False)
+    updated_at = Column(DateTime)
+
+
+class DataVersion(Base):
+    """Single row bumped after every ingest, shared by all workers to keep their caches consistent"""
+    __tablename__ = "data_versions"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime)
+
+
+class SchedulerLease(Base):
+    """Leader lease; the worker holding an unexpired lease runs the scheduled jobs"""
+    __tablename__ = "scheduler_leases"
+    
+    name = Column(String, primary_key=True)
+    holder = Column(String)
+    acquired_at = Column(DateTime)
+    expires_at = Column(DateTime)
+
+
+class ScrapeRun(Base):
+    """One scrape of all symbols, from the first request to the database write"""
+    __tablename__ = "scrape_runs"
+    
+    id = Column(Integer, primary_key=True)
+    trigger = Column(String)  # scheduled or manual
+    status = Column(String)  # succeeded or failed
+    mode = Column(String)  # batch, individual or mixed (shards scraped different ways)
+    started_at = Column(DateTime, index=True)
+    finished_at = Column(DateTime)
+    duration_seconds = Column(Float)
+    symbols_total = Column(Integer)
+    symbols_ok = Column(Integer)
+    symbols_failed = Column(Integer)
+    retries = Column(Integer)  # Extra requests: fallbacks to another source plus 401/403 retries
+    db_write_seconds = Column(Float)
+    rows_saved = Column(Integer)
+    seconds_after_close = Column(Float)  # finished_at relative to that day's market close
+    error = Column(String)
+
+
+class ScrapeSymbolResult(Base):
+    """Outcome of one symbol within a scrape run"""
+    __tablename__ = "scrape_symbol_results"
+    
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, index=True)
+    symbol = Column(String)
+    source = Column(String)  # batch, service or nse_direct; the last one tried if it failed
+    success = Column(Boolean)
+    attempts = Column(Integer)
+    latency_seconds = Column(Float)
+
+
+class ScrapeJob(Base):
+    """
+    A scrape of all tracked symbols, manual or scheduled, shared by all workers.
+    The unique active flag lets at most one job be queued or running at a time.
+    """
+    __tablename__ = "scrape_jobs"
+    
+    id = Column(String, primary_key=True)
+    active = Column(Boolean, unique=True)  # True while queued or running, None once finished
+    trigger = Column(String)  # scheduled or manual
+    status = Column(String)  # queued, running, succeeded or failed
+    holder = Column(String)  # Worker running the job
+    symbols = Column(Text)  # JSON list of the symbols to scrape
+    total = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    saved = Column(Integer)
+    error = Column(String)
+    results = Column(Text)  # JSON list of {symbol, pe_ratio, date} once finished
+    created_at = Column(DateTime, index=True)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)  # Renewed by the running worker; a stale one means it died
+
+
+class IntradaySample(Base):
+    """One intraday P/E sample; narrow append-only rows, packed into blocks after the close"""
+    __tablename__ = "intraday_samples"
+    
+    company_id = Column(Integer, primary_key=True)
+    sampled_at = Column(DateTime, primary_key=True)  # IST wall clock
+    pe_ratio = Column(Float)
+
+
+class IntradayBlock(Base):
+    """A company's intraday samples of one day, packed as little-endian arrays"""
+    __tablename__ = "intraday_blocks"
+    
+    company_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False)
+    seconds = Column(LargeBinary, nullable=False)  # uint32 seconds since midnight IST, ascending
+    values = Column(LargeBinary, nullable=False)  # float32 P/E ratios
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+
+
+# Single-column indexes made redundant by the composite ones (the primary key and a prefix of it)
+OBSOLETE_PE_DATA_INDEXES = ("ix_pe_data_id", "ix_pe_data_company_id")
+
+
+def _migrate_pe_data_indexes():
+    """
+    Bring pe_data indexes of databases created by older versions up to date.
+    Duplicate rows are removed before the (company_id, date) unique index is
+    added, keeping the earliest entry for each day.
+    """
+    existing = {index["name"] for index in inspect(engine).get_indexes(PEData.__tablename__)}
+    
+    if "uq_pe_data_company_date" not in existing:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "DELETE FROM pe_data WHERE id NOT IN "
+                "(SELECT MIN(id) FROM pe_data GROUP BY company_id, date)"
+            ))
+    for index in PEData.__table__.indexes:
+        if index.name not in existing:
+            index.create(bind=engine, checkfirst=True)
+    
+    with engine.begin() as conn:
+        for name in OBSOLETE_PE_DATA_INDEXES:
+            if name in existing:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+# Columns added to tables of databases created by older versions
+ADDED_COLUMNS = {
+    Company.__tablename__: ("industry", "isin"),
+}
+
+
+def _migrate_added_columns():
+    """Add columns that create_all does not add to existing tables"""
+    for table_name, columns in ADDED_COLUMNS.items():
+        existing = {column["name"] for column in inspect(engine).get_columns(table_name)}
+        table = Base.metadata.tables[table_name]
+        with engine.begin() as conn:
+            for name in columns:
+                if name not in existing:
+                    column_type = table.c[name].type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}"))
+
+
+# Indexes added to tables of databases created by older versions
+ADDED_INDEXES = {
+    PERollingStat.__tablename__: ("ix_pe_rolling_stats_window_date",),
+}
+
+
+def _migrate_added_indexes():
+    """Create indexes that create_all does not add to existing tables"""
+    for table_name, names in ADDED_INDEXES.items():
+        existing = {index["name"] for index in inspect(engine).get_indexes(table_name)}
+        for index in Base.metadata.tables[table_name].indexes:
+            if index.name in names and index.name not in existing:
+                index.create(bind=engine, checkfirst=True)
+
+
+def _ensure_data_version_row():
+    """Create the single data_versions row if it is missing"""
+    db = SessionLocal()
+    try:
+        if db.get(DataVersion, 1) is None:
+            db.add(DataVersion(id=1, version=0, updated_at=datetime.utcnow()))
+            db.commit()
+    except IntegrityError:
+        # Another worker created it first
+        db.rollback()
+    finally:
+        db.close()
+
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    _migrate_pe_data_indexes()
+    _migrate_added_columns()
+    _migrate_added_indexes()
+    _ensure_data_version_row()
 
 
 def get_db():
@@ -43,3 +490,29 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Get a read-only database session for endpoints that do not write"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    """
+    Get a read-only asyncio database session for async endpoints; a
+    ThreadedReadSession when no asyncio driver is available
+    """
+    sessions = get_async_read_sessionmaker()
+    if sessions is None:
+        db = ThreadedReadSession()
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+    async with sessions() as db:
+        yield db
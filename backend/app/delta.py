@@ -0,0 +1,105 @@
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import List, Optional
+import logging
+import os
+
+from .database import Company, PEData
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows written within this many seconds are sent again on the next poll, so
+# an ingest that commits after a poll started is not skipped by the cursor
+DELTA_SYNC_LAG_SECONDS = float(os.getenv("DELTA_SYNC_LAG_SECONDS", "30"))
+# Above this many changed rows the client is told to reload the full history
+DELTA_SYNC_MAX_ROWS = int(os.getenv("DELTA_SYNC_MAX_ROWS", "5000"))
+
+CURSOR_VERSION = "1"
+_EPOCH = datetime(1970, 1, 1)
+
+# Reasons for resync_required
+RESYNC_NO_CURSOR = "no_cursor"
+RESYNC_INVALID_CURSOR = "invalid_cursor"
+RESYNC_CURSOR_AHEAD = "cursor_ahead"
+RESYNC_TOO_MANY_CHANGES = "too_many_changes"
+
+
+def encode_cursor(timestamp: datetime) -> str:
+    """Opaque cursor for a pe_data.timestamp high-water mark"""
+    return f"{CURSOR_VERSION}.{(timestamp - _EPOCH) // timedelta(microseconds=1)}"
+
+
+def decode_cursor(cursor: str) -> Optional[datetime]:
+    """Timestamp of a cursor made by encode_cursor, or None if it is not one"""
+    version, _, micros = cursor.partition(".")
+    if version != CURSOR_VERSION or not micros.isdigit():
+        return None
+    try:
+        return _EPOCH + timedelta(microseconds=int(micros))
+    except OverflowError:
+        return None
+
+
+def changes_since(
+    db: Session,
+    cursor: Optional[str],
+    symbols: Optional[List[str]] = None,
+    now: Optional[datetime] = None
+) -> dict:
+    """
+    P/E rows inserted or updated after a cursor.
+
+    pe_data.timestamp is set on every insert and upsert, so rows with a
+    later timestamp than the cursor are exactly the ones the client has not
+    seen. The new cursor never moves past now - DELTA_SYNC_LAG_SECONDS:
+    an ingest chunk stamps its rows before it commits, and rows committed
+    late with an older stamp are still picked up by the next poll.
+
+    Args:
+        db: Database session
+        cursor: Cursor returned by the previous call, None on first sync
+        symbols: Only return rows of these symbols
+        now: Current time, in the local time ingest stamps rows with
+
+    Returns:
+        {"cursor", "resync_required", "reason", "changes": [{symbol, date, pe_ratio}]}
+        When resync_required is true, changes is empty and the client should
+        reload the full history, then poll with the returned cursor.
+    """
+    now = now or datetime.now()
+    horizon = now - timedelta(seconds=DELTA_SYNC_LAG_SECONDS)
+
+    def resync(reason: str) -> dict:
+        # Safe starting point for a client that is about to do a full load
+        return {"cursor": encode_cursor(horizon), "resync_required": True, "reason": reason, "changes": []}
+
+    if not cursor:
+        return resync(RESYNC_NO_CURSOR)
+    since = decode_cursor(cursor)
+    if since is None:
+        return resync(RESYNC_INVALID_CURSOR)
+    if since > now:
+        # Made by another database or a server with a skewed clock
+        return resync(RESYNC_CURSOR_AHEAD)
+
+    query = db.query(Company.symbol, PEData.date, PEData.pe_ratio, PEData.timestamp).join(
+        Company, Company.id == PEData.company_id
+    ).filter(PEData.timestamp > since)
+    if symbols:
+        query = query.filter(Company.symbol.in_(symbols))
+    rows = query.order_by(PEData.timestamp, PEData.company_id, PEData.date).limit(DELTA_SYNC_MAX_ROWS + 1).all()
+
+    if len(rows) > DELTA_SYNC_MAX_ROWS:
+        return resync(RESYNC_TOO_MANY_CHANGES)
+
+    latest = rows[-1].timestamp if rows else since
+    return {
+        "cursor": encode_cursor(max(since, min(latest, horizon))),
+        "resync_required": False,
+        "reason": None,
+        "changes": [
+            {"symbol": row.symbol, "date": row.date.isoformat(), "pe_ratio": row.pe_ratio}
+            for row in rows
+        ]
+    }
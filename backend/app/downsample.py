@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Values of the resolution= query parameter and their rollup period codes
+RESOLUTIONS = {"daily": None, "weekly": "W", "monthly": "M"}
+
+
+def rollup_period(resolution: Optional[str]) -> Optional[str]:
+    """Map a resolution= value to a rollup period code (None for daily data)"""
+    if resolution is None:
+        return None
+    resolution = resolution.lower()
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}, expected one of {', '.join(RESOLUTIONS)}")
+    return RESOLUTIONS[resolution]
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Picks `threshold` points that keep the visual shape of the series; the
+    first and last points with a value are always kept.
+
+    Args:
+        x: Increasing x values (e.g. date ordinals)
+        y: Values, NaN where missing; a missing point is only picked when its whole bucket is missing
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted indices of the points to keep
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        raise ValueError("LTTB needs a threshold of at least 3 points")
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    present = ~np.isnan(y)
+    # Bucket boundaries for the n - 2 inner points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+
+    filled = np.flatnonzero(present)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = filled[0] if len(filled) else 0
+    selected[-1] = filled[-1] if len(filled) else n - 1
+    # Previously selected point with a value, the first triangle vertex
+    a = selected[0]
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_start, next_end = end, (edges[i + 2] if i + 2 < len(edges) else n)
+        next_present = present[next_start:next_end]
+        if next_present.any():
+            avg_x = x[next_start:next_end][next_present].mean()
+            avg_y = y[next_start:next_end][next_present].mean()
+        else:
+            avg_x, avg_y = x[next_start:next_end].mean(), y[a]
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        if not np.isnan(area).all():
+            pick = start + int(np.nanargmax(area))
+        else:
+            # No triangle to compare (missing vertex): the bucket's first point with a value, if any
+            candidates = np.flatnonzero(present[start:end])
+            pick = start + (int(candidates[0]) if len(candidates) else 0)
+        selected[i + 1] = pick
+        if present[pick]:
+            a = pick
+    return selected
+
+
+def downsample_points(points: List[Dict], max_points: int, value_key: str = "pe_ratio") -> List[Dict]:
+    """LTTB-downsample a list of {"date": iso string, value_key: float} dicts"""
+    if len(points) <= max_points:
+        return points
+    x = np.array([np.datetime64(point["date"], "D").astype("int64") for point in points])
+    y = np.array([point[value_key] for point in points], dtype="float64")
+    return [points[i] for i in lttb_indices(x, y, max_points)]
+
+
+def downsample_matrix(matrix: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    """
+    Downsample a date x symbol matrix on its shared date axis.
+    Dates are picked by LTTB on the cross-sectional mean so every symbol keeps the same axis.
+    """
+    if len(matrix) <= max_points:
+        return matrix
+    x = np.array([np.datetime64(d, "D").astype("int64") for d in matrix.index])
+    values = matrix.to_numpy(dtype="float64")
+    counts = (~np.isnan(values)).sum(axis=1)
+    with np.errstate(all="ignore"):
+        # NaN on dates without any value, which lttb_indices skips where it can
+        y = np.where(counts > 0, np.nansum(values, axis=1) / counts, np.nan)
+    return matrix.iloc[lttb_indices(x, y, max_points)]
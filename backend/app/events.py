@@ -0,0 +1,215 @@
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
+
+from .database import ReadSessionLocal
+from .cache import get_data_version
+from .delta import changes_since
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the shared data version while anyone is subscribed
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "1.0"))
+# Events buffered per subscriber; a client that falls further behind is told to resync
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "16"))
+# Seconds between keepalive comments on an idle stream
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Milliseconds browsers wait before reconnecting a dropped stream
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "5000"))
+
+SSE_MEDIA_TYPE = "text/event-stream"
+KEEPALIVE = b": keepalive\n\n"
+
+
+def format_event(event: str, data: dict, event_id: Optional[str] = None) -> bytes:
+    """One SSE message; the id is a delta sync cursor the client resumes from"""
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def catch_up(cursor: Optional[str]) -> bytes:
+    """
+    First event of a new stream: the changes since the client's last event id
+    (a reconnect), a resync when they cannot be sent, or just a starting cursor.
+    """
+    db = ReadSessionLocal()
+    try:
+        delta = changes_since(db, cursor)
+    finally:
+        db.close()
+
+    if cursor is None:
+        return format_event("ready", {"cursor": delta["cursor"]}, delta["cursor"])
+    if delta["resync_required"]:
+        return format_event("resync", {"reason": delta["reason"]}, delta["cursor"])
+    return format_event("pe", {"changes": delta["changes"]}, delta["cursor"])
+
+
+class Broadcaster:
+    """
+    Fans P/E updates out to the Server-Sent Event streams of this worker.
+
+    Workers share no memory, so each one relays through the database: while
+    it has subscribers it checks the shared data version (bumped by every
+    ingest) and on a change reads the new rows with the delta sync query.
+    Each batch is serialized once and the same bytes are queued for every
+    subscriber. Queues are bounded; a subscriber whose queue is full loses
+    its backlog and gets a resync event instead.
+    """
+
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE, poll_interval: float = SSE_POLL_INTERVAL):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._version: Optional[int] = None
+        self._cursor: Optional[str] = None
+        self._last_sent: Dict[Tuple[str, str], float] = {}
+        self.events_published = 0
+        self.subscribers_dropped = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def start(self):
+        """Start the relay on the running event loop"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the relay and end every open stream"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for queue in list(self._subscribers):
+            self._replace_backlog(queue, None)
+
+    def notify(self):
+        """
+        Check for new data now instead of at the next poll.
+        Safe to call from any thread, e.g. the scheduler's after an ingest.
+        """
+        if self._loop is not None and self._wake is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @staticmethod
+    def _replace_backlog(queue: asyncio.Queue, message: Optional[bytes]):
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    def publish(self, message: bytes):
+        """Queue one encoded event for every subscriber"""
+        self.events_published += 1
+        overflow = format_event("resync", {"reason": "slow_client"}, self._cursor)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.subscribers_dropped += 1
+                self._replace_backlog(queue, overflow)
+
+    def _poll(self) -> List[bytes]:
+        """Events for data written since the last poll (runs in a worker thread)"""
+        db = ReadSessionLocal()
+        try:
+            version, _ = get_data_version(db)
+            if version == self._version and self._cursor is not None:
+                return []
+            self._version = version
+
+            delta = changes_since(db, self._cursor)
+            if self._cursor is None:
+                # Subscribers fetch the current data themselves, so start from
+                # here; rows inside the lag window count as already sent
+                self._cursor = delta["cursor"]
+                recent = changes_since(db, self._cursor)
+                self._last_sent = {(row["symbol"], row["date"]): row["pe_ratio"] for row in recent["changes"]}
+                return []
+        finally:
+            db.close()
+
+        self._cursor = delta["cursor"]
+        if delta["resync_required"]:
+            self._last_sent = {}
+            return [format_event("resync", {"reason": delta["reason"]}, self._cursor)]
+
+        # Rows still inside the delta sync lag window come back on every
+        # poll; only send the ones that are new or changed since the last one
+        sent = {(row["symbol"], row["date"]): row["pe_ratio"] for row in delta["changes"]}
+        changes = [
+            row for row in delta["changes"]
+            if self._last_sent.get((row["symbol"], row["date"])) != row["pe_ratio"]
+        ]
+        self._last_sent = sent
+        if not changes:
+            return []
+        return [format_event("pe", {"changes": changes}, self._cursor)]
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            if not self._subscribers:
+                # Nobody listening: no database polling, and start afresh later
+                self._cursor = None
+                continue
+            try:
+                for message in await self._loop.run_in_executor(None, self._poll):
+                    self.publish(message)
+            except Exception as e:
+                logger.error(f"Error relaying P/E updates: {str(e)}")
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        Body of one event stream. Subscribes before catching up, so nothing
+        written in between is lost (a point may arrive twice).
+        """
+        queue = self.subscribe()
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+            yield await asyncio.get_running_loop().run_in_executor(None, catch_up, last_event_id)
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    message = KEEPALIVE
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(queue)
+
+
+broadcaster = Broadcaster()
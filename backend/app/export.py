@@ -0,0 +1,152 @@
+from sqlalchemy import select
+from datetime import date
+from typing import Iterator, List, Optional
+import csv
+import io
+import json
+import logging
+import os
+
+from .database import read_engine, Company, PEData
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the cursor, and encoded into one response chunk, at a time
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_COLUMNS = ["symbol", "date", "pe_ratio"]
+
+
+def export_query(start_date: Optional[date] = None, end_date: Optional[date] = None, symbols: Optional[List[str]] = None):
+    """
+    (symbol, date, pe_ratio) rows ordered by company and date, which is the
+    order of the (company_id, date, pe_ratio) index, so rows stream without a sort.
+    """
+    query = select(Company.symbol, PEData.date, PEData.pe_ratio).join(Company, Company.id == PEData.company_id)
+    if start_date:
+        query = query.where(PEData.date >= start_date)
+    if end_date:
+        query = query.where(PEData.date <= end_date)
+    if symbols:
+        query = query.where(Company.symbol.in_(symbols))
+    return query.order_by(PEData.company_id, PEData.date)
+
+
+def iter_row_chunks(query, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """
+    Fetch rows in chunks from a server-side cursor (psycopg2 named cursor on
+    Postgres, the incremental SQLite cursor otherwise).
+    The connection is held only while the response is being streamed.
+    """
+    with read_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(query)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def encode_ndjson(chunks: Iterator[list]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps({"symbol": symbol, "date": day.isoformat(), "pe_ratio": pe_ratio}, separators=(",", ":")) + "\n"
+            for symbol, day, pe_ratio in rows
+        ).encode("utf-8")
+
+
+def encode_csv(chunks: Iterator[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    # Send the header straight away so the client sees the download start
+    yield buffer.getvalue().encode("utf-8")
+
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows((symbol, day.isoformat(), pe_ratio) for symbol, day, pe_ratio in rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the caller while still reporting the full offset"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def encode_parquet(chunks: Iterator[list]) -> Iterator[bytes]:
+    """One Parquet row group per chunk, streamed as it is written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("symbol", pa.string()), ("date", pa.date32()), ("pe_ratio", pa.float64())])
+    sink = _DrainableSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in chunks:
+            symbols, days, pe_ratios = zip(*rows)
+            writer.write_table(pa.table([list(symbols), list(days), list(pe_ratios)], schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def require_format(export_format: str):
+    """
+    Validate an export format before streaming starts.
+
+    Raises:
+        ValueError: Unknown format
+        ImportError: Parquet requested without pyarrow installed
+    """
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise ValueError(f"Unknown export format {export_format!r}, expected one of {', '.join(EXPORT_MEDIA_TYPES)}")
+    if export_format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ImportError("The parquet export needs pyarrow: pip install pyarrow")
+
+
+def stream_export(
+    export_format: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    symbols: Optional[List[str]] = None
+) -> Iterator[bytes]:
+    """
+    Encoded export body as a stream of chunks. Memory stays bounded by EXPORT_CHUNK_SIZE rows.
+
+    Args:
+        export_format: ndjson, csv or parquet (checked with require_format first)
+        start_date: Only rows on or after this date
+        end_date: Only rows on or before this date
+        symbols: Only these symbols
+    """
+    chunks = iter_row_chunks(export_query(start_date, end_date, symbols))
+    encoders = {"ndjson": encode_ndjson, "csv": encode_csv, "parquet": encode_parquet}
+    return encoders[export_format](chunks)
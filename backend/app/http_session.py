@@ -0,0 +1,136 @@
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Optional
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Status codes that mean our cookies are no longer accepted
+COOKIE_REJECTED_STATUSES = (401, 403)
+
+
+class SessionManager:
+    """
+    Shared requests.Session with pooled keep-alive connections.
+
+    When a warmup_url is given, cookies are fetched from it once and only
+    refreshed when they expire, when cookie_ttl has passed, or when the
+    server answers with 401/403. The manager is safe to share between
+    scraper threads.
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        warmup_url: Optional[str] = None,
+        cookie_ttl: float = 300.0,
+        pool_maxsize: int = 10,
+        throttle: Optional[Callable[[str, Optional[float]], None]] = None
+    ):
+        self.warmup_url = warmup_url
+        self.cookie_ttl = cookie_ttl
+        self.throttle = throttle
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapters = [adapter]
+
+        self._cookie_lock = threading.Lock()
+        self._cookies_valid_until: Optional[float] = None
+        self._counter_lock = threading.Lock()
+        self.cookie_refreshes = 0
+        self.retries = 0
+
+    def _cookies_valid(self) -> bool:
+        return self._cookies_valid_until is not None and time.time() < self._cookies_valid_until
+
+    def refresh_cookies(self, timeout: float = 10, deadline: Optional[float] = None, stale: Optional[float] = None):
+        """
+        Fetch fresh cookies from the warmup url.
+
+        Args:
+            timeout: Request timeout in seconds
+            deadline: Passed through to the throttle
+            stale: The expiry the caller saw; if another thread refreshed since, nothing is done
+        """
+        if not self.warmup_url:
+            return
+
+        with self._cookie_lock:
+            if stale is not None and self._cookies_valid_until != stale and self._cookies_valid():
+                return
+
+            if self.throttle:
+                self.throttle(self.warmup_url, deadline)
+            self.session.cookies.clear()
+            self.session.get(self.warmup_url, timeout=timeout)
+
+            valid_until = time.time() + self.cookie_ttl
+            for cookie in self.session.cookies:
+                if cookie.expires:
+                    valid_until = min(valid_until, cookie.expires)
+            self._cookies_valid_until = valid_until
+
+            with self._counter_lock:
+                self.cookie_refreshes += 1
+            logger.info(f"Refreshed cookies from {self.warmup_url}")
+
+    def request(self, method: str, url: str, timeout: float = 10, deadline: Optional[float] = None, **kwargs) -> requests.Response:
+        """
+        Send a request through the pooled session.
+        Cookies are warmed up first if needed and refreshed once on 401/403.
+        """
+        if self.warmup_url and not self._cookies_valid():
+            self.refresh_cookies(timeout=timeout, deadline=deadline, stale=self._cookies_valid_until)
+
+        if self.throttle:
+            self.throttle(url, deadline)
+        response = self.session.request(method, url, timeout=timeout, **kwargs)
+
+        if self.warmup_url and response.status_code in COOKIE_REJECTED_STATUSES:
+            logger.info(f"{url} returned {response.status_code}, refreshing cookies")
+            with self._counter_lock:
+                self.retries += 1
+            self.refresh_cookies(timeout=timeout, deadline=deadline, stale=self._cookies_valid_until)
+            if self.throttle:
+                self.throttle(url, deadline)
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Connection and cookie counters.
+        reused_connections is the number of requests that did not need a new connection.
+        """
+        requests_sent = 0
+        connections_opened = 0
+        for adapter in self._adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+
+        return {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "reused_connections": max(requests_sent - connections_opened, 0),
+            "cookie_refreshes": self.cookie_refreshes,
+            "retries": self.retries,
+        }
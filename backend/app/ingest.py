@@ -0,0 +1,175 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from datetime import date, datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+import logging
+from .database import Company, PEData
+from .cache import bump_data_version
+from .analytics import update_analytics
+from .snapshot import publish_snapshot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT ... ON CONFLICT statement and per transaction
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _dialect_insert(db: Session):
+    """Return the insert() construct supporting ON CONFLICT for the session's database"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise ValueError(f"Bulk upserts are not supported for the {dialect} dialect")
+    return insert
+
+
+def _chunked(rows: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def resolve_company_ids(db: Session, symbols: Iterable[str]) -> Dict[str, int]:
+    """
+    Map symbols to company ids with one SELECT, inserting missing companies in bulk.
+
+    Args:
+        db: Database session
+        symbols: Stock symbols to resolve
+
+    Returns:
+        Dict mapping each symbol to its company id
+    """
+    symbols = set(symbols)
+    if not symbols:
+        return {}
+
+    company_ids = dict(db.execute(
+        select(Company.symbol, Company.id).where(Company.symbol.in_(symbols))
+    ).all())
+
+    missing = symbols - company_ids.keys()
+    if missing:
+        insert = _dialect_insert(db)
+        db.connection().execute(
+            insert(Company).on_conflict_do_nothing(index_elements=[Company.symbol]),
+            [{"symbol": symbol, "name": symbol} for symbol in sorted(missing)]
+        )
+        company_ids.update(db.execute(
+            select(Company.symbol, Company.id).where(Company.symbol.in_(missing))
+        ).all())
+        logger.info(f"Added {len(missing)} new companies")
+
+    return company_ids
+
+
+def after_ingest(db: Session, touched: Dict[int, date]):
+    """
+    Refresh derived data and notify readers after P/E rows changed.
+
+    Args:
+        db: Database session
+        touched: Dict of company id -> earliest date written
+    """
+    try:
+        update_analytics(db, touched)
+    except Exception as e:
+        logger.error(f"Error updating analytics after ingest: {str(e)}")
+        db.rollback()
+
+    invalidate_readers(db)
+
+
+def invalidate_readers(db: Session):
+    """
+    Move every worker's readers on to the current data: bump the shared data
+    version, which invalidates the read caches, and publish a snapshot of that
+    version. Call after any change that cached responses depend on.
+    """
+    bump_data_version(db)
+
+    # Workers map the new snapshot once they see the bumped version
+    publish_snapshot(db)
+
+
+def bulk_upsert_pe_data(
+    db: Session,
+    rows: Iterable[Dict],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_conflict: str = "ignore",
+    refresh: bool = True
+) -> int:
+    """
+    Write P/E rows with one INSERT ... ON CONFLICT per chunk.
+    Rows are consumed lazily, so iterators of any size stream through in chunks,
+    and each chunk is committed on its own.
+
+    Args:
+        db: Database session
+        rows: Iterable of dicts with symbol, pe_ratio and date
+        chunk_size: Rows per statement and transaction
+        on_conflict: "ignore" keeps existing rows for a (company, date),
+                     "update" overwrites them with the new P/E ratio
+        refresh: Run after_ingest once all rows are written; callers that write
+                 many batches can disable it and call after_ingest themselves
+
+    Returns:
+        Number of rows written, as reported by the database driver
+    """
+    if on_conflict not in ("ignore", "update"):
+        raise ValueError(f"on_conflict must be 'ignore' or 'update', got {on_conflict!r}")
+
+    insert = _dialect_insert(db)
+    company_ids: Dict[str, int] = {}
+    touched: Dict[int, date] = {}
+    saved_count = 0
+
+    for chunk in _chunked(rows, chunk_size):
+        unknown = {row["symbol"] for row in chunk} - company_ids.keys()
+        if unknown:
+            company_ids.update(resolve_company_ids(db, unknown))
+
+        # Deduplicate within the chunk (last value wins), a single statement
+        # may not touch the same row twice on Postgres
+        now = datetime.now()
+        values = {}
+        for row in chunk:
+            company_id = company_ids[row["symbol"]]
+            values[(company_id, row["date"])] = {
+                "company_id": company_id,
+                "date": row["date"],
+                "pe_ratio": row["pe_ratio"],
+                "timestamp": now,
+            }
+
+        stmt = insert(PEData)
+        index_elements = [PEData.company_id, PEData.date]
+        if on_conflict == "update":
+            stmt = stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={"pe_ratio": stmt.excluded.pe_ratio, "timestamp": stmt.excluded.timestamp}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+        result = db.connection().execute(stmt, list(values.values()))
+        db.commit()
+        saved_count += max(result.rowcount, 0)
+
+        if result.rowcount:
+            for company_id, row_date in values:
+                if company_id not in touched or row_date < touched[company_id]:
+                    touched[company_id] = row_date
+
+    if refresh and touched:
+        after_ingest(db, touched)
+
+    return saved_count
@@ -0,0 +1,192 @@
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, Iterable, List, Tuple
+import logging
+import os
+
+import numpy as np
+
+from .database import Company, IntradayBlock, IntradaySample
+from .ingest import _dialect_insert, bulk_upsert_pe_data, resolve_company_ids
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# off by default: every sample is a full scrape of all symbols
+INTRADAY_SAMPLING = os.getenv("INTRADAY_SAMPLING", "off").lower() in ("1", "on", "true", "yes")
+INTRADAY_INTERVAL_MINUTES = int(os.getenv("INTRADAY_INTERVAL_MINUTES", "5"))
+# Days of packed intraday blocks kept; the daily close rolled up into pe_data is kept forever
+INTRADAY_RETENTION_DAYS = int(os.getenv("INTRADAY_RETENTION_DAYS", "30"))
+
+# NSE trading session (IST)
+MARKET_OPEN = dt_time(9, 15)
+MARKET_CLOSE = dt_time(15, 30)
+
+SECONDS_DTYPE = np.dtype("<u4")
+VALUES_DTYPE = np.dtype("<f4")
+
+
+def in_market_hours(moment: datetime) -> bool:
+    """True on weekdays from the open up to and including the close minute"""
+    return moment.weekday() < 5 and MARKET_OPEN <= moment.time().replace(second=0, microsecond=0) <= MARKET_CLOSE
+
+
+def pack_samples(seconds: np.ndarray, values: np.ndarray) -> Dict[str, object]:
+    """IntradayBlock column values for samples sorted by time"""
+    return {
+        "count": len(seconds),
+        "seconds": seconds.astype(SECONDS_DTYPE).tobytes(),
+        "values": values.astype(VALUES_DTYPE).tobytes(),
+        "open": float(values[0]),
+        "high": float(values.max()),
+        "low": float(values.min()),
+        "close": float(values[-1]),
+    }
+
+
+def unpack_block(block: IntradayBlock) -> List[Tuple[int, float]]:
+    """(seconds since midnight, P/E ratio) pairs of a packed block"""
+    seconds = np.frombuffer(block.seconds, dtype=SECONDS_DTYPE)
+    values = np.frombuffer(block.values, dtype=VALUES_DTYPE)
+    # str() of a float32 is its shortest repr, so 23.4 comes back as 23.4, not 23.399999618530273
+    return [(int(offset), float(str(value))) for offset, value in zip(seconds, values)]
+
+
+def record_samples(db: Session, pe_data_list: Iterable[Dict], sampled_at: datetime) -> int:
+    """
+    Append one intraday sample per symbol with a single multi-row INSERT.
+
+    Args:
+        db: Database session
+        pe_data_list: Scraped rows with symbol and pe_ratio
+        sampled_at: IST wall-clock time of the sample, shared by all rows
+
+    Returns:
+        Number of samples written
+    """
+    rows = [row for row in pe_data_list if row.get("pe_ratio") is not None]
+    if not rows:
+        return 0
+
+    company_ids = resolve_company_ids(db, {row["symbol"] for row in rows})
+    sampled_at = sampled_at.replace(microsecond=0)
+    insert = _dialect_insert(db)
+    result = db.connection().execute(
+        insert(IntradaySample).on_conflict_do_nothing(
+            index_elements=[IntradaySample.company_id, IntradaySample.sampled_at]
+        ),
+        [
+            {"company_id": company_ids[row["symbol"]], "sampled_at": sampled_at, "pe_ratio": row["pe_ratio"]}
+            for row in rows
+        ]
+    )
+    db.commit()
+    return max(result.rowcount, 0)
+
+
+def compact_intraday(db: Session, before: date) -> Dict[str, int]:
+    """
+    Pack the narrow samples of every day before `before` into one block per
+    company and day, delete them, and roll each day's last sample up into
+    pe_data as that day's close.
+    Days already in pe_data (from the daily scrape) keep their value; the
+    rollup only fills days the daily scrape missed.
+
+    Args:
+        db: Database session
+        before: First day left untouched, usually today while the market is open
+
+    Returns:
+        Dict with the number of blocks written, samples packed and closes added
+    """
+    cutoff = datetime.combine(before, dt_time.min)
+    samples = db.execute(
+        select(IntradaySample.company_id, IntradaySample.sampled_at, IntradaySample.pe_ratio)
+        .where(IntradaySample.sampled_at < cutoff)
+        .order_by(IntradaySample.company_id, IntradaySample.sampled_at)
+    ).all()
+    if not samples:
+        return {"blocks": 0, "samples": 0, "closes": 0}
+
+    days: Dict[Tuple[int, date], Dict[int, float]] = {}
+    for company_id, sampled_at, pe_ratio in samples:
+        seconds = sampled_at.hour * 3600 + sampled_at.minute * 60 + sampled_at.second
+        days.setdefault((company_id, sampled_at.date()), {})[seconds] = pe_ratio
+
+    existing = {
+        (block.company_id, block.date): block
+        for block in db.execute(
+            select(IntradayBlock).where(IntradayBlock.date.in_({day for _, day in days}))
+        ).scalars()
+    }
+
+    for key, points in days.items():
+        block = existing.get(key)
+        if block is not None:
+            # Samples written after an earlier compaction of the same day
+            for seconds, value in unpack_block(block):
+                points.setdefault(seconds, value)
+        offsets = np.array(sorted(points), dtype=np.int64)
+        values = np.array([points[offset] for offset in offsets], dtype=np.float64)
+        packed = pack_samples(offsets, values)
+        if block is None:
+            db.add(IntradayBlock(company_id=key[0], date=key[1], **packed))
+        else:
+            for name, value in packed.items():
+                setattr(block, name, value)
+
+    db.execute(delete(IntradaySample).where(IntradaySample.sampled_at < cutoff))
+    db.commit()
+
+    symbols = dict(db.execute(
+        select(Company.id, Company.symbol).where(Company.id.in_({company_id for company_id, _ in days}))
+    ).all())
+    closes = [
+        {"symbol": symbols[company_id], "date": day, "pe_ratio": points[max(points)]}
+        for (company_id, day), points in sorted(days.items(), key=lambda item: item[0][1])
+        if company_id in symbols
+    ]
+    added = bulk_upsert_pe_data(db, closes, on_conflict="ignore")
+
+    logger.info(f"Packed {len(samples)} intraday samples into {len(days)} blocks, added {added} daily closes")
+    return {"blocks": len(days), "samples": len(samples), "closes": added}
+
+
+def purge_intraday(db: Session, today: date, retention_days: int = INTRADAY_RETENTION_DAYS) -> int:
+    """Delete blocks older than the retention period. Returns the number of blocks deleted."""
+    cutoff = today - timedelta(days=retention_days)
+    result = db.execute(delete(IntradayBlock).where(IntradayBlock.date < cutoff))
+    db.commit()
+    if result.rowcount:
+        logger.info(f"Deleted {result.rowcount} intraday blocks from before {cutoff}")
+    return max(result.rowcount, 0)
+
+
+def get_intraday_series(db: Session, company_id: int, day: date) -> List[Dict]:
+    """
+    Intraday samples of a company on one day, from its packed block and any
+    samples not compacted yet.
+
+    Returns:
+        List of {time, pe_ratio} dicts ordered by time, times as HH:MM:SS IST
+    """
+    points: Dict[int, float] = {}
+    block = db.get(IntradayBlock, (company_id, day))
+    if block is not None:
+        points.update(unpack_block(block))
+
+    start = datetime.combine(day, dt_time.min)
+    for sampled_at, pe_ratio in db.execute(
+        select(IntradaySample.sampled_at, IntradaySample.pe_ratio).where(
+            IntradaySample.company_id == company_id,
+            IntradaySample.sampled_at >= start,
+            IntradaySample.sampled_at < start + timedelta(days=1)
+        )
+    ):
+        points[sampled_at.hour * 3600 + sampled_at.minute * 60 + sampled_at.second] = pe_ratio
+
+    return [
+        {"time": f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}", "pe_ratio": points[seconds]}
+        for seconds in sorted(points)
+    ]
@@ -0,0 +1,240 @@
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import uuid
+from .database import SessionLocal, ScrapeJob
+from .leader import WORKER_ID
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept around for the status endpoint
+MAX_FINISHED_JOBS = 20
+# Seconds between the leader's checks for queued jobs, and between progress writes of a running job
+SCRAPE_JOB_POLL_INTERVAL = float(os.getenv("SCRAPE_JOB_POLL_INTERVAL", "1.0"))
+# A running job whose worker has not written progress for this long is marked failed
+SCRAPE_JOB_STALE_SECONDS = float(os.getenv("SCRAPE_JOB_STALE_SECONDS", "60"))
+
+
+def job_to_dict(job: ScrapeJob, include_results: bool = True) -> Dict:
+    elapsed = None
+    if job.started_at is not None:
+        elapsed = round(((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds(), 2)
+    data = {
+        "job_id": job.id,
+        "trigger": job.trigger,
+        "status": job.status,
+        "created_at": job.created_at.isoformat(),
+        "elapsed_seconds": elapsed,
+        "progress": {"total": job.total, "done": job.done, "failed": job.failed},
+        "saved": job.saved,
+        "error": job.error,
+    }
+    if include_results and job.status in ("succeeded", "failed"):
+        data["results"] = json.loads(job.results) if job.results else []
+    return data
+
+
+class ScrapeJobManager:
+    """
+    Scrape jobs stored in the scrape_jobs table, so every worker sees the same
+    jobs and their progress.
+
+    Any worker can queue a job; the leader runs it. A job is claimed with an
+    INSERT that the unique active flag only lets through when no other job is
+    queued or running, so triggers that arrive meanwhile (from any worker,
+    including the scheduled scrape) get that job back instead of starting another.
+    """
+
+    def submit(self, symbols: List[str], trigger: str = "manual", holder: Optional[str] = None) -> Tuple[ScrapeJob, bool]:
+        """
+        Queue a scrape, or attach to the one in flight.
+
+        Args:
+            symbols: Symbols to scrape
+            trigger: scheduled or manual
+            holder: Worker that starts running the job right away (None queues it for the leader)
+
+        Returns:
+            Tuple of (job, whether a new job was created)
+        """
+        self.fail_stale()
+        now = datetime.utcnow()
+        job = ScrapeJob(
+            id=uuid.uuid4().hex,
+            active=True,
+            trigger=trigger,
+            status="running" if holder else "queued",
+            holder=holder,
+            symbols=json.dumps(symbols),
+            total=len(symbols),
+            done=0,
+            failed=0,
+            created_at=now,
+            started_at=now if holder else None,
+            heartbeat_at=now,
+        )
+        db = SessionLocal()
+        try:
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another job is queued or running
+                db.rollback()
+                active = db.execute(select(ScrapeJob).where(ScrapeJob.active.is_(True))).scalar_one_or_none()
+                if active is not None:
+                    db.expunge(active)
+                    return active, False
+                raise
+            self._prune(db)
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+
+        logger.info(f"Scrape job {job.id} ({trigger}) {'started' if holder else 'queued'}")
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ScrapeJob]:
+        db = SessionLocal()
+        try:
+            return db.get(ScrapeJob, job_id)
+        finally:
+            db.close()
+
+    def recent(self) -> List[ScrapeJob]:
+        db = SessionLocal()
+        try:
+            return list(db.execute(
+                select(ScrapeJob).order_by(ScrapeJob.created_at.desc()).limit(MAX_FINISHED_JOBS + 1)
+            ).scalars())
+        finally:
+            db.close()
+
+    def _prune(self, db):
+        finished = select(ScrapeJob.id).where(ScrapeJob.active.is_(None)).order_by(ScrapeJob.created_at.desc())
+        old = list(db.execute(finished.offset(MAX_FINISHED_JOBS)).scalars())
+        if old:
+            db.query(ScrapeJob).filter(ScrapeJob.id.in_(old)).delete(synchronize_session=False)
+            db.commit()
+
+    def fail_stale(self):
+        """Mark running jobs whose worker stopped writing progress as failed, freeing the slot"""
+        cutoff = datetime.utcnow() - timedelta(seconds=SCRAPE_JOB_STALE_SECONDS)
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(ScrapeJob)
+                .where(ScrapeJob.active.is_(True), ScrapeJob.status == "running", ScrapeJob.heartbeat_at < cutoff)
+                .values(
+                    active=None,
+                    status="failed",
+                    error="The worker running the scrape stopped responding",
+                    finished_at=datetime.utcnow()
+                )
+            )
+            db.commit()
+            if result.rowcount:
+                logger.warning(f"Marked {result.rowcount} stale scrape job(s) as failed")
+        except Exception as e:
+            logger.error(f"Error checking for stale scrape jobs: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def claim_queued(self, worker_id: str = WORKER_ID) -> Optional[ScrapeJob]:
+        """Take the queued job, if any, for this worker to run"""
+        db = SessionLocal()
+        try:
+            job = db.execute(
+                select(ScrapeJob).where(ScrapeJob.active.is_(True), ScrapeJob.status == "queued")
+            ).scalar_one_or_none()
+            if job is None:
+                return None
+            now = datetime.utcnow()
+            result = db.execute(
+                update(ScrapeJob)
+                .where(ScrapeJob.id == job.id, ScrapeJob.status == "queued")
+                .values(status="running", holder=worker_id, started_at=now, heartbeat_at=now)
+            )
+            db.commit()
+            if result.rowcount != 1:
+                return None
+            db.refresh(job)
+            db.expunge(job)
+            return job
+        finally:
+            db.close()
+
+    def _write(self, job_id: str, **values):
+        db = SessionLocal()
+        try:
+            db.execute(update(ScrapeJob).where(ScrapeJob.id == job_id).values(heartbeat_at=datetime.utcnow(), **values))
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error updating scrape job {job_id}: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def execute(
+        self,
+        job: ScrapeJob,
+        run: Callable[..., Tuple[List[Dict], Optional[int]]]
+    ):
+        """
+        Run a claimed job in the calling thread. Progress is written every
+        SCRAPE_JOB_POLL_INTERVAL seconds, which also shows the job is alive.
+
+        Args:
+            job: A job claimed by this worker
+            run: run_scrape, called with trigger, on_result and symbols
+        """
+        progress = {"done": 0, "failed": 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def on_result(symbol: str, pe_ratio: Optional[float]):
+            with lock:
+                progress["done"] += 1
+                if not pe_ratio:
+                    progress["failed"] += 1
+
+        def heartbeat():
+            while not stop.wait(SCRAPE_JOB_POLL_INTERVAL):
+                with lock:
+                    values = dict(progress)
+                self._write(job.id, **values)
+
+        writer = threading.Thread(target=heartbeat, name=f"scrape-job-{job.id[:8]}", daemon=True)
+        writer.start()
+        values = {}
+        try:
+            results, saved = run(job.trigger, on_result=on_result, symbols=json.loads(job.symbols))
+            values.update(
+                status="succeeded",
+                saved=saved or 0,
+                results=json.dumps([
+                    {"symbol": r["symbol"], "pe_ratio": r["pe_ratio"], "date": r["date"].isoformat()}
+                    for r in results
+                ])
+            )
+            logger.info(f"Scrape job {job.id} finished: {len(results)} companies scraped, {saved or 0} rows saved")
+        except Exception as e:
+            values.update(status="failed", error=str(e))
+            logger.error(f"Scrape job {job.id} failed: {str(e)}")
+        finally:
+            stop.set()
+            writer.join()
+            with lock:
+                values.update(progress)
+            self._write(job.id, active=None, finished_at=datetime.utcnow(), **values)
+
+
+scrape_jobs = ScrapeJobManager()
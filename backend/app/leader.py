@@ -0,0 +1,149 @@
+from sqlalchemy import case, or_, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Dict, Optional
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from .database import SessionLocal, SchedulerLease
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds a lease stays valid without renewal; a dead leader is replaced after at most this long
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "30"))
+LEADER_RENEW_INTERVAL = float(os.getenv("LEADER_RENEW_INTERVAL", "10"))
+
+# Identifies this process in the lease table
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElector:
+    """
+    Leader election through a lease row in the database.
+
+    Every worker calls try_acquire() periodically. The row is taken over with
+    a single conditional UPDATE, only when it is free, expired or already
+    ours, so at most one worker holds an unexpired lease at a time.
+    """
+
+    def __init__(self, name: str = "scheduler", ttl: float = LEADER_LEASE_TTL, worker_id: str = WORKER_ID):
+        self.name = name
+        self.ttl = ttl
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._leader_until = 0.0  # time.monotonic() until which our lease is known to be valid
+        self._was_leader = False
+
+    def _ensure_row(self, db):
+        if db.get(SchedulerLease, self.name) is None:
+            try:
+                db.add(SchedulerLease(name=self.name, expires_at=datetime.utcnow()))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+
+    def try_acquire(self) -> bool:
+        """Acquire or renew the lease. Returns True if this worker is the leader."""
+        with self._lock:
+            started = time.monotonic()
+            now = datetime.utcnow()
+            db = SessionLocal()
+            try:
+                self._ensure_row(db)
+                result = db.execute(
+                    update(SchedulerLease)
+                    .where(
+                        SchedulerLease.name == self.name,
+                        or_(
+                            SchedulerLease.holder == self.worker_id,
+                            SchedulerLease.holder.is_(None),
+                            SchedulerLease.expires_at < now
+                        )
+                    )
+                    .values(
+                        holder=self.worker_id,
+                        acquired_at=case(
+                            (SchedulerLease.holder == self.worker_id, SchedulerLease.acquired_at),
+                            else_=now
+                        ),
+                        expires_at=now + timedelta(seconds=self.ttl)
+                    )
+                )
+                db.commit()
+                acquired = result.rowcount == 1
+            except Exception as e:
+                logger.error(f"Leader lease renewal failed: {str(e)}")
+                db.rollback()
+                acquired = False
+            finally:
+                db.close()
+
+            if acquired:
+                self._leader_until = started + self.ttl
+            if acquired != self._was_leader:
+                logger.info(f"Worker {self.worker_id} {'became' if acquired else 'is no longer'} the scheduler leader")
+                self._was_leader = acquired
+            return acquired
+
+    def is_leader(self) -> bool:
+        """True while our last successful renewal is still within the lease ttl"""
+        return time.monotonic() < self._leader_until
+
+    def release(self):
+        """Give the lease up so another worker can take over right away"""
+        with self._lock:
+            if not self.is_leader():
+                return
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(SchedulerLease)
+                    .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.worker_id)
+                    .values(expires_at=datetime.utcnow())
+                )
+                db.commit()
+                logger.info(f"Worker {self.worker_id} released the scheduler lease")
+            except Exception as e:
+                logger.error(f"Releasing the leader lease failed: {str(e)}")
+                db.rollback()
+            finally:
+                db.close()
+                self._leader_until = 0.0
+                self._was_leader = False
+
+    def current(self) -> Dict[str, Optional[object]]:
+        """Who holds the lease right now, as seen from this worker"""
+        db = SessionLocal()
+        try:
+            lease = db.get(SchedulerLease, self.name)
+            now = datetime.utcnow()
+            active = lease is not None and lease.holder is not None and lease.expires_at > now
+            return {
+                "leader": lease.holder if active else None,
+                "acquired_at": lease.acquired_at.isoformat() if active and lease.acquired_at else None,
+                "expires_at": lease.expires_at.isoformat() if active else None,
+                "this_worker": self.worker_id,
+                "is_leader": self.is_leader(),
+            }
+        finally:
+            db.close()
+
+
+elector = LeaderElector()
+
+
+def leader_only(job):
+    """Wrap a scheduled job so it only runs on the leader worker"""
+    @wraps(job)
+    def wrapper(*args, **kwargs):
+        # Renew first, so a worker can take over a lease that expired just before the job fired
+        if not elector.try_acquire():
+            logger.info(f"Skipping {job.__name__}: worker {elector.worker_id} is not the scheduler leader")
+            return None
+        return job(*args, **kwargs)
+    return wrapper
@@ -1,15 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
-from typing import List, Optional
+from sqlalchemy import func, select
+from typing import Collection, List, Optional, Tuple
 from datetime import date, datetime, timedelta
-from .database import get_db, Company, PEData, init_db
-from .scraper import scrape_all_nifty50_pe
-from .scheduler import start_scheduler, stop_scheduler
+from .database import (
+    get_read_db, get_async_read_db, dispose_async_read_engine, SessionLocal,
+    Company, PEData, PERollup, UniverseMember, init_db
+)
+from .scheduler import start_scheduler, stop_scheduler, tracked_symbols, IST
+from .cache import cached_response, response_cache
+from .leader import elector, WORKER_ID
+from .metrics import PrometheusText, render_scrape_metrics, PROMETHEUS_MEDIA_TYPE
+from .profiling import TimingMiddleware, phase, request_histograms, REQUEST_PHASE_BUCKETS
+from .scraper import get_session_stats
+from .jobs import scrape_jobs, job_to_dict
+from .analytics import get_rolling_stats, get_index_aggregates, get_rollups, period_start, ROLLING_WINDOWS
+from .delta import changes_since
+from .screener import screen, SCREEN_DEFAULT_WINDOW, SORT_KEYS
+from .intraday import get_intraday_series
+from .events import broadcaster, SSE_MEDIA_TYPE
+from .snapshot import current_snapshot, ensure_snapshot
+from .universes import (
+    get_universe, member_filter, members_query, list_universes, ensure_default_universe, ALWAYS
+)
+from .export import require_format, stream_export, EXPORT_MEDIA_TYPES
+from .downsample import rollup_period, downsample_points, downsample_matrix
+from .serialization import (
+    negotiate_format, to_matrix, encode_columnar_json, encode_arrow, compress,
+    FORMAT_JSON, FORMAT_ARROW, ARROW_MEDIA_TYPE, COLUMNAR_JSON_MEDIA_TYPE
+)
 from pydantic import BaseModel
+from itertools import groupby
+from operator import itemgetter
 import logging
 import os
 from pathlib import Path
@@ -21,6 +48,9 @@ logger = logging.getLogger(__name__)
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 FRONTEND_BUILD_PATH = os.getenv("FRONTEND_BUILD_PATH", "../frontend/build")
 
+# Rows fetched per round trip by streaming reads; the event loop serves other requests in between
+FETCH_PARTITION_SIZE = 5000
+
 app = FastAPI(title="Nifty 50 P/E Tracker API")
 
 # CORS middleware - more permissive in production
@@ -36,6 +66,9 @@ if ENVIRONMENT == "production":
     ]
     cors_origins = default_origins + github_pages_patterns if "*" not in default_origins else default_origins
 
+# Server-Timing headers, per-route latency histograms and the opt-in profiler
+app.add_middleware(TimingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
@@ -49,6 +82,13 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    db = SessionLocal()
+    try:
+        ensure_default_universe(db)
+        ensure_snapshot(db)
+    finally:
+        db.close()
+    broadcaster.start()
     start_scheduler()
     logger.info("Application started and scheduler initialized")
 
@@ -56,6 +96,8 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     stop_scheduler()
+    await broadcaster.stop()
+    await dispose_async_read_engine()
     logger.info("Application shutdown and scheduler stopped")
 
 
@@ -65,6 +107,8 @@ class CompanyResponse(BaseModel):
     symbol: str
     name: Optional[str]
     sector: Optional[str]
+    industry: Optional[str]
+    isin: Optional[str]
 
     class Config:
         from_attributes = True
@@ -87,115 +131,612 @@ class CompanyPEDataResponse(BaseModel):
     data: List[dict]  # List of {date, pe_ratio}
 
 
+async def _universe_members(db: AsyncSession, universe: Optional[str], as_of: Optional[date]) -> Optional[List[int]]:
+    """Company ids of a universe on a date (today by default), None when no universe is asked for"""
+    if not universe:
+        return None
+    found = await db.run_sync(get_universe, universe)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Universe {universe!r} not found")
+    with phase("db"):
+        return list((await db.execute(members_query(found.id, as_of or date.today()))).scalars())
+
+
 @app.get("/api/companies", response_model=List[CompanyResponse])
-async def get_companies(db: Session = Depends(get_db)):
-    """Get all companies"""
-    companies = db.query(Company).all()
-    return companies
+async def get_companies(
+    request: Request,
+    universe: Optional[str] = Query(None, description="Only members of this universe, e.g. NIFTY100"),
+    as_of: Optional[date] = Query(None, description="Universe membership date, today by default"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get all companies, or the members of a universe"""
+    async def build():
+        company_ids = await _universe_members(db, universe, as_of)
+        query = select(Company)
+        if company_ids is not None:
+            query = query.where(Company.id.in_(company_ids))
+        with phase("db"):
+            companies = (await db.execute(query)).scalars().all()
+        with phase("serialize"):
+            return JSONResponse(content=[
+                CompanyResponse.model_validate(company).model_dump() for company in companies
+            ])
+    
+    return await cached_response(request, db, build)
+
+
+def _encoded_response(body: bytes, media_type: str, request: Request) -> Response:
+    """Wrap an encoded body, compressing it if the client accepts gzip/brotli"""
+    body, encoding = compress(body, request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def _parse_resolution(resolution: Optional[str]) -> Optional[str]:
+    try:
+        return rollup_period(resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _fetch_daily_rows(
+    db: AsyncSession,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    company_ids: Optional[Collection[int]] = None
+) -> Tuple[list, list]:
+    """
+    Companies ordered by symbol, and their (company_id, date, pe_ratio) rows
+    in (company_id, date) order straight off the covering index, so SQLite
+    neither touches the table nor sorts the whole result. With company_ids
+    (a universe's members) only their ranges of the index are read.
+    """
+    query = select(PEData.company_id, PEData.date, PEData.pe_ratio)
+    companies_query = select(Company.id, Company.symbol, Company.name)
+    if company_ids is not None:
+        query = query.where(PEData.company_id.in_(company_ids))
+        companies_query = companies_query.where(Company.id.in_(company_ids))
+    if start_date:
+        query = query.where(PEData.date >= start_date)
+    if end_date:
+        query = query.where(PEData.date <= end_date)
+    
+    with phase("db"):
+        companies = (await db.execute(companies_query.order_by(Company.symbol))).all()
+        rows = []
+        result = await db.stream(query.order_by(PEData.company_id, PEData.date))
+        async for partition in result.partitions(FETCH_PARTITION_SIZE):
+            rows.extend(partition)
+    return companies, rows
+
+
+def _group_daily_rows(companies: list, rows: list) -> List[tuple]:
+    """(symbol, name, date, pe_ratio) rows ordered by symbol and date"""
+    with phase("group"):
+        series = {}
+        for company_id, company_rows in groupby(rows, key=itemgetter(0)):
+            series[company_id] = [row[1:] for row in company_rows]
+        
+        return [
+            (symbol, name, date_val, pe_ratio)
+            for company_id, symbol, name in companies
+            for date_val, pe_ratio in series.get(company_id, ())
+        ]
 
 
 @app.get("/api/pe-data/all")
 async def get_all_pe_data(
+    request: Request,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    format: Optional[str] = Query(None, description="json (default), columnar or arrow"),
+    resolution: Optional[str] = Query(None, description="daily (default), weekly or monthly"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample each series to at most this many points (LTTB)"),
+    universe: Optional[str] = Query(None, description="Only members of this universe, e.g. NIFTY100"),
+    as_of: Optional[date] = Query(None, description="Universe membership date, end_date or today by default"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get P/E data for all companies"""
-    query = db.query(
-        Company.symbol,
-        Company.name,
-        PEData.date,
-        PEData.pe_ratio
-    ).join(
-        PEData, Company.id == PEData.company_id
-    )
+    """
+    Get P/E data for all companies.
+    format=columnar (or arrow) returns one shared date axis with a P/E array per symbol.
+    resolution=weekly/monthly returns precomputed rollups where pe_ratio is the
+    period's last value, alongside its first/min/max/mean.
+    universe=NAME limits the result to the universe's members as of as_of.
+    """
+    try:
+        response_format = negotiate_format(format, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    period = _parse_resolution(resolution)
     
-    if start_date:
-        query = query.filter(PEData.date >= start_date)
-    if end_date:
-        query = query.filter(PEData.date <= end_date)
-    
-    results = query.order_by(Company.symbol, PEData.date.asc()).all()
-    
-    # Group by company
-    companies_data = {}
-    for symbol, name, date_val, pe_ratio in results:
-        if symbol not in companies_data:
-            companies_data[symbol] = {
-                "symbol": symbol,
-                "name": name,
-                "data": []
-            }
-        companies_data[symbol]["data"].append({
-            "date": date_val.isoformat(),
-            "pe_ratio": pe_ratio
-        })
+    def render(fetched, snapshot=None, company_ids=None):
+        if snapshot is not None:
+            results = snapshot.daily_rows(start_date, end_date, company_ids)
+        else:
+            results = fetched if period else _group_daily_rows(*fetched)
+        
+        if response_format != FORMAT_JSON:
+            with phase("group"):
+                if snapshot is not None:
+                    matrix, names = snapshot.frame(start_date, end_date, company_ids)
+                else:
+                    matrix, names = to_matrix(row[:4] for row in results)
+                if max_points:
+                    matrix = downsample_matrix(matrix, max_points)
+            with phase("serialize"):
+                if response_format == FORMAT_ARROW:
+                    try:
+                        return _encoded_response(encode_arrow(matrix, names), ARROW_MEDIA_TYPE, request)
+                    except ImportError as e:
+                        raise HTTPException(status_code=406, detail=str(e))
+                return _encoded_response(encode_columnar_json(matrix, names), COLUMNAR_JSON_MEDIA_TYPE, request)
+        
+        # Group by company
+        with phase("group"):
+            companies_data = {}
+            for row in results:
+                symbol, name, date_val, pe_ratio = row[:4]
+                if symbol not in companies_data:
+                    companies_data[symbol] = {
+                        "symbol": symbol,
+                        "name": name,
+                        "data": []
+                    }
+                point = {
+                    "date": date_val.isoformat(),
+                    "pe_ratio": pe_ratio
+                }
+                if period:
+                    point.update(zip(("first", "min", "max", "mean"), row[4:]))
+                companies_data[symbol]["data"].append(point)
+            
+            if max_points:
+                for company in companies_data.values():
+                    company["data"] = downsample_points(company["data"], max_points)
+        
+        with phase("serialize"):
+            return JSONResponse(content=list(companies_data.values()))
+    
+    async def build():
+        company_ids = await _universe_members(db, universe, as_of or end_date)
+        if period:
+            query = select(
+                Company.symbol,
+                Company.name,
+                PERollup.period_start,
+                PERollup.last,
+                PERollup.first,
+                PERollup.min,
+                PERollup.max,
+                PERollup.mean
+            ).join(
+                PERollup, Company.id == PERollup.company_id
+            ).where(PERollup.period == period)
+            
+            if company_ids is not None:
+                query = query.where(PERollup.company_id.in_(company_ids))
+            if start_date:
+                query = query.where(PERollup.period_start >= period_start(start_date, period))
+            if end_date:
+                query = query.where(PERollup.period_start <= end_date)
+            
+            with phase("db"):
+                fetched = (await db.execute(query.order_by(Company.symbol, PERollup.period_start.asc()))).all()
+        else:
+            snapshot = await db.run_sync(current_snapshot)
+            if snapshot is not None:
+                # Daily history straight from the shared memory-mapped matrix
+                return await run_in_threadpool(render, None, snapshot, company_ids)
+            fetched = await _fetch_daily_rows(db, start_date, end_date, company_ids)
+        
+        # Grouping and encoding the full history is CPU-bound, so it runs on a
+        # worker thread and the event loop keeps serving small requests
+        return await run_in_threadpool(render, fetched)
+    
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/pe-data/changes")
+async def get_pe_data_changes(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="Cursor from the previous response; omit on first sync"),
+    symbols: Optional[str] = Query(None, description="Comma-separated symbols, all by default"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    P/E points inserted or updated since a cursor, for clients that poll.
+    Returns {cursor, resync_required, reason, changes}; when resync_required
+    is true the client reloads the full history and continues from cursor.
+    """
+    symbol_list = [symbol.strip().upper() for symbol in symbols.split(",") if symbol.strip()] if symbols else None
     
-    return list(companies_data.values())
+    async def build():
+        with phase("db"):
+            delta = await db.run_sync(changes_since, cursor, symbol_list)
+        with phase("serialize"):
+            return JSONResponse(content=delta)
+    
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/stream")
+async def stream_pe_updates(request: Request):
+    """
+    Server-Sent Events with P/E updates as ingests commit.
+    Events: ready {cursor} on connect, pe {changes: [{symbol, date, pe_ratio}]}
+    after an ingest, and resync {reason} when the client must reload the full
+    history. Event ids are delta sync cursors, so a reconnecting browser
+    (Last-Event-ID) is sent what it missed.
+    """
+    return StreamingResponse(
+        broadcaster.stream(request.headers.get("last-event-id")),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/api/pe-data/{company_id}")
 async def get_pe_data(
+    request: Request,
     company_id: int,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    resolution: Optional[str] = Query(None, description="daily (default), weekly or monthly"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample the series to at most this many points (LTTB)"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get P/E data for a specific company"""
-    query = db.query(PEData).filter(PEData.company_id == company_id)
+    period = _parse_resolution(resolution)
     
-    if start_date:
-        query = query.filter(PEData.date >= start_date)
-    if end_date:
-        query = query.filter(PEData.date <= end_date)
+    async def build():
+        snapshot = None if period else await db.run_sync(current_snapshot)
+        if period:
+            with phase("db"):
+                rows = await db.run_sync(get_rollups, period, company_id, start_date, end_date)
+            pe_data = [
+                {
+                    "company_id": row.company_id,
+                    "date": row.period_start.isoformat(),
+                    "pe_ratio": row.last,
+                    "first": row.first,
+                    "min": row.min,
+                    "max": row.max,
+                    "mean": row.mean,
+                    "count": row.count
+                }
+                for row in rows
+            ]
+        elif snapshot is not None:
+            with phase("db"):
+                pe_data = snapshot.company_rows(company_id, start_date, end_date)
+        else:
+            query = select(
+                PEData.id,
+                PEData.company_id,
+                PEData.date,
+                PEData.pe_ratio,
+                PEData.timestamp
+            ).where(PEData.company_id == company_id)
+            
+            if start_date:
+                query = query.where(PEData.date >= start_date)
+            if end_date:
+                query = query.where(PEData.date <= end_date)
+            
+            with phase("db"):
+                rows = (await db.execute(query.order_by(PEData.date.asc()))).all()
+            pe_data = [
+                {
+                    "id": row.id,
+                    "company_id": row.company_id,
+                    "date": row.date.isoformat(),
+                    "pe_ratio": row.pe_ratio,
+                    "timestamp": row.timestamp.isoformat() if row.timestamp else None
+                }
+                for row in rows
+            ]
+        
+        if max_points:
+            with phase("group"):
+                pe_data = downsample_points(pe_data, max_points)
+        with phase("serialize"):
+            return JSONResponse(content=pe_data)
     
-    pe_data = query.order_by(PEData.date.asc()).all()
-    return pe_data
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/intraday/{company_id}")
+async def get_intraday_pe_data(
+    company_id: int,
+    day: Optional[date] = Query(None, alias="date", description="Trading day, today (IST) by default"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Intraday P/E samples of a company on one day (needs INTRADAY_SAMPLING).
+    Not served from the response cache: samples arrive every few minutes
+    without bumping the data version.
+    """
+    day = day or datetime.now(IST).date()
+    with phase("db"):
+        samples = await db.run_sync(get_intraday_series, company_id, day)
+    with phase("serialize"):
+        return JSONResponse(content={"company_id": company_id, "date": day.isoformat(), "samples": samples})
 
 
-@app.post("/api/scrape-now")
-async def trigger_scrape_now(db: Session = Depends(get_db)):
-    """Manually trigger P/E scraping (for testing)"""
+@app.get("/api/export")
+def export_pe_data(
+    format: str = Query("ndjson", description="ndjson, csv or parquet"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    symbols: Optional[str] = Query(None, description="Comma-separated symbols, all by default"),
+):
+    """
+    Stream the P/E history as NDJSON, CSV or Parquet, ordered by company and date.
+    Rows go out in chunks as they are read, so memory does not grow with the history.
+    """
+    export_format = format.lower()
     try:
-        logger.info("Manual scrape triggered")
-        pe_data = scrape_all_nifty50_pe()
-        
-        if pe_data:
-            from .scheduler import save_pe_data_to_db
-            save_pe_data_to_db(pe_data)
-            return {
-                "success": True,
-                "message": f"Scraped P/E data for {len(pe_data)} companies",
-                "count": len(pe_data)
-            }
-        else:
-            return {
-                "success": False,
-                "message": "No data scraped"
-            }
-    except Exception as e:
-        logger.error(f"Manual scrape failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        require_format(export_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    
+    symbol_list = [symbol.strip().upper() for symbol in symbols.split(",") if symbol.strip()] if symbols else None
+    return StreamingResponse(
+        stream_export(export_format, start_date, end_date, symbol_list),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="nifty50_pe.{export_format}"'}
+    )
+
+
+@app.post("/api/scrape-now", status_code=202)
+async def trigger_scrape_now():
+    """
+    Manually trigger P/E scraping (for testing).
+    The scrape is queued for the scheduler leader; poll /api/scrape-jobs/{job_id}
+    (on any worker) for progress. If a scrape is already queued or running,
+    manual or scheduled, its job is returned instead of starting another.
+    """
+    symbols = await run_in_threadpool(tracked_symbols)
+    job, created = await run_in_threadpool(scrape_jobs.submit, symbols)
+    logger.info(f"Manual scrape triggered ({'new job' if created else 'attached to running job'} {job.id})")
+    return {
+        "success": True,
+        "message": "Scrape started" if created else "Scrape already in progress",
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/scrape-jobs/{job.id}"
+    }
+
+
+@app.get("/api/scrape-jobs")
+async def list_scrape_jobs():
+    """List recent scrape jobs, newest first"""
+    jobs = await run_in_threadpool(scrape_jobs.recent)
+    return [job_to_dict(job, include_results=False) for job in jobs]
+
+
+@app.get("/api/scrape-jobs/{job_id}")
+async def get_scrape_job(job_id: str):
+    """Get progress and, once finished, results of a scrape job"""
+    job = await run_in_threadpool(scrape_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scrape job not found")
+    return job_to_dict(job)
+
+
+@app.get("/api/universes")
+async def get_universes(
+    request: Request,
+    as_of: Optional[date] = Query(None, description="Date of the member counts, today by default"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """List indexes and watchlists with their member counts"""
+    async def build():
+        with phase("db"):
+            universes = await db.run_sync(list_universes, as_of)
+        return JSONResponse(content=universes)
+    
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/universes/{name}")
+async def get_universe_members(
+    request: Request,
+    name: str,
+    as_of: Optional[date] = Query(None, description="Membership date, today by default"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Members of a universe on a date, with the date each one joined"""
+    async def build():
+        found = await db.run_sync(get_universe, name)
+        if found is None:
+            raise HTTPException(status_code=404, detail=f"Universe {name!r} not found")
+        day = as_of or date.today()
+        with phase("db"):
+            rows = (await db.execute(
+                select(Company.id, Company.symbol, Company.name, Company.sector, Company.industry, UniverseMember.start_date)
+                .join(UniverseMember, UniverseMember.company_id == Company.id)
+                .where(*member_filter(found.id, day))
+                .order_by(Company.symbol)
+            )).all()
+        with phase("serialize"):
+            return JSONResponse(content={
+                "name": found.name,
+                "kind": found.kind,
+                "description": found.description,
+                "as_of": day.isoformat(),
+                "members": [
+                    {
+                        "company_id": row.id,
+                        "symbol": row.symbol,
+                        "name": row.name,
+                        "sector": row.sector,
+                        "industry": row.industry,
+                        # None for members since before tracking started
+                        "since": row.start_date.isoformat() if row.start_date > ALWAYS else None
+                    }
+                    for row in rows
+                ]
+            })
+    
+    return await cached_response(request, db, build)
 
 
 @app.get("/api/stats")
-async def get_stats(db: Session = Depends(get_db)):
+async def get_stats(request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """Get statistics about the data"""
-    total_companies = db.query(Company).count()
-    total_records = db.query(PEData).count()
+    async def build():
+        snapshot = await db.run_sync(current_snapshot)
+        if snapshot is not None:
+            with phase("db"):
+                stats = snapshot.stats()
+            return JSONResponse(content=stats)
+        
+        with phase("db"):
+            total_companies = await db.scalar(select(func.count()).select_from(Company))
+            total_records = await db.scalar(select(func.count()).select_from(PEData))
+            
+            # Get date range; separate queries, so each is a single index lookup
+            min_date = await db.scalar(select(func.min(PEData.date)))
+            max_date = await db.scalar(select(func.max(PEData.date)))
+        
+        return JSONResponse(content={
+            "total_companies": total_companies,
+            "total_records": total_records,
+            "date_range": {
+                "min": min_date.isoformat() if min_date else None,
+                "max": max_date.isoformat() if max_date else None
+            }
+        })
+    
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/analytics/rolling/{company_id}")
+async def get_analytics_rolling(
+    request: Request,
+    company_id: int,
+    window: int = Query(252, description="Rolling window in trading days"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get precomputed rolling P/E statistics (mean, std, quartiles, percentile rank, z-score) for a company"""
+    if window not in ROLLING_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"window must be one of {', '.join(str(w) for w in ROLLING_WINDOWS)}"
+        )
     
-    # Get date range
-    min_date = db.query(func.min(PEData.date)).scalar()
-    max_date = db.query(func.max(PEData.date)).scalar()
+    async def build():
+        with phase("db"):
+            stats = await db.run_sync(get_rolling_stats, company_id, window, start_date, end_date)
+        return JSONResponse(content=stats)
     
-    return {
-        "total_companies": total_companies,
-        "total_records": total_records,
-        "date_range": {
-            "min": min_date.isoformat() if min_date else None,
-            "max": max_date.isoformat() if max_date else None
-        }
-    }
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/analytics/index")
+async def get_analytics_index(
+    request: Request,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get precomputed index-level P/E aggregates (mean, median, harmonic) per date"""
+    async def build():
+        with phase("db"):
+            aggregates = await db.run_sync(get_index_aggregates, start_date, end_date)
+        return JSONResponse(content=aggregates)
+    
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/screen")
+async def get_screen(
+    request: Request,
+    as_of: Optional[date] = Query(None, alias="date", description="Screen date, the latest available by default"),
+    window: int = Query(SCREEN_DEFAULT_WINDOW, description="Lookback in trading days"),
+    sort: str = Query("deviation", description=f"One of {', '.join(SORT_KEYS)}"),
+    order: str = Query("asc", description="asc (lowest first) or desc"),
+    limit: int = Query(20, ge=1, le=1000, description="Top N results"),
+    sector: Optional[str] = Query(None, description="Only companies of this sector, or of this NSE industry where no sector is set"),
+    universe: Optional[str] = Query(None, description="Only members of this universe on the screen date"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Screen companies by their P/E against their own history on a date:
+    percentile within the window, deviation from the window median, z-score
+    and rank within their sector. E.g. the constituents furthest below their
+    5-year median: /api/screen?universe=NIFTY50&window=1260&sort=deviation
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    
+    async def build():
+        company_ids = await _universe_members(db, universe, as_of)
+        with phase("db"):
+            try:
+                result = await db.run_sync(
+                    screen, as_of, window, sort, order == "desc", limit, company_ids, sector
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        with phase("serialize"):
+            return JSONResponse(content=result)
+    
+    return await cached_response(request, db, build)
+
+
+@app.get("/api/scheduler/leader")
+async def get_scheduler_leader():
+    """Show which worker currently holds the scheduler leader lease"""
+    return elector.current()
+
+
+@app.get("/metrics")
+def get_metrics(db: Session = Depends(get_read_db)):
+    """
+    Prometheus metrics. Scrape metrics come from the database and are the same
+    on every worker; HTTP session and cache counters belong to the worker that
+    answered, labelled with its id.
+    """
+    out = PrometheusText()
+    render_scrape_metrics(db, out)
+    
+    worker = {"worker": WORKER_ID}
+    session_stats = get_session_stats()
+    for key, kind in (
+        ("requests", "counter"), ("reused_connections", "counter"),
+        ("cookie_refreshes", "counter"), ("retries", "counter")
+    ):
+        out.metric(
+            f"pe_http_session_{key}_total", kind, f"HTTP session {key.replace('_', ' ')} in this worker",
+            [({**worker, "session": name}, stats[key]) for name, stats in session_stats.items()]
+        )
+    cache_stats = response_cache.stats()
+    out.metric("pe_response_cache_requests_total", "counter", "Response cache lookups in this worker",
+               [({**worker, "result": "hit"}, cache_stats["hits"]), ({**worker, "result": "miss"}, cache_stats["misses"])])
+    out.metric("pe_response_cache_bytes", "gauge", "Bytes held by this worker's response cache",
+               [(worker, cache_stats["bytes"])])
+    out.histogram(
+        "pe_request_phase_seconds", "Request time per route and phase (db, group, serialize, total) in this worker",
+        REQUEST_PHASE_BUCKETS,
+        [({**worker, **labels}, counts, count, total) for labels, counts, count, total in request_histograms.snapshot()]
+    )
+    out.metric("pe_event_stream_subscribers", "gauge", "Open /api/stream connections on this worker",
+               [(worker, broadcaster.subscriber_count)])
+    out.metric("pe_event_stream_events_total", "counter", "Update events broadcast by this worker",
+               [(worker, broadcaster.events_published)])
+    out.metric("pe_event_stream_overflows_total", "counter", "Slow subscribers whose backlog was replaced by a resync event",
+               [(worker, broadcaster.subscribers_dropped)])
+    out.metric("pe_scheduler_leader", "gauge", "1 if this worker holds the scheduler leader lease",
+               [(worker, int(elector.is_leader()))])
+    return Response(content=out.render(), media_type=PROMETHEUS_MEDIA_TYPE)
 
 
 # Serve static files in production (must be after all API routes)
@@ -0,0 +1,238 @@
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from .database import SessionLocal, ScrapeRun, ScrapeSymbolResult
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds
+SYMBOL_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_WRITE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Response appends "; charset=utf-8" to text/* media types
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+
+class ScrapeRunRecorder:
+    """
+    Collects what happens during one scrape run and stores it in scrape_runs
+    and scrape_symbol_results when the run finishes.
+    record_symbol() is called from the scraper threads.
+    """
+
+    def __init__(self, trigger: str, market_close: Optional[datetime] = None):
+        """
+        Args:
+            trigger: scheduled or manual
+            market_close: Timezone-aware market close of the run's day, for seconds_after_close
+        """
+        self.trigger = trigger
+        self.market_close = market_close
+        self.mode: Optional[str] = None
+        self.started_at = datetime.utcnow()
+        self._started = time.monotonic()
+        self.symbols: List[Dict] = []
+        self.session_retries = 0
+        self.db_write_seconds: Optional[float] = None
+        self.rows_saved: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def record_symbol(self, symbol: str, source: Optional[str], success: bool, attempts: int, latency: float):
+        with self._lock:
+            self.symbols.append({
+                "symbol": symbol,
+                "source": source,
+                "success": success,
+                "attempts": attempts,
+                "latency_seconds": latency,
+            })
+
+    def record_db_write(self, seconds: float, rows: Optional[int]):
+        self.db_write_seconds = seconds
+        self.rows_saved = rows
+
+    def finish(self, status: str, error: Optional[str] = None) -> Optional[int]:
+        """
+        Store the run. Failures to store are logged, never raised.
+
+        Returns:
+            The scrape_runs id, or None if it could not be stored
+        """
+        finished_at = datetime.utcnow()
+        ok = sum(1 for result in self.symbols if result["success"])
+        retries = self.session_retries + sum(max(result["attempts"] - 1, 0) for result in self.symbols)
+        seconds_after_close = None
+        if self.market_close is not None:
+            seconds_after_close = (finished_at.replace(tzinfo=timezone.utc) - self.market_close).total_seconds()
+
+        run = ScrapeRun(
+            trigger=self.trigger,
+            status=status,
+            mode=self.mode,
+            started_at=self.started_at,
+            finished_at=finished_at,
+            duration_seconds=time.monotonic() - self._started,
+            symbols_total=len(self.symbols),
+            symbols_ok=ok,
+            symbols_failed=len(self.symbols) - ok,
+            retries=retries,
+            db_write_seconds=self.db_write_seconds,
+            rows_saved=self.rows_saved,
+            seconds_after_close=seconds_after_close,
+            error=error,
+        )
+
+        db = SessionLocal()
+        try:
+            db.add(run)
+            db.flush()
+            db.bulk_insert_mappings(ScrapeSymbolResult, [dict(result, run_id=run.id) for result in self.symbols])
+            db.commit()
+            logger.info(
+                f"Scrape run {run.id} ({self.trigger}, {self.mode}): {ok}/{len(self.symbols)} symbols "
+                f"in {run.duration_seconds:.1f}s, {retries} retries"
+            )
+            return run.id
+        except Exception as e:
+            logger.error(f"Error storing scrape run: {str(e)}")
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, value, labels: Optional[Dict[str, object]] = None) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        name = f"{name}{{{rendered}}}"
+    if value is None:
+        return f"{name} NaN"
+    return f"{name} {value!r}" if isinstance(value, float) else f"{name} {value}"
+
+
+class PrometheusText:
+    """Builds a response in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str, samples: Iterable[Tuple[Optional[Dict], object]]):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(_sample(name, value, labels))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...], series: Iterable[Tuple[Dict, List[int], int, float]]):
+        """
+        Args:
+            series: (labels, cumulative count per bucket, total count, sum) tuples
+        """
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, counts, count, total in series:
+            for bound, bucket_count in zip(buckets, counts):
+                self.lines.append(_sample(f"{name}_bucket", bucket_count, {**labels, "le": f"{bound:g}"}))
+            self.lines.append(_sample(f"{name}_bucket", count, {**labels, "le": "+Inf"}))
+            self.lines.append(_sample(f"{name}_count", count, labels))
+            self.lines.append(_sample(f"{name}_sum", float(total or 0.0), labels))
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _bucket_columns(column, buckets: Tuple[float, ...]) -> list:
+    return [func.sum(case((column <= bound, 1), else_=0)) for bound in buckets]
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.replace(tzinfo=timezone.utc).timestamp() if value else None
+
+
+def render_scrape_metrics(db: Session, out: PrometheusText):
+    """
+    Scrape metrics computed from scrape_runs and scrape_symbol_results, so
+    every worker reports the same values whichever one ran the scrape.
+    """
+    out.metric(
+        "pe_scrape_runs_total", "counter", "Scrape runs by trigger and status",
+        (
+            ({"trigger": trigger, "status": status}, count)
+            for trigger, status, count in db.execute(
+                select(ScrapeRun.trigger, ScrapeRun.status, func.count()).group_by(ScrapeRun.trigger, ScrapeRun.status)
+            )
+        )
+    )
+    out.metric(
+        "pe_scrape_symbols_total", "counter", "Symbols scraped by the source that answered (or was tried last) and result",
+        (
+            ({"source": source or "none", "result": "ok" if success else "failed"}, count)
+            for source, success, count in db.execute(
+                select(ScrapeSymbolResult.source, ScrapeSymbolResult.success, func.count())
+                .group_by(ScrapeSymbolResult.source, ScrapeSymbolResult.success)
+            )
+        )
+    )
+    out.metric(
+        "pe_scrape_retries_total", "counter", "Extra requests made: fallbacks to another source plus 401/403 retries",
+        [(None, db.execute(select(func.coalesce(func.sum(ScrapeRun.retries), 0))).scalar())]
+    )
+
+    latency = ScrapeSymbolResult.latency_seconds
+    out.histogram(
+        "pe_scrape_symbol_latency_seconds",
+        "Seconds from starting a symbol to its result; for the batch source, the duration of the batch request",
+        SYMBOL_LATENCY_BUCKETS,
+        (
+            ({"source": row[0] or "none"}, list(row[3:]), row[1], row[2])
+            for row in db.execute(
+                select(
+                    ScrapeSymbolResult.source, func.count(latency), func.sum(latency),
+                    *_bucket_columns(latency, SYMBOL_LATENCY_BUCKETS)
+                ).where(latency.isnot(None)).group_by(ScrapeSymbolResult.source)
+            )
+        )
+    )
+
+    write = ScrapeRun.db_write_seconds
+    row = db.execute(
+        select(func.count(write), func.sum(write), *_bucket_columns(write, DB_WRITE_BUCKETS)).where(write.isnot(None))
+    ).one()
+    out.histogram(
+        "pe_scrape_db_write_seconds", "Seconds spent saving a run's results, including the analytics refresh",
+        DB_WRITE_BUCKETS,
+        [({}, [count or 0 for count in row[2:]], row[0], row[1])]
+    )
+
+    last = db.execute(select(ScrapeRun).order_by(ScrapeRun.id.desc()).limit(1)).scalar()
+    if last is not None:
+        out.metric("pe_scrape_last_run_timestamp_seconds", "gauge", "When the last scrape run finished",
+                   [(None, _timestamp(last.finished_at))])
+        out.metric("pe_scrape_last_run_duration_seconds", "gauge", "Duration of the last scrape run",
+                   [(None, last.duration_seconds)])
+        out.metric("pe_scrape_last_run_symbols", "gauge", "Symbols in the last scrape run by result",
+                   [({"result": "ok"}, last.symbols_ok), ({"result": "failed"}, last.symbols_failed)])
+        out.metric("pe_scrape_last_run_success", "gauge", "1 if the last scrape run succeeded",
+                   [(None, int(last.status == "succeeded"))])
+
+    complete = db.execute(
+        select(ScrapeRun)
+        .where(ScrapeRun.status == "succeeded", ScrapeRun.symbols_failed == 0, ScrapeRun.symbols_total > 0)
+        .order_by(ScrapeRun.id.desc()).limit(1)
+    ).scalar()
+    if complete is not None:
+        out.metric("pe_scrape_last_complete_run_timestamp_seconds", "gauge",
+                   "When the last run with every symbol scraped finished", [(None, _timestamp(complete.finished_at))])
+        if complete.seconds_after_close is not None:
+            out.metric("pe_scrape_last_complete_run_seconds_after_close", "gauge",
+                       "Seconds after market close at which the last complete run finished",
+                       [(None, complete.seconds_after_close)])
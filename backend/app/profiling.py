@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import io
+import logging
+import os
+import re
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# off: never profile; header: profile requests sent with "X-Profile: 1";
+# all: profile every request and keep reports of those slower than PROFILE_SLOW_MS
+PROFILE_MODE = os.getenv("PROFILE_MODE", "off").lower()
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_HEADER = "x-profile"
+
+# Histogram buckets in seconds for request phases
+REQUEST_PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTimings:
+    """Seconds spent per phase (db, group, serialize, ...) while handling one request"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.cache: Optional[str] = None  # hit or miss, set by cached_response
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Timings of the request being handled, or None outside of a request"""
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Time a block as part of the current request's `name` phase.
+    Does nothing outside of a request, so shared code can use it freely.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+class PhaseHistograms:
+    """Per-route, per-phase latency histograms of this worker"""
+
+    def __init__(self, buckets: Tuple[float, ...] = REQUEST_PHASE_BUCKETS):
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, str], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, phase_name: str, seconds: float):
+        with self._lock:
+            series = self._series.get((route, phase_name))
+            if series is None:
+                series = self._series[(route, phase_name)] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += seconds
+
+    def snapshot(self) -> List[Tuple[Dict[str, str], List[int], int, float]]:
+        """(labels, cumulative bucket counts, count, sum) per route and phase"""
+        with self._lock:
+            return [
+                ({"route": route, "phase": phase_name}, list(counts), count, total)
+                for (route, phase_name), (counts, count, total) in sorted(self._series.items())
+            ]
+
+
+request_histograms = PhaseHistograms()
+
+
+class _Profiler:
+    """pyinstrument when it is installed, cProfile otherwise"""
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+            self._profiler = Profiler(async_mode="enabled")
+            self.kind = "pyinstrument"
+        except ImportError:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self.kind = "cprofile"
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def report(self) -> str:
+        if self.kind == "pyinstrument":
+            return self._profiler.output_text(unicode=True, color=False)
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(60)
+        return out.getvalue()
+
+
+# Python allows one active profiler per thread, and the handlers share the
+# event loop thread, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def _write_report(method: str, path: str, elapsed_ms: float, profiler: _Profiler) -> Optional[str]:
+    directory = Path(PROFILE_DIR)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{method}_{slug}_{elapsed_ms:.0f}ms.txt"
+        (directory / name).write_text(f"{method} {path} took {elapsed_ms:.1f} ms\n\n{profiler.report()}")
+        logger.info(f"Wrote {profiler.kind} report for {method} {path} ({elapsed_ms:.0f} ms) to {directory / name}")
+        return name
+    except OSError as e:
+        logger.error(f"Error writing profile report: {str(e)}")
+        return None
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware that times every request.
+
+    Handlers mark their phases with `with phase("db"):` and similar blocks.
+    The phases and the total time go out in a Server-Timing header and feed
+    the per-route histograms in /metrics. For streaming responses the
+    header total is the time to the first byte; the histograms get the full
+    duration. In profiling mode, slow or explicitly requested requests are
+    profiled, and a report is written to PROFILE_DIR.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def _route_name(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            router = scope.get("router") or getattr(scope.get("app"), "router", None)
+            for route in getattr(router, "routes", []):
+                if getattr(route, "endpoint", None) is endpoint:
+                    self._routes[endpoint] = route.path
+                    break
+            else:
+                self._routes[endpoint] = getattr(endpoint, "__name__", "unknown")
+        return self._routes[endpoint]
+
+    def _should_profile(self, scope) -> Tuple[bool, bool]:
+        """(profile this request, keep the report regardless of duration)"""
+        if PROFILE_MODE == "all":
+            return True, False
+        if PROFILE_MODE == "header":
+            for name, value in scope.get("headers", []):
+                if name.decode("latin-1") == PROFILE_HEADER and value.decode("latin-1").strip() not in ("", "0"):
+                    return True, True
+        return False, False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+
+        wanted, forced = self._should_profile(scope)
+        profiler = None
+        if wanted and _profile_lock.acquire(blocking=False):
+            profiler = _Profiler()
+            profiler.start()
+
+        def stop_profiler(elapsed_ms: float) -> Optional[str]:
+            nonlocal profiler
+            if profiler is None:
+                return None
+            current, profiler = profiler, None
+            try:
+                current.stop()
+                if forced or elapsed_ms >= PROFILE_SLOW_MS:
+                    return _write_report(scope["method"], scope["path"], elapsed_ms, current)
+                return None
+            finally:
+                _profile_lock.release()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                report = stop_profiler(elapsed * 1000)
+                entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.phases.items()]
+                if timings.cache:
+                    entries.append(f'cache;desc="{timings.cache}"')
+                entries.append(f"total;dur={elapsed * 1000:.1f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(entries).encode("latin-1")))
+                if report:
+                    headers.append((b"x-profile-report", report.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            stop_profiler(elapsed * 1000)
+            _current.reset(token)
+            route = self._route_name(scope)
+            for name, seconds in timings.phases.items():
+                request_histograms.observe(route, name, seconds)
+            request_histograms.observe(route, "total", elapsed)
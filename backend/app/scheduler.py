@@ -1,11 +1,23 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import pytz
 import logging
-from datetime import datetime
-from .scraper import scrape_all_nifty50_pe
-from .database import SessionLocal, Company, PEData
-from sqlalchemy import and_
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from .scraper import scrape_all_nifty50_pe, NIFTY_50_SYMBOLS
+from .database import SessionLocal
+from .universes import scrape_symbols_for
+from .ingest import bulk_upsert_pe_data
+from .leader import elector, leader_only, LEADER_RENEW_INTERVAL, WORKER_ID
+from .jobs import scrape_jobs, SCRAPE_JOB_POLL_INTERVAL
+from .metrics import ScrapeRunRecorder
+from .events import broadcaster
+from .intraday import (
+    record_samples, compact_intraday, purge_intraday, in_market_hours,
+    INTRADAY_SAMPLING, INTRADAY_INTERVAL_MINUTES
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,41 +27,28 @@ IST = pytz.timezone('Asia/Kolkata')
 
 scheduler = BackgroundScheduler(timezone=IST)
 
+# NSE market close, when the daily scrape runs
+MARKET_CLOSE_HOUR = 15
+MARKET_CLOSE_MINUTE = 30
 
-def save_pe_data_to_db(pe_data_list):
-    """Save scraped P/E data to database"""
+
+def save_pe_data_to_db(pe_data_list, recorder: Optional[ScrapeRunRecorder] = None):
+    """
+    Save scraped P/E data to database.
+    Accepts any iterable of rows, so large backfills stream through in chunks.
+    When a recorder is given, the write time and row count are recorded on it.
+    """
     db = SessionLocal()
+    started = time.monotonic()
     try:
-        saved_count = 0
-        for data in pe_data_list:
-            # Get or create company
-            company = db.query(Company).filter(Company.symbol == data['symbol']).first()
-            if not company:
-                company = Company(symbol=data['symbol'], name=data['symbol'])
-                db.add(company)
-                db.commit()
-                db.refresh(company)
-            
-            # Check if data for this date already exists
-            existing = db.query(PEData).filter(
-                and_(
-                    PEData.company_id == company.id,
-                    PEData.date == data['date']
-                )
-            ).first()
-            
-            if not existing:
-                pe_entry = PEData(
-                    company_id=company.id,
-                    date=data['date'],
-                    pe_ratio=data['pe_ratio'],
-                    timestamp=datetime.now()
-                )
-                db.add(pe_entry)
-                saved_count += 1
-        
-        db.commit()
+        saved_count = bulk_upsert_pe_data(db, pe_data_list)
         logger.info(f"Saved {saved_count} new P/E data entries to database")
+        if recorder is not None:
+            recorder.record_db_write(time.monotonic() - started, saved_count)
+        # Push the new points to this worker's event streams right away;
+        # the other workers see the data version change on their next poll
+        broadcaster.notify()
+        return saved_count
         
     except Exception as e:
         logger.error(f"Error saving P/E data to database: {str(e)}")
@@ -58,36 +57,192 @@ def save_pe_data_to_db(pe_data_list):
         db.close()
 
 
+def tracked_symbols() -> List[str]:
+    """Current members of the universes in SCRAPE_UNIVERSES"""
+    db = SessionLocal()
+    try:
+        return scrape_symbols_for(db)
+    except Exception as e:
+        logger.error(f"Error reading universe members, scraping the Nifty 50: {str(e)}")
+        return list(NIFTY_50_SYMBOLS)
+    finally:
+        db.close()
+
+
+def run_scrape(
+    trigger: str,
+    on_result: Optional[Callable[[str, Optional[float]], None]] = None,
+    symbols: Optional[List[str]] = None
+) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Scrape all symbols and save the results, recording the run in scrape_runs.
+    
+    Args:
+        trigger: scheduled or manual
+        on_result: Passed on to scrape_all_nifty50_pe
+        symbols: Symbols to scrape (default: tracked_symbols())
+    
+    Returns:
+        Tuple of (scraped rows, rows saved or None if nothing was saved)
+    """
+    symbols = symbols or tracked_symbols()
+    market_close = datetime.now(IST).replace(hour=MARKET_CLOSE_HOUR, minute=MARKET_CLOSE_MINUTE, second=0, microsecond=0)
+    recorder = ScrapeRunRecorder(trigger, market_close=market_close)
+    try:
+        pe_data = scrape_all_nifty50_pe(on_result=on_result, recorder=recorder, symbols=symbols)
+        saved = save_pe_data_to_db(pe_data, recorder=recorder) if pe_data else None
+    except Exception as e:
+        recorder.finish("failed", error=str(e))
+        raise
+    
+    if pe_data and trigger == "scheduled" and INTRADAY_SAMPLING:
+        # Stands in for the intraday tick at the close, which skips scraping
+        save_intraday_samples(pe_data, market_close.replace(tzinfo=None))
+    
+    if pe_data and saved is None:
+        recorder.finish("failed", error="Saving to the database failed")
+    else:
+        recorder.finish("succeeded" if pe_data else "failed", error=None if pe_data else "No P/E data scraped")
+    return pe_data, saved
+
+
 def scheduled_scrape_job():
-    """Job to run at market close (3:30 PM IST)"""
+    """
+    Job to run at market close (3:30 PM IST).
+    Runs as a scrape job, so it never overlaps a manual scrape: if one is in
+    flight, the close is scraped once it has finished.
+    """
     logger.info("Starting scheduled P/E scraping job...")
+    symbols = tracked_symbols()
+    job, created = scrape_jobs.submit(symbols, trigger="scheduled", holder=WORKER_ID)
+    while not created:
+        logger.info(f"Scrape job {job.id} in progress, scheduled scrape waits for it")
+        time.sleep(SCRAPE_JOB_POLL_INTERVAL)
+        job, created = scrape_jobs.submit(symbols, trigger="scheduled", holder=WORKER_ID)
+    
+    scrape_jobs.execute(job, run_scrape)
+    job = scrape_jobs.get(job.id)
+    if job is None or job.status != "succeeded":
+        logger.error(f"Scheduled scraping job failed: {job.error if job else 'job record missing'}")
+    elif job.done > job.failed:
+        logger.info("Scheduled scraping job completed successfully")
+    else:
+        logger.warning("No P/E data scraped in scheduled job")
+
+
+def scrape_job_runner():
+    """Job running queued manual scrapes; only the leader runs them"""
+    if not elector.is_leader():
+        return
+    scrape_jobs.fail_stale()
+    job = scrape_jobs.claim_queued()
+    if job is not None:
+        scrape_jobs.execute(job, run_scrape)
+
+
+def save_intraday_samples(pe_data: List[Dict], sampled_at: datetime):
+    """Record scraped rows as the intraday samples taken at `sampled_at` (IST wall clock)"""
+    db = SessionLocal()
     try:
-        pe_data = scrape_all_nifty50_pe()
-        if pe_data:
-            save_pe_data_to_db(pe_data)
-            logger.info("Scheduled scraping job completed successfully")
-        else:
-            logger.warning("No P/E data scraped in scheduled job")
+        saved = record_samples(db, pe_data, sampled_at)
+        logger.info(f"Recorded {saved} intraday P/E samples at {sampled_at:%H:%M}")
     except Exception as e:
-        logger.error(f"Scheduled scraping job failed: {str(e)}")
+        logger.error(f"Recording intraday samples failed: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def intraday_sample_job():
+    """Job sampling every symbol's P/E during market hours"""
+    sampled_at = datetime.now(IST).replace(tzinfo=None)
+    if not in_market_hours(sampled_at):
+        return
+    if (sampled_at.hour, sampled_at.minute) == (MARKET_CLOSE_HOUR, MARKET_CLOSE_MINUTE):
+        # The daily scrape runs now and records its results as this sample
+        return
+    
+    save_intraday_samples(scrape_all_nifty50_pe(symbols=tracked_symbols()), sampled_at)
+
+
+def intraday_compaction_job():
+    """
+    Job packing the day's intraday samples after the close, rolling them up
+    into daily closes and dropping blocks past the retention period
+    """
+    today = datetime.now(IST).date()
+    db = SessionLocal()
+    try:
+        compact_intraday(db, today + timedelta(days=1))
+        purge_intraday(db, today)
+    except Exception as e:
+        logger.error(f"Intraday compaction job failed: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
 
 
 def start_scheduler():
-    """Start the scheduler to run scraping at market close"""
+    """
+    Start the scheduler to run scraping at market close.
+    Every worker runs the scheduler, but jobs only execute on the worker
+    holding the leader lease; the others just serve reads.
+    """
+    # Keep the leader lease renewed (and pick it up if the leader died)
+    scheduler.add_job(
+        elector.try_acquire,
+        trigger=IntervalTrigger(seconds=LEADER_RENEW_INTERVAL),
+        id='leader_lease',
+        name='Scheduler leader lease renewal',
+        next_run_time=datetime.now(IST),
+        replace_existing=True
+    )
+    
+    # Manual scrapes are queued by any worker and run here, on the leader
+    scheduler.add_job(
+        scrape_job_runner,
+        trigger=IntervalTrigger(seconds=SCRAPE_JOB_POLL_INTERVAL),
+        id='scrape_job_runner',
+        name='Queued scrape job runner',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
     # Schedule job to run at 3:30 PM IST every weekday (Monday-Friday)
     scheduler.add_job(
-        scheduled_scrape_job,
-        trigger=CronTrigger(hour=15, minute=30, day_of_week='mon-fri', timezone=IST),
+        leader_only(scheduled_scrape_job),
+        trigger=CronTrigger(hour=MARKET_CLOSE_HOUR, minute=MARKET_CLOSE_MINUTE, day_of_week='mon-fri', timezone=IST),
         id='daily_pe_scrape',
-        name='Daily Nifty 50 P/E Scraping at Market Close',
+        name='Daily P/E Scraping at Market Close',
         replace_existing=True
     )
     
+    if INTRADAY_SAMPLING:
+        # Fires through the trading hours; the job skips the ticks outside 9:15-15:30
+        scheduler.add_job(
+            leader_only(intraday_sample_job),
+            trigger=CronTrigger(hour='9-15', minute=f'*/{INTRADAY_INTERVAL_MINUTES}', day_of_week='mon-fri', timezone=IST),
+            id='intraday_pe_sample',
+            name=f'Intraday P/E sampling every {INTRADAY_INTERVAL_MINUTES} minutes',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+        scheduler.add_job(
+            leader_only(intraday_compaction_job),
+            trigger=CronTrigger(hour=MARKET_CLOSE_HOUR, minute=MARKET_CLOSE_MINUTE + 15, day_of_week='mon-fri', timezone=IST),
+            id='intraday_compaction',
+            name='Intraday sample compaction after market close',
+            replace_existing=True
+        )
+    
     scheduler.start()
     logger.info("Scheduler started. Will run daily at 3:30 PM IST (market close)")
 
 
 def stop_scheduler():
-    """Stop the scheduler"""
+    """Stop the scheduler and hand the leader lease over"""
     scheduler.shutdown()
+    elector.release()
     logger.info("Scheduler stopped")
@@ -3,9 +3,13 @@ from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime, date
 import time
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 import logging
 import os
+import threading
+from .http_session import SessionManager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,7 +17,37 @@ logger = logging.getLogger(__name__)
 # NSE Service URL (can be overridden via environment variable)
 NSE_SERVICE_URL = os.getenv("NSE_SERVICE_URL", "http://localhost:3001")
 
-# Nifty 50 companies list
+# Concurrency settings for the per-symbol fallback path
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "8"))
+SCRAPE_SYMBOL_DEADLINE = float(os.getenv("SCRAPE_SYMBOL_DEADLINE", "30"))
+
+# Large universes are scraped in shards running in parallel, each with its
+# own batch request and retries of the symbols that failed
+SCRAPE_SHARD_SIZE = int(os.getenv("SCRAPE_SHARD_SIZE", "50"))
+SCRAPE_SHARD_CONCURRENCY = int(os.getenv("SCRAPE_SHARD_CONCURRENCY", "4"))
+SCRAPE_SHARD_RETRIES = int(os.getenv("SCRAPE_SHARD_RETRIES", "2"))
+SCRAPE_SHARD_RETRY_DELAY = float(os.getenv("SCRAPE_SHARD_RETRY_DELAY", "5"))
+
+# Minimum seconds between two requests to the same host. NSE is rate limited,
+# the local NSE service is not.
+# Base URL of the NSE website used by the direct fallback (overridable for local stubs)
+NSE_BASE_URL = os.getenv("NSE_BASE_URL", "https://www.nseindia.com").rstrip("/")
+NSE_HOST = urlparse(NSE_BASE_URL).netloc
+HOST_MIN_INTERVALS = {
+    NSE_HOST: float(os.getenv("NSE_MIN_INTERVAL", "1.0")),
+}
+DEFAULT_HOST_MIN_INTERVAL = float(os.getenv("HOST_MIN_INTERVAL", "0"))
+
+# Seconds NSE cookies are reused before they are fetched again
+NSE_COOKIE_TTL = float(os.getenv("NSE_COOKIE_TTL", "300"))
+
+NSE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "application/json",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# Nifty 50 companies list; seeds the NIFTY50 universe on first start
 NIFTY_50_SYMBOLS = [
     "RELIANCE", "TCS", "HDFCBANK", "INFY", "HINDUNILVR", "ICICIBANK", "BHARTIARTL",
     "SBIN", "BAJFINANCE", "LICI", "ITC", "SUNPHARMA", "AXISBANK", "KOTAKBANK",
@@ -26,7 +60,90 @@ NIFTY_50_SYMBOLS = [
 ]
 
 
-def scrape_pe_ratio(symbol: str, use_nse_service: bool = True) -> Optional[float]:
+class DeadlineExceeded(Exception):
+    """Raised when a symbol runs out of time before its next request"""
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to the same host by a minimum interval.
+    Slots are handed out under a lock and waited for outside of it, so
+    requests to different hosts never block each other.
+    """
+
+    def __init__(self, intervals: Optional[Dict[str, float]] = None, default_interval: float = 0.0):
+        self.intervals = dict(intervals or {})
+        self.default_interval = default_interval
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str, deadline: Optional[float] = None):
+        """Block until a request to the url's host is allowed"""
+        host = urlparse(url).netloc
+        interval = self.intervals.get(host, self.default_interval)
+        if interval <= 0:
+            return
+        
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            if deadline is not None and slot >= deadline:
+                raise DeadlineExceeded(f"No request slot for {host} before deadline")
+            self._next_slot[host] = slot + interval
+        
+        if slot > now:
+            time.sleep(slot - now)
+
+
+rate_limiter = HostRateLimiter(HOST_MIN_INTERVALS, DEFAULT_HOST_MIN_INTERVAL)
+
+# Shared sessions so connections and cookies are reused across symbols and runs;
+# sized for every shard making individual requests at once
+service_session = SessionManager(pool_maxsize=SCRAPE_CONCURRENCY * SCRAPE_SHARD_CONCURRENCY, throttle=rate_limiter.wait)
+nse_session = SessionManager(
+    headers=NSE_HEADERS,
+    warmup_url=f"{NSE_BASE_URL}/",
+    cookie_ttl=NSE_COOKIE_TTL,
+    pool_maxsize=SCRAPE_CONCURRENCY * SCRAPE_SHARD_CONCURRENCY,
+    throttle=rate_limiter.wait
+)
+
+
+def get_session_stats() -> Dict[str, Dict[str, int]]:
+    """Connection reuse and cookie refresh counters for the shared sessions"""
+    return {
+        "nse_service": service_session.stats(),
+        "nse_direct": nse_session.stats(),
+    }
+
+
+def _session_retries() -> int:
+    return service_session.retries + nse_session.retries
+
+
+def _trace_attempt(trace: Optional[Dict], source: str):
+    """Note in a scrape_pe_ratio trace that a request to `source` is being made"""
+    if trace is not None:
+        trace["source"] = source
+        trace["attempts"] = trace.get("attempts", 0) + 1
+
+
+def _request_timeout(default: float, deadline: Optional[float]) -> float:
+    """Clamp a request timeout to the time left before the deadline"""
+    if deadline is None:
+        return default
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline reached")
+    return min(default, remaining)
+
+
+def scrape_pe_ratio(
+    symbol: str,
+    use_nse_service: bool = True,
+    deadline: Optional[float] = None,
+    trace: Optional[Dict] = None
+) -> Optional[float]:
     """
     Scrape P/E ratio for a given stock symbol.
     First tries the NSE service (stock-nse-india), then falls back to direct NSE API.
@@ -34,6 +151,9 @@ def scrape_pe_ratio(symbol: str, use_nse_service: bool = True) -> Optional[float
     Args:
         symbol: Stock symbol (e.g., "RELIANCE")
         use_nse_service: Whether to use the NSE service first (default: True)
+        deadline: time.monotonic() value after which no more requests are made
+        trace: Optional dict filled in with "source" (the source tried last,
+            "service" or "nse_direct") and "attempts" (requests made)
     
     Returns:
         P/E ratio as float, or None if not found
@@ -42,7 +162,8 @@ def scrape_pe_ratio(symbol: str, use_nse_service: bool = True) -> Optional[float
     if use_nse_service:
         try:
             url = f"{NSE_SERVICE_URL}/api/pe/{symbol}"
-            response = requests.get(url, timeout=15)
+            _trace_attempt(trace, "service")
+            response = service_session.get(url, timeout=_request_timeout(15, deadline), deadline=deadline)
             
             if response.status_code == 200:
                 data = response.json()
@@ -55,6 +176,9 @@ def scrape_pe_ratio(symbol: str, use_nse_service: bool = True) -> Optional[float
                     logger.warning(f"NSE service returned no P/E for {symbol}: {data.get('message', 'Unknown error')}")
             else:
                 logger.warning(f"NSE service returned status {response.status_code} for {symbol}")
+        except DeadlineExceeded:
+            logger.warning(f"Deadline exceeded for {symbol} while calling NSE service")
+            return None
         except requests.exceptions.RequestException as e:
             logger.warning(f"NSE service unavailable for {symbol}, trying direct API: {str(e)}")
         except Exception as e:
@@ -63,24 +187,13 @@ def scrape_pe_ratio(symbol: str, use_nse_service: bool = True) -> Optional[float
     # Fallback to direct NSE API
     try:
         # NSE URL for stock quote
-        url = f"https://www.nseindia.com/api/quote-equity?symbol={symbol}"
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "application/json",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Referer": f"https://www.nseindia.com/get-quotes/equity?symbol={symbol}"
-        }
-        
-        session = requests.Session()
-        session.headers.update(headers)
-        
-        # First request to get cookies
-        session.get("https://www.nseindia.com/", timeout=10)
-        time.sleep(1)  # Be respectful with requests
+        url = f"{NSE_BASE_URL}/api/quote-equity?symbol={symbol}"
+        headers = {"Referer": f"{NSE_BASE_URL}/get-quotes/equity?symbol={symbol}"}
         
-        # Get quote data
-        response = session.get(url, timeout=10)
+        # Get quote data. The shared session fetches cookies only when they
+        # are missing or expired, and the rate limiter keeps us respectful towards NSE.
+        _trace_attempt(trace, "nse_direct")
+        response = nse_session.get(url, headers=headers, timeout=_request_timeout(10, deadline), deadline=deadline)
         
         if response.status_code == 200:
             data = response.json()
@@ -101,8 +214,9 @@ def scrape_pe_ratio(symbol: str, use_nse_service: bool = True) -> Optional[float
         logger.warning(f"Could not find P/E ratio for {symbol} from direct API")
         
         # Fallback: Try scraping from HTML page
-        html_url = f"https://www.nseindia.com/get-quotes/equity?symbol={symbol}"
-        html_response = session.get(html_url, timeout=10)
+        html_url = f"{NSE_BASE_URL}/get-quotes/equity?symbol={symbol}"
+        _trace_attempt(trace, "nse_direct")
+        html_response = nse_session.get(html_url, headers=headers, timeout=_request_timeout(10, deadline), deadline=deadline)
         
         if html_response.status_code == 200:
             soup = BeautifulSoup(html_response.content, 'html.parser')
@@ -112,68 +226,253 @@ def scrape_pe_ratio(symbol: str, use_nse_service: bool = True) -> Optional[float
             
         return None
         
+    except DeadlineExceeded:
+        logger.warning(f"Deadline exceeded for {symbol} on direct NSE API")
+        return None
     except Exception as e:
         logger.error(f"Error scraping P/E for {symbol}: {str(e)}")
         return None
 
 
-def scrape_all_nifty50_pe(use_batch: bool = True) -> List[Dict]:
+def _scrape_with_deadline(symbol: str, symbol_deadline: float, recorder=None) -> Optional[float]:
+    """Run scrape_pe_ratio with a deadline that starts when the worker picks the symbol up"""
+    started = time.monotonic()
+    trace: Dict = {}
+    pe_ratio = None
+    try:
+        pe_ratio = scrape_pe_ratio(symbol, use_nse_service=True, deadline=started + symbol_deadline, trace=trace)
+        return pe_ratio
+    finally:
+        if recorder is not None:
+            recorder.record_symbol(
+                symbol, trace.get("source"), bool(pe_ratio), trace.get("attempts", 0), time.monotonic() - started
+            )
+
+
+def scrape_symbols(
+    symbols: List[str],
+    concurrency: Optional[int] = None,
+    symbol_deadline: Optional[float] = None,
+    on_result: Optional[Callable[[str, Optional[float]], None]] = None,
+    recorder=None
+) -> Dict[str, Optional[float]]:
     """
-    Scrape P/E ratios for all Nifty 50 companies.
-    Uses batch API if NSE service is available, otherwise falls back to individual requests.
+    Scrape P/E ratios for several symbols concurrently.
+    
+    Args:
+        symbols: Stock symbols to scrape
+        concurrency: Maximum number of symbols in flight (default: SCRAPE_CONCURRENCY)
+        symbol_deadline: Seconds each symbol may take (default: SCRAPE_SYMBOL_DEADLINE)
+        on_result: Optional callback invoked with (symbol, pe_ratio) as each symbol finishes
+        recorder: Optional metrics.ScrapeRunRecorder receiving each symbol's source, attempts and latency
+    
+    Returns:
+        Dict mapping every symbol to its P/E ratio, or None if it failed
+    """
+    concurrency = concurrency or SCRAPE_CONCURRENCY
+    symbol_deadline = symbol_deadline or SCRAPE_SYMBOL_DEADLINE
+    pe_ratios: Dict[str, Optional[float]] = {}
+    
+    if not symbols:
+        return pe_ratios
+    
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(symbols)), thread_name_prefix="pe-scrape") as pool:
+        futures = {
+            pool.submit(_scrape_with_deadline, symbol, symbol_deadline, recorder): symbol
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                pe_ratio = future.result()
+            except Exception as e:
+                logger.error(f"Error scraping P/E for {symbol}: {str(e)}")
+                pe_ratio = None
+            
+            pe_ratios[symbol] = pe_ratio
+            if on_result:
+                on_result(symbol, pe_ratio)
+    
+    return pe_ratios
+
+
+class _ShardRecorder:
+    """
+    Collects a shard's per-symbol results across its retries, so each symbol
+    is recorded once: with the outcome of its last attempt, the requests of
+    all attempts and their total latency.
+    """
+
+    def __init__(self):
+        self.symbols: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record_symbol(self, symbol: str, source: Optional[str], success: bool, attempts: int, latency: float):
+        with self._lock:
+            previous = self.symbols.get(symbol)
+            if previous is not None:
+                attempts += previous["attempts"]
+                latency += previous["latency"]
+            self.symbols[symbol] = {"source": source, "success": success, "attempts": attempts, "latency": latency}
+
+    def flush(self, recorder):
+        for symbol, result in self.symbols.items():
+            recorder.record_symbol(symbol, result["source"], result["success"], result["attempts"], result["latency"])
+
+
+def _scrape_batch(
+    symbols: List[str],
+    on_result: Callable[[str, Optional[float]], None],
+    recorder
+) -> Optional[Dict[str, Optional[float]]]:
+    """
+    Scrape symbols with one request to the NSE service's batch API.
+
+    Returns:
+        Dict of symbol -> P/E ratio (None if it failed), or None if the batch API is unavailable
+    """
+    try:
+        url = f"{NSE_SERVICE_URL}/api/pe/batch"
+        batch_started = time.monotonic()
+        response = service_session.post(
+            url,
+            json={"symbols": symbols},
+            timeout=300  # 5 minutes for batch processing
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('success'):
+                pe_ratios: Dict[str, Optional[float]] = {}
+                batch_seconds = time.monotonic() - batch_started
+                for item in data.get('results', []):
+                    pe_ratio = item.get('pe_ratio') if item.get('success') else None
+                    pe_ratios[item['symbol']] = pe_ratio or None
+                    on_result(item['symbol'], pe_ratio)
+                    recorder.record_symbol(item['symbol'], "batch", bool(pe_ratio), 1, batch_seconds)
+                return pe_ratios
+            else:
+                logger.warning("Batch API returned unsuccessful response, falling back to individual requests")
+        else:
+            logger.warning(f"Batch API returned status {response.status_code}, falling back to individual requests")
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Batch API unavailable, falling back to individual requests: {str(e)}")
+    except Exception as e:
+        logger.warning(f"Error using batch API, falling back to individual requests: {str(e)}")
+    return None
+
+
+def _scrape_shard(
+    shard: int,
+    symbols: List[str],
+    use_batch: bool,
+    concurrency: Optional[int],
+    on_result: Optional[Callable[[str, Optional[float]], None]],
+    recorder
+) -> Tuple[Dict[str, Optional[float]], str]:
+    """
+    Scrape one shard: the batch API first, individual requests if it is
+    unavailable, then up to SCRAPE_SHARD_RETRIES retries of the symbols
+    that failed. on_result sees each symbol once, with its final outcome.
+
+    Returns:
+        Tuple of (symbol -> P/E ratio or None, batch or individual)
+    """
+    shard_recorder = _ShardRecorder()
+    pe_ratios: Dict[str, Optional[float]] = {}
+    mode = "batch"
+    
+    def report(symbol: str, pe_ratio: Optional[float]):
+        if pe_ratio:
+            pe_ratios[symbol] = pe_ratio
+            if on_result:
+                on_result(symbol, pe_ratio)
+    
+    pending = list(symbols)
+    try:
+        for attempt in range(SCRAPE_SHARD_RETRIES + 1):
+            if attempt:
+                logger.info(f"Shard {shard}: retrying {len(pending)} symbols (attempt {attempt + 1})")
+                time.sleep(SCRAPE_SHARD_RETRY_DELAY)
+            
+            scraped = _scrape_batch(pending, report, shard_recorder) if use_batch else None
+            if scraped is None:
+                mode = "individual"
+                scraped = scrape_symbols(pending, concurrency=concurrency, on_result=report, recorder=shard_recorder)
+            pe_ratios.update((symbol, scraped.get(symbol)) for symbol in pending)
+            
+            pending = [symbol for symbol in pending if not pe_ratios.get(symbol)]
+            if not pending:
+                break
+    except Exception as e:
+        # Symbols without a result count as failed, so progress and run metrics still cover the whole shard
+        logger.error(f"Shard {shard} failed: {str(e)}")
+        pending = [symbol for symbol in symbols if not pe_ratios.get(symbol)]
+        for symbol in pending:
+            if symbol not in shard_recorder.symbols:
+                shard_recorder.record_symbol(symbol, None, False, 0, 0.0)
+    
+    for symbol in pending:
+        pe_ratios[symbol] = None
+        if on_result:
+            on_result(symbol, None)
+    if recorder is not None:
+        shard_recorder.flush(recorder)
+    return pe_ratios, mode
+
+
+def scrape_all_nifty50_pe(
+    use_batch: bool = True,
+    concurrency: Optional[int] = None,
+    on_result: Optional[Callable[[str, Optional[float]], None]] = None,
+    recorder=None,
+    symbols: Optional[List[str]] = None
+) -> List[Dict]:
+    """
+    Scrape P/E ratios for all tracked companies (the Nifty 50 by default).
+    Symbols are split into shards of SCRAPE_SHARD_SIZE that are scraped in
+    parallel, each with the batch API if the NSE service is available,
+    otherwise with individual requests, and each retrying its failed symbols.
     
     Args:
         use_batch: Whether to use batch API (default: True)
+        concurrency: Maximum concurrent individual requests per shard (default: SCRAPE_CONCURRENCY)
+        on_result: Optional callback invoked with (symbol, pe_ratio) as each symbol finishes
+        recorder: Optional metrics.ScrapeRunRecorder for per-symbol source, latency and retry metrics
+        symbols: Symbols to scrape (default: NIFTY_50_SYMBOLS)
     
     Returns:
         List of dicts with symbol, pe_ratio, and date
     """
+    symbols = list(symbols or NIFTY_50_SYMBOLS)
     results = []
     current_date = date.today()
     
-    logger.info(f"Starting P/E scraping for Nifty 50 companies on {current_date}")
+    retries_before = _session_retries()
     
-    # Try batch API first (faster and more efficient)
-    if use_batch:
-        try:
-            url = f"{NSE_SERVICE_URL}/api/pe/batch"
-            response = requests.post(
-                url,
-                json={"symbols": NIFTY_50_SYMBOLS},
-                timeout=300  # 5 minutes for batch processing
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    batch_results = data.get('results', [])
-                    for item in batch_results:
-                        if item.get('success') and item.get('pe_ratio'):
-                            results.append({
-                                "symbol": item['symbol'],
-                                "pe_ratio": item['pe_ratio'],
-                                "date": current_date
-                            })
-                            logger.info(f"✓ {item['symbol']}: P/E = {item['pe_ratio']}")
-                        else:
-                            logger.warning(f"✗ {item['symbol']}: Failed to get P/E ratio")
-                    
-                    logger.info(f"Batch scraping completed. Got P/E data for {len(results)}/{len(NIFTY_50_SYMBOLS)} companies")
-                    return results
-                else:
-                    logger.warning("Batch API returned unsuccessful response, falling back to individual requests")
-            else:
-                logger.warning(f"Batch API returned status {response.status_code}, falling back to individual requests")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Batch API unavailable, falling back to individual requests: {str(e)}")
-        except Exception as e:
-            logger.warning(f"Error using batch API, falling back to individual requests: {str(e)}")
+    shards = [symbols[i:i + SCRAPE_SHARD_SIZE] for i in range(0, len(symbols), SCRAPE_SHARD_SIZE)]
+    logger.info(f"Starting P/E scraping for {len(symbols)} companies in {len(shards)} shards on {current_date}")
     
-    # Fallback to individual requests
-    logger.info("Using individual requests for P/E scraping...")
-    for symbol in NIFTY_50_SYMBOLS:
-        logger.info(f"Scraping P/E for {symbol}...")
-        pe_ratio = scrape_pe_ratio(symbol, use_nse_service=True)
+    pe_ratios: Dict[str, Optional[float]] = {}
+    modes = set()
+    with ThreadPoolExecutor(max_workers=max(min(SCRAPE_SHARD_CONCURRENCY, len(shards)), 1), thread_name_prefix="pe-shard") as pool:
+        futures = {
+            pool.submit(_scrape_shard, index, shard, use_batch, concurrency, on_result, recorder): index
+            for index, shard in enumerate(shards)
+        }
+        for future in as_completed(futures):
+            try:
+                shard_ratios, mode = future.result()
+            except Exception as e:
+                # _scrape_shard reports its own failures; this is only reached if that failed too
+                logger.error(f"Shard {futures[future]} failed: {str(e)}")
+                continue
+            pe_ratios.update(shard_ratios)
+            modes.add(mode)
+    
+    # Keep results in the order symbols were given
+    for symbol in symbols:
+        pe_ratio = pe_ratios.get(symbol)
         
         if pe_ratio:
             results.append({
@@ -184,11 +483,12 @@ def scrape_all_nifty50_pe(use_batch: bool = True) -> List[Dict]:
             logger.info(f"✓ {symbol}: P/E = {pe_ratio}")
         else:
             logger.warning(f"✗ {symbol}: Failed to get P/E ratio")
-        
-        # Be respectful - add delay between requests (only for direct API, not service)
-        time.sleep(1)
     
-    logger.info(f"Completed scraping. Got P/E data for {len(results)}/{len(NIFTY_50_SYMBOLS)} companies")
+    logger.info(f"Completed scraping. Got P/E data for {len(results)}/{len(symbols)} companies")
+    logger.info(f"HTTP session stats: {get_session_stats()}")
+    if recorder is not None:
+        recorder.mode = modes.pop() if len(modes) == 1 else "mixed"
+        recorder.session_retries = _session_retries() - retries_before
     return results
 
 
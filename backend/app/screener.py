@@ -0,0 +1,133 @@
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+from datetime import date, timedelta
+from typing import Collection, Dict, Optional
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from .database import Company, PEData, PERollingStat
+from .analytics import ROLLING_WINDOWS, _none_for_nan
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Days a company's latest statistics may trail the screen date (holidays, suspensions)
+SCREEN_MAX_STALENESS_DAYS = int(os.getenv("SCREEN_MAX_STALENESS_DAYS", "7"))
+# 1260 trading days, about 5 years, when that window is computed
+SCREEN_DEFAULT_WINDOW = 1260 if 1260 in ROLLING_WINDOWS else max(ROLLING_WINDOWS)
+
+# deviation: P/E relative to its rolling median (-0.2 is 20% below)
+# percentile: rank of the P/E within its own window, 0-1
+SORT_KEYS = ("deviation", "percentile", "zscore", "pe_ratio")
+
+
+def screen(
+    db: Session,
+    as_of: Optional[date] = None,
+    window: int = SCREEN_DEFAULT_WINDOW,
+    sort: str = "deviation",
+    descending: bool = False,
+    limit: Optional[int] = 20,
+    company_ids: Optional[Collection[int]] = None,
+    sector: Optional[str] = None
+) -> Dict:
+    """
+    Rank companies by where their P/E stands against their own history.
+
+    Reads one date's cross-section of the rolling statistics that ingest
+    keeps up to date (pe_rolling_stats, through its window/date index), so
+    the cost depends on the number of companies, not on the history length.
+    Each company contributes its latest statistics on or before the screen
+    date, at most SCREEN_MAX_STALENESS_DAYS older.
+
+    Args:
+        db: Database session
+        as_of: Screen date, the latest date with statistics by default
+        window: Rolling window in trading days, one of ROLLING_WINDOWS
+        sort: One of SORT_KEYS
+        descending: Highest first instead of lowest first
+        limit: Number of results, None for all
+        company_ids: Only these companies, e.g. a universe's members
+        sector: Only companies of this sector (or NSE industry)
+
+    Returns:
+        {"date", "window", "sort", "screened", "results": [...]} where each result
+        has symbol, name, sector, date, pe_ratio, median, deviation, percentile,
+        zscore, and sector_rank (1-based by the sort key) among sector_size peers
+        (None when the company has neither a sector nor an industry)
+    """
+    if window not in ROLLING_WINDOWS:
+        raise ValueError(f"window must be one of {', '.join(map(str, ROLLING_WINDOWS))}, got {window}")
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}, got {sort!r}")
+
+    latest = select(func.max(PERollingStat.date)).where(PERollingStat.window_size == window)
+    if as_of:
+        latest = latest.where(PERollingStat.date <= as_of)
+    day = db.execute(latest).scalar()
+    response = {"date": day.isoformat() if day else None, "window": window, "sort": sort, "screened": 0, "results": []}
+    if day is None:
+        return response
+
+    query = select(
+        Company.id.label("company_id"),
+        Company.symbol,
+        Company.name,
+        # Sector where one is set, otherwise the NSE industry from the constituent lists
+        func.coalesce(Company.sector, Company.industry).label("sector"),
+        PERollingStat.date,
+        PEData.pe_ratio,
+        PERollingStat.median,
+        PERollingStat.pct_rank.label("percentile"),
+        PERollingStat.zscore
+    ).join(
+        Company, Company.id == PERollingStat.company_id
+    ).join(
+        PEData, and_(PEData.company_id == PERollingStat.company_id, PEData.date == PERollingStat.date)
+    ).where(
+        PERollingStat.window_size == window,
+        PERollingStat.date >= day - timedelta(days=SCREEN_MAX_STALENESS_DAYS),
+        PERollingStat.date <= day
+    )
+    if company_ids is not None:
+        query = query.where(PERollingStat.company_id.in_(company_ids))
+    if sector:
+        query = query.where(func.coalesce(Company.sector, Company.industry) == sector)
+
+    frame = pd.DataFrame(db.execute(query).all())
+    if frame.empty:
+        return response
+
+    # Latest row per company
+    frame = frame.sort_values("date").drop_duplicates("company_id", keep="last")
+    pe_ratio = frame["pe_ratio"].astype("float64")
+    median = frame["median"].astype("float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame["deviation"] = np.where(median > 0, pe_ratio / median - 1.0, np.nan)
+
+    # Companies without a sector or industry get no sector rank
+    peers = frame.groupby("sector", sort=False, dropna=True)[sort]
+    frame["sector_rank"] = peers.rank(method="min", ascending=not descending)
+    frame["sector_size"] = peers.transform("count")
+
+    frame = frame.sort_values([sort, "symbol"], ascending=[not descending, True], na_position="last")
+    response["screened"] = len(frame)
+    if limit:
+        frame = frame.head(limit)
+
+    frame["date"] = frame["date"].map(date.isoformat)
+    columns = [
+        "company_id", "symbol", "name", "sector", "date", "pe_ratio", "median",
+        "deviation", "percentile", "zscore", "sector_rank", "sector_size"
+    ]
+    results = _none_for_nan(frame[columns].to_dict("records"))
+    for result in results:
+        if result["sector_rank"] is not None:
+            result["sector_rank"] = int(result["sector_rank"])
+        if result["sector_size"] is not None:
+            result["sector_size"] = int(result["sector_size"])
+    response["results"] = results
+    return response
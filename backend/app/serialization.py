@@ -0,0 +1,122 @@
+import gzip
+import json
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.pe-columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Values of the format= query parameter
+FORMAT_JSON = "json"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_ARROW = "arrow"
+FORMATS = (FORMAT_JSON, FORMAT_COLUMNAR, FORMAT_ARROW)
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """
+    Pick the response format from the format= query parameter or the Accept header.
+    The existing nested JSON stays the default.
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in FORMATS:
+            raise ValueError(f"Unknown format {requested!r}, expected one of {', '.join(FORMATS)}")
+        return requested
+
+    accept = accept or ""
+    if ARROW_MEDIA_TYPE in accept:
+        return FORMAT_ARROW
+    if COLUMNAR_JSON_MEDIA_TYPE in accept:
+        return FORMAT_COLUMNAR
+    return FORMAT_JSON
+
+
+def to_matrix(rows: Iterable[Tuple]) -> Tuple[pd.DataFrame, Dict[str, Optional[str]]]:
+    """
+    Pivot (symbol, name, date, pe_ratio) rows into a date x symbol matrix.
+
+    Returns:
+        Tuple of (float64 DataFrame indexed by date with one column per symbol,
+        NaN for gaps; dict of symbol -> company name)
+    """
+    frame = pd.DataFrame(list(rows), columns=["symbol", "name", "date", "pe_ratio"])
+    names = dict(zip(frame["symbol"], frame["name"]))
+    matrix = frame.pivot(index="date", columns="symbol", values="pe_ratio").sort_index()
+    matrix = matrix.reindex(columns=sorted(matrix.columns)).astype("float64")
+    return matrix, names
+
+
+def encode_columnar_json(matrix: pd.DataFrame, names: Dict[str, Optional[str]]) -> bytes:
+    """
+    One shared date axis plus a float array per symbol, with null for gaps:
+    {"dates": [...], "symbols": [{"symbol", "name", "pe_ratio": [...]}]}
+    """
+    values = matrix.to_numpy()
+    missing = np.isnan(values)
+    payload = {
+        "dates": [d.isoformat() for d in matrix.index],
+        "symbols": [
+            {
+                "symbol": symbol,
+                "name": names.get(symbol),
+                "pe_ratio": np.where(missing[:, i], None, values[:, i]).tolist(),
+            }
+            for i, symbol in enumerate(matrix.columns)
+        ],
+    }
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def encode_arrow(matrix: pd.DataFrame, names: Dict[str, Optional[str]]) -> bytes:
+    """
+    Arrow IPC stream with a date column and one float column per symbol (null for gaps).
+    Company names are stored in the schema metadata.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("The arrow format needs pyarrow: pip install pyarrow")
+
+    columns = {"date": pa.array(list(matrix.index), type=pa.date32())}
+    for symbol in matrix.columns:
+        columns[symbol] = pa.array(matrix[symbol].to_numpy(), from_pandas=True)
+    table = pa.table(columns)
+    table = table.replace_schema_metadata({"names": json.dumps(names)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """
+    Compress a body with brotli (if installed) or gzip, whichever the client accepts.
+
+    Returns:
+        Tuple of (body, Content-Encoding value or None)
+    """
+    if len(body) < MIN_COMPRESS_SIZE or not accept_encoding:
+        return body, None
+
+    encodings = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if "br" in encodings:
+        try:
+            import brotli
+            return brotli.compress(body, quality=5), "br"
+        except ImportError:
+            pass
+    if "gzip" in encodings:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
@@ -0,0 +1,421 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Collection, Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every publisher builds
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from .database import Company, DataVersion, PEData
+from .cache import get_data_version
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Off: always read from the database
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "on").lower() in ("1", "on", "true", "yes")
+# Shared by every worker on the host; must be a local disk
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+# Snapshot files kept besides the current one, for workers still mapping them
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "2"))
+# Seconds a worker waits before looking for a newer snapshot again
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", "1.0"))
+
+MAGIC = b"PEMATRIX"
+FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"
+# Held while a snapshot is built and published, so workers do not build it side by side
+LOCK_FILE = ".lock"
+ALIGNMENT = 64
+NULL_TIMESTAMP = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _nullable(value: float) -> Optional[float]:
+    # NaN in the P/E matrix where the row exists is a NULL pe_ratio
+    return None if value != value else value
+
+
+class MatrixSnapshot:
+    """
+    A published snapshot, mapped read-only.
+
+    Layout: MAGIC, uint32 header length, JSON header, then 64-byte aligned
+    arrays: trading days (int32 ordinals, ascending) and three symbols x days
+    matrices: P/E (float64, NaN for gaps), pe_data ids (int64, 0 where there
+    is no row) and write timestamps (int64 microseconds, NULL_TIMESTAMP when
+    unset). Symbols are ordered by symbol, so a row is one company's
+    contiguous series.
+
+    The arrays are views on the mapping: every worker shares the same page
+    cache pages, nothing is copied into the process.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a P/E matrix snapshot")
+        (header_length,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_length])
+        if header["format"] != FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported snapshot format {header['format']}")
+
+        self.data_version: int = header["data_version"]
+        self.symbols: List[str] = header["symbols"]
+        self.names: List[Optional[str]] = header["names"]
+        self.company_ids: List[int] = header["company_ids"]
+        self.total_records: int = header["total_records"]
+        rows, days = header["shape"]
+        offsets = header["offsets"]
+
+        self.days = np.frombuffer(self._mmap, dtype="<i4", count=days, offset=offsets["days"])
+        self.pe_ratio = np.frombuffer(self._mmap, dtype="<f8", count=rows * days, offset=offsets["pe_ratio"]).reshape(rows, days)
+        self.ids = np.frombuffer(self._mmap, dtype="<i8", count=rows * days, offset=offsets["ids"]).reshape(rows, days)
+        self.timestamps = np.frombuffer(self._mmap, dtype="<i8", count=rows * days, offset=offsets["timestamps"]).reshape(rows, days)
+
+        # Small per-process lookups; the matrices themselves stay in the mapping
+        self._dates = [date.fromordinal(int(day)) for day in self.days]
+        self._rows = {company_id: row for row, company_id in enumerate(self.company_ids)}
+
+    def _columns(self, start_date: Optional[date], end_date: Optional[date]) -> slice:
+        lo = int(np.searchsorted(self.days, start_date.toordinal(), side="left")) if start_date else 0
+        hi = int(np.searchsorted(self.days, end_date.toordinal(), side="right")) if end_date else len(self.days)
+        return slice(lo, max(lo, hi))
+
+    def stats(self) -> Dict:
+        return {
+            "total_companies": len(self.symbols),
+            "total_records": self.total_records,
+            "date_range": {
+                "min": self._dates[0].isoformat() if self._dates else None,
+                "max": self._dates[-1].isoformat() if self._dates else None
+            }
+        }
+
+    def _selected(self, company_ids: Optional[Collection[int]]) -> np.ndarray:
+        """Mask of the matrix rows of these companies, all rows for None"""
+        if company_ids is None:
+            return np.ones(len(self.company_ids), dtype=bool)
+        return np.isin(np.array(self.company_ids, dtype=np.int64), np.fromiter(company_ids, dtype=np.int64))
+
+    def daily_rows(
+        self,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        company_ids: Optional[Collection[int]] = None
+    ) -> Iterator[Tuple]:
+        """(symbol, name, date, pe_ratio) rows ordered by symbol and date, like the database read"""
+        columns = self._columns(start_date, end_date)
+        dates = self._dates[columns]
+        for row in np.flatnonzero(self._selected(company_ids)).tolist():
+            symbol = self.symbols[row]
+            present = np.flatnonzero(self.ids[row, columns])
+            name = self.names[row]
+            for index, value in zip(present.tolist(), self.pe_ratio[row, columns][present].tolist()):
+                yield symbol, name, dates[index], _nullable(value)
+
+    def frame(
+        self,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        company_ids: Optional[Collection[int]] = None
+    ) -> Tuple[pd.DataFrame, Dict[str, Optional[str]]]:
+        """The date x symbol matrix and names to_matrix would build from daily_rows"""
+        columns = self._columns(start_date, end_date)
+        selected = self._selected(company_ids)
+        values = self.pe_ratio[:, columns]
+        present = (self.ids[:, columns] != 0) & selected[:, None]
+        has_symbol = present.any(axis=1)
+        has_date = present.any(axis=0)
+        symbols = [symbol for symbol, keep in zip(self.symbols, has_symbol) if keep]
+        matrix = pd.DataFrame(
+            values[has_symbol][:, has_date].T,
+            index=pd.Index([day for day, keep in zip(self._dates[columns], has_date) if keep], name="date"),
+            columns=pd.Index(symbols, name="symbol")
+        )
+        names = {symbol: name for symbol, name, keep in zip(self.symbols, self.names, has_symbol) if keep}
+        return matrix, names
+
+    def company_rows(self, company_id: int, start_date: Optional[date], end_date: Optional[date]) -> List[Dict]:
+        """One company's rows as /api/pe-data/{company_id} returns them"""
+        row = self._rows.get(company_id)
+        if row is None:
+            return []
+        columns = self._columns(start_date, end_date)
+        present = np.flatnonzero(self.ids[row, columns])
+        dates = self._dates[columns]
+        return [
+            {
+                "id": row_id,
+                "company_id": company_id,
+                "date": dates[index].isoformat(),
+                "pe_ratio": _nullable(value),
+                "timestamp": None if micros == NULL_TIMESTAMP else (_EPOCH + timedelta(microseconds=micros)).isoformat()
+            }
+            for index, value, row_id, micros in zip(
+                present.tolist(),
+                self.pe_ratio[row, columns][present].tolist(),
+                self.ids[row, columns][present].tolist(),
+                self.timestamps[row, columns][present].tolist()
+            )
+        ]
+
+
+def build_snapshot(db: Session) -> Tuple[bytes, int]:
+    """
+    Read pe_data into the snapshot file format. The data version is read
+    before the rows, so the snapshot holds at least that version's data.
+
+    Returns:
+        Tuple of (file contents, data version)
+    """
+    data_version = db.execute(select(DataVersion.version).where(DataVersion.id == 1)).scalar() or 0
+    companies = db.execute(select(Company.id, Company.symbol, Company.name).order_by(Company.symbol)).all()
+    rows = db.execute(
+        select(PEData.company_id, PEData.date, PEData.pe_ratio, PEData.id, PEData.timestamp)
+    ).all()
+    db.rollback()  # End the read transaction
+
+    days = np.unique(np.array([row.date.toordinal() for row in rows], dtype=np.int32))
+    shape = (len(companies), len(days))
+    pe_ratio = np.full(shape, np.nan, dtype="<f8")
+    ids = np.zeros(shape, dtype="<i8")
+    timestamps = np.full(shape, NULL_TIMESTAMP, dtype="<i8")
+
+    row_of = {company_id: index for index, (company_id, _, _) in enumerate(companies)}
+    total_records = 0
+    if rows:
+        known = [row for row in rows if row.company_id in row_of]
+        r = np.array([row_of[row.company_id] for row in known], dtype=np.int64)
+        c = np.searchsorted(days, np.array([row.date.toordinal() for row in known], dtype=np.int32))
+        pe_ratio[r, c] = np.array([np.nan if row.pe_ratio is None else row.pe_ratio for row in known], dtype=np.float64)
+        ids[r, c] = [row.id for row in known]
+        timestamps[r, c] = [
+            NULL_TIMESTAMP if row.timestamp is None else (row.timestamp - _EPOCH) // timedelta(microseconds=1)
+            for row in known
+        ]
+        total_records = len(rows)
+
+    header = {
+        "format": FORMAT_VERSION,
+        "data_version": data_version,
+        "created_at": datetime.utcnow().isoformat(),
+        "shape": list(shape),
+        "symbols": [symbol for _, symbol, _ in companies],
+        "names": [name for _, _, name in companies],
+        "company_ids": [company_id for company_id, _, _ in companies],
+        "total_records": total_records,
+    }
+    arrays = [("days", days.astype("<i4")), ("pe_ratio", pe_ratio), ("ids", ids), ("timestamps", timestamps)]
+
+    # Offsets depend on the header length and vice versa; reserve room for them first
+    header["offsets"] = {name: 0 for name, _ in arrays}
+    prefix = len(MAGIC) + 4 + len(json.dumps(header)) + 32 * len(arrays)
+    offset = _align(prefix)
+    for name, array in arrays:
+        header["offsets"][name] = offset
+        offset = _align(offset + array.nbytes)
+    encoded = json.dumps(header).encode()
+    assert len(MAGIC) + 4 + len(encoded) <= header["offsets"]["days"]
+
+    out = bytearray(offset)
+    out[:len(MAGIC)] = MAGIC
+    struct.pack_into("<I", out, len(MAGIC), len(encoded))
+    out[len(MAGIC) + 4:len(MAGIC) + 4 + len(encoded)] = encoded
+    for name, array in arrays:
+        start = header["offsets"][name]
+        out[start:start + array.nbytes] = array.tobytes()
+    return bytes(out), data_version
+
+
+@contextmanager
+def _publish_lock(path: Path, blocking: bool = True) -> Iterator[bool]:
+    """flock on LOCK_FILE in the snapshot directory; yields whether it was acquired"""
+    path.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield True
+        return
+    with open(path / LOCK_FILE, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def publish_snapshot(db: Session, directory: str = SNAPSHOT_DIR) -> Optional[int]:
+    """
+    Write a snapshot of the current data and make it the current one.
+    The file is written under a temporary name and renamed into place, then
+    the CURRENT pointer is swapped the same way, so readers see either the
+    old or the new snapshot, never a partial one. Publishers on the host take
+    turns through a file lock.
+
+    Returns:
+        Data version of the published snapshot, None if publishing failed
+    """
+    path = Path(directory)
+    try:
+        with _publish_lock(path):
+            return _publish(db, path)
+    except OSError as e:
+        logger.error(f"Error publishing P/E matrix snapshot: {str(e)}")
+        return None
+
+
+def _publish(db: Session, path: Path) -> Optional[int]:
+    started = time.monotonic()
+    try:
+        body, data_version = build_snapshot(db)
+
+        name = f"pe-matrix-{data_version:010d}.bin"
+        temporary = path / f".{name}.{uuid.uuid4().hex}.tmp"
+        temporary.write_bytes(body)
+        os.replace(temporary, path / name)
+
+        # Another writer may have published a newer version meanwhile
+        current = _read_current(path)
+        if current is None or _version_of(current) <= data_version:
+            pointer = path / f".{CURRENT_FILE}.{uuid.uuid4().hex}.tmp"
+            pointer.write_text(name)
+            os.replace(pointer, path / CURRENT_FILE)
+
+        _remove_old_snapshots(path)
+        logger.info(f"Published P/E matrix snapshot {name} ({len(body)} bytes) in {time.monotonic() - started:.2f}s")
+        return data_version
+    except Exception as e:
+        logger.error(f"Error publishing P/E matrix snapshot: {str(e)}")
+        db.rollback()
+        return None
+
+
+def _read_current(path: Path) -> Optional[str]:
+    try:
+        return (path / CURRENT_FILE).read_text().strip() or None
+    except OSError:
+        return None
+
+
+def _version_of(name: str) -> int:
+    return int(name.rsplit("-", 1)[-1].split(".")[0])
+
+
+def _remove_old_snapshots(path: Path):
+    current = _read_current(path)
+    if current is None:
+        return
+    older = sorted(
+        (file for file in path.glob("pe-matrix-*.bin") if _version_of(file.name) < _version_of(current)),
+        key=lambda file: _version_of(file.name)
+    )
+    for file in older[:max(len(older) - SNAPSHOT_KEEP, 0)]:
+        try:
+            # Workers still mapping it keep their mapping until they move on
+            file.unlink()
+        except OSError:
+            pass
+
+
+class SnapshotReader:
+    """This worker's view of the published snapshot"""
+
+    def __init__(self, directory: str = SNAPSHOT_DIR):
+        self.directory = Path(directory)
+        self._snapshot: Optional[MatrixSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, data_version: int) -> Optional[MatrixSnapshot]:
+        """
+        The snapshot of exactly this data version, or None when there is none
+        (yet), in which case callers read from the database.
+        """
+        if not SNAPSHOT_ENABLED:
+            return None
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.data_version == data_version:
+            return snapshot
+
+        now = time.monotonic()
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.data_version == data_version:
+                return self._snapshot
+            if now - self._checked_at < SNAPSHOT_CHECK_INTERVAL:
+                return None
+            self._checked_at = now
+            current = _read_current(self.directory)
+            if current is None or _version_of(current) != data_version:
+                return None
+            try:
+                self._snapshot = MatrixSnapshot(self.directory / current)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not map P/E matrix snapshot {current}: {str(e)}")
+                return None
+            return self._snapshot
+
+
+snapshot_reader = SnapshotReader()
+
+
+def current_snapshot(db: Session) -> Optional[MatrixSnapshot]:
+    """The snapshot matching the current data version, None to read from the database"""
+    if not SNAPSHOT_ENABLED:
+        return None
+    version, _ = get_data_version(db)
+    return snapshot_reader.get(version)
+
+
+def _is_current(db: Session, path: Path) -> bool:
+    current = _read_current(path)
+    version = db.execute(select(DataVersion.version).where(DataVersion.id == 1)).scalar() or 0
+    db.rollback()
+    return current is not None and _version_of(current) == version and (path / current).exists()
+
+
+def ensure_snapshot(db: Session, directory: str = SNAPSHOT_DIR):
+    """
+    Publish a snapshot at startup unless the current one is up to date.
+    Only one worker builds it; the others find the lock taken and read from
+    the database until the snapshot shows up.
+    """
+    if not SNAPSHOT_ENABLED:
+        return
+    path = Path(directory)
+    if _is_current(db, path):
+        return
+    try:
+        with _publish_lock(path, blocking=False) as acquired:
+            if not acquired:
+                logger.info("Another worker is publishing the P/E matrix snapshot")
+                return
+            # Another worker may have published it since the check above
+            if not _is_current(db, path):
+                _publish(db, path)
+    except OSError as e:
+        logger.error(f"Error publishing P/E matrix snapshot: {str(e)}")
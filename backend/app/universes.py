@@ -0,0 +1,239 @@
+"""
+Universes of tracked companies and their dated membership.
+
+A universe is an index (NIFTY50, NIFTYNEXT50, NIFTY100, NIFTY500, ...) or a
+custom watchlist. Membership is stored as date ranges, so constituent changes
+are kept and any universe can be read as of a past date.
+
+Usage (from the backend directory), with an NSE constituent list such as
+ind_nifty100list.csv (Company Name, Industry, Symbol, Series, ISIN Code) or
+any CSV with a symbol column:
+    python -m app.universes load NIFTY100 ind_nifty100list.csv --as-of 2024-09-30
+    python -m app.universes load MYWATCHLIST watchlist.csv --kind watchlist
+    python -m app.universes list
+"""
+import argparse
+import logging
+import os
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from sqlalchemy import func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, Company, Universe, UniverseMember, init_db
+from .ingest import invalidate_readers, resolve_company_ids
+from .scraper import NIFTY_50_SYMBOLS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_UNIVERSE = "NIFTY50"
+# Universes whose current members are scraped every day
+SCRAPE_UNIVERSES = [name.strip().upper() for name in os.getenv("SCRAPE_UNIVERSES", DEFAULT_UNIVERSE).split(",") if name.strip()]
+
+UNIVERSE_KINDS = ("index", "watchlist")
+# Start date of memberships that predate tracking, e.g. the built-in Nifty 50 list
+ALWAYS = date.min
+
+# Column names of the NSE constituent lists
+NSE_LIST_COLUMNS = {"Symbol": "symbol", "Company Name": "name", "Industry": "industry", "ISIN Code": "isin"}
+
+
+def get_universe(db: Session, name: str) -> Optional[Universe]:
+    return db.execute(select(Universe).where(Universe.name == name.upper())).scalar_one_or_none()
+
+
+def member_filter(universe_id: int, as_of: date):
+    # Served by ix_universe_members_universe_start: a range scan within one universe
+    return [
+        UniverseMember.universe_id == universe_id,
+        UniverseMember.start_date <= as_of,
+        or_(UniverseMember.end_date.is_(None), UniverseMember.end_date > as_of),
+    ]
+
+
+def members_query(universe_id: int, as_of: date):
+    """SELECT of the company ids in a universe on a date, for use in IN (...) filters"""
+    return select(UniverseMember.company_id).where(*member_filter(universe_id, as_of))
+
+
+def member_symbols(db: Session, name: str, as_of: Optional[date] = None) -> List[str]:
+    """Symbols of a universe's members on a date (today by default), sorted"""
+    universe = get_universe(db, name)
+    if universe is None:
+        return []
+    return list(db.execute(
+        select(Company.symbol)
+        .where(Company.id.in_(members_query(universe.id, as_of or date.today())))
+        .order_by(Company.symbol)
+    ).scalars())
+
+
+def set_members(
+    db: Session,
+    name: str,
+    rows: Iterable[Dict],
+    as_of: date,
+    kind: str = "index",
+    description: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Make `rows` the members of a universe from `as_of` on.
+    Companies that left get their membership closed on that date, new ones
+    get a membership starting on it; the universe is created if needed.
+    Company name, industry and isin are updated from the rows where given.
+
+    Args:
+        db: Database session
+        name: Universe name, stored upper case
+        rows: Dicts with symbol and optionally name, industry and isin
+        as_of: First day of the new membership
+        kind: index or watchlist, for a new universe
+        description: Description of a new universe
+
+    Returns:
+        Dict with the number of members added and removed
+    """
+    if kind not in UNIVERSE_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(UNIVERSE_KINDS)}, got {kind!r}")
+
+    rows = {row["symbol"].strip().upper(): row for row in rows if row.get("symbol")}
+    universe = get_universe(db, name)
+    if universe is None:
+        universe = Universe(name=name.upper(), kind=kind, description=description)
+        db.add(universe)
+        db.flush()
+
+    company_ids = resolve_company_ids(db, rows)
+    details = [
+        {"id": company_ids[symbol], **{key: row[key] for key in ("name", "industry", "isin") if row.get(key)}}
+        for symbol, row in rows.items()
+    ]
+    details = [detail for detail in details if len(detail) > 1]
+    if details:
+        db.bulk_update_mappings(Company, details)
+
+    current = {
+        member.company_id: member
+        for member in db.execute(
+            select(UniverseMember).where(UniverseMember.universe_id == universe.id, UniverseMember.end_date.is_(None))
+        ).scalars()
+    }
+    wanted = set(company_ids.values())
+    if any(member.start_date > as_of for member in current.values()):
+        db.rollback()
+        raise ValueError(f"Universe {universe.name} has memberships starting after {as_of}; load lists oldest first")
+
+    for company_id in current.keys() - wanted:
+        current[company_id].end_date = as_of
+    db.add_all([
+        UniverseMember(universe_id=universe.id, company_id=company_id, start_date=as_of)
+        for company_id in sorted(wanted - current.keys())
+    ])
+    db.commit()
+
+    added, removed = len(wanted - current.keys()), len(current.keys() - wanted)
+    if added or removed:
+        # Universe filters are part of cached responses
+        invalidate_readers(db)
+    logger.info(f"Universe {universe.name} as of {as_of}: {added} members added, {removed} removed, {len(wanted)} in total")
+    return {"added": added, "removed": removed}
+
+
+def ensure_default_universe(db: Session):
+    """Create the NIFTY50 universe from the built-in symbol list on first start"""
+    if get_universe(db, DEFAULT_UNIVERSE) is not None:
+        return
+    try:
+        set_members(
+            db,
+            DEFAULT_UNIVERSE,
+            [{"symbol": symbol} for symbol in NIFTY_50_SYMBOLS],
+            as_of=ALWAYS,
+            description="Nifty 50"
+        )
+    except IntegrityError:
+        # Another worker created it first
+        db.rollback()
+
+
+def scrape_symbols_for(db: Session, universes: Optional[List[str]] = None, as_of: Optional[date] = None) -> List[str]:
+    """
+    Symbols to scrape: the current members of every universe in
+    SCRAPE_UNIVERSES, each symbol once. Falls back to the built-in Nifty 50
+    list when none of them has members.
+    """
+    symbols = set()
+    for name in universes or SCRAPE_UNIVERSES:
+        symbols.update(member_symbols(db, name, as_of))
+    return sorted(symbols) if symbols else list(NIFTY_50_SYMBOLS)
+
+
+def list_universes(db: Session, as_of: Optional[date] = None) -> List[Dict]:
+    """Every universe with its member count on a date (today by default)"""
+    as_of = as_of or date.today()
+    counts = dict(db.execute(
+        select(UniverseMember.universe_id, func.count())
+        .where(
+            UniverseMember.start_date <= as_of,
+            or_(UniverseMember.end_date.is_(None), UniverseMember.end_date > as_of)
+        )
+        .group_by(UniverseMember.universe_id)
+    ).all())
+    return [
+        {
+            "name": universe.name,
+            "kind": universe.kind,
+            "description": universe.description,
+            "members": counts.get(universe.id, 0),
+        }
+        for universe in db.execute(select(Universe).order_by(Universe.name)).scalars()
+    ]
+
+
+def read_constituents(path: str) -> List[Dict]:
+    """Rows of an NSE constituent list, or of any CSV with a symbol column"""
+    frame = pd.read_csv(path, dtype=str).rename(columns=NSE_LIST_COLUMNS)
+    frame.columns = [column.strip().lower() for column in frame.columns]
+    if "symbol" not in frame.columns:
+        raise ValueError(f"{path} has no Symbol column")
+    if "series" in frame.columns:
+        frame = frame[frame["series"].fillna("EQ").str.strip() == "EQ"]
+    columns = [column for column in ("symbol", "name", "industry", "isin") if column in frame.columns]
+    frame = frame[columns].dropna(subset=["symbol"])
+    return [
+        {key: value.strip() for key, value in row.items() if isinstance(value, str) and value.strip()}
+        for row in frame.to_dict("records")
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage tracked universes and their membership")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="Set a universe's members from a constituent list")
+    load.add_argument("name", help="Universe name, e.g. NIFTY100")
+    load.add_argument("path", help="CSV with a Symbol column")
+    load.add_argument("--as-of", type=date.fromisoformat, default=date.today(), help="First day of membership (default: today)")
+    load.add_argument("--kind", choices=UNIVERSE_KINDS, default="index")
+    load.add_argument("--description")
+    commands.add_parser("list", help="List universes and their current member counts")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        ensure_default_universe(db)
+        if args.command == "load":
+            set_members(db, args.name, read_constituents(args.path), args.as_of, kind=args.kind, description=args.description)
+        else:
+            for universe in list_universes(db):
+                print(f"{universe['name']:<20} {universe['kind']:<10} {universe['members']:>5}  {universe['description'] or ''}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
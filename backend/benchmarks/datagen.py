@@ -0,0 +1,92 @@
+"""
+Synthetic P/E history for benchmarks.
+
+Fills the companies and pe_data tables with N symbols x M years of
+business-day random walks. Rows are inserted day by day, as the daily
+scrape would insert them, so one company's rows are spread over the table.
+
+Usage (from backend/):
+    python -m benchmarks.datagen --database-url sqlite:///./bench.db --symbols 50 --years 20
+"""
+import argparse
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+import numpy as np
+from sqlalchemy import text
+
+
+def business_days(years: int, end: date = None) -> List[date]:
+    end = end or date.today()
+    days = (end - timedelta(days=offset) for offset in range(years * 365, -1, -1))
+    return [day for day in days if day.weekday() < 5]
+
+
+def symbol_names(symbols: int) -> List[str]:
+    """The real Nifty 50 symbols first, so scraper scenarios line up with the data, then SYMnnn"""
+    from app.scraper import NIFTY_50_SYMBOLS
+
+    names = list(NIFTY_50_SYMBOLS[:symbols])
+    names += [f"SYM{i:03d}" for i in range(len(names), symbols)]
+    return names
+
+
+def generate_history(engine, symbols: int, years: int, seed: int = 0, end: date = None) -> int:
+    """
+    Insert companies and their P/E history into an empty database.
+
+    Returns:
+        Number of pe_data rows written
+    """
+    rng = np.random.default_rng(seed)
+    days = business_days(years, end)
+    names = symbol_names(symbols)
+    now = datetime.utcnow()
+
+    walks = 20 + np.cumsum(rng.normal(0, 0.3, size=(len(days), symbols)), axis=0)
+    walks = np.clip(walks, 5, None)
+
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO companies (id, symbol, name, sector) VALUES (:id, :symbol, :name, :sector)"),
+            [{"id": i + 1, "symbol": name, "name": f"{name} Ltd", "sector": "Benchmark"} for i, name in enumerate(names)]
+        )
+        for day, values in zip(days, walks):
+            conn.execute(
+                text("INSERT INTO pe_data (company_id, date, pe_ratio, timestamp) VALUES (:c, :d, :p, :t)"),
+                [{"c": i + 1, "d": day, "p": float(v), "t": now} for i, v in enumerate(values)]
+            )
+    return len(days) * symbols
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a database with synthetic P/E history")
+    parser.add_argument("--database-url", required=True, help="Target database, e.g. sqlite:///./bench.db")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--analytics", action="store_true", help="Also build the analytics tables")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    from app.database import engine, init_db, SessionLocal
+
+    init_db()
+    started = time.perf_counter()
+    rows = generate_history(engine, args.symbols, args.years, args.seed)
+    print(f"Wrote {rows} rows in {time.perf_counter() - started:.1f}s")
+
+    if args.analytics:
+        from app.analytics import rebuild_analytics
+
+        db = SessionLocal()
+        try:
+            rebuild_analytics(db)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
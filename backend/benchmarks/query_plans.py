@@ -0,0 +1,113 @@
+"""
+Query plans and latencies of the P/E read paths on a synthetic history.
+
+Builds a throwaway SQLite database (50 symbols x 20 years of business days
+by default), then prints EXPLAIN QUERY PLAN and timings for the queries
+behind /api/pe-data/all and /api/pe-data/{company_id}, next to the shapes
+they replaced.
+
+Usage (from backend/):
+    python -m benchmarks.query_plans [--symbols 50] [--years 20] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Point the app at a scratch database before anything imports app.database
+_workdir = tempfile.mkdtemp(prefix="pe-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_workdir}/bench.db"
+
+from sqlalchemy import text
+
+from app.database import engine, init_db
+from app.cache import response_cache
+from benchmarks.datagen import generate_history
+
+# (label, SQL) pairs; :company_id and :start are bound below
+QUERIES = [
+    (
+        "all companies, previous (join + ORDER BY symbol)",
+        "SELECT companies.symbol, companies.name, pe_data.date, pe_data.pe_ratio "
+        "FROM companies JOIN pe_data ON companies.id = pe_data.company_id "
+        "ORDER BY companies.symbol, pe_data.date",
+    ),
+    (
+        "all companies, current (index order, regrouped in Python)",
+        "SELECT company_id, date, pe_ratio FROM pe_data ORDER BY company_id, date",
+    ),
+    (
+        "all companies from start date, current",
+        "SELECT company_id, date, pe_ratio FROM pe_data WHERE date >= :start ORDER BY company_id, date",
+    ),
+    (
+        "one company, previous (full ORM entity)",
+        "SELECT * FROM pe_data WHERE company_id = :company_id ORDER BY date",
+    ),
+    (
+        "one company from start date, current",
+        "SELECT id, company_id, date, pe_ratio, timestamp FROM pe_data "
+        "WHERE company_id = :company_id AND date >= :start ORDER BY date",
+    ),
+]
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show query plans and latencies of the P/E read paths")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    rows = generate_history(engine, args.symbols, args.years)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"Generated {rows} rows ({args.symbols} symbols x {args.years} years) "
+          f"in {time.perf_counter() - started:.1f}s at {engine.url}\n")
+
+    params = {"company_id": args.symbols // 2, "start": date.today() - timedelta(days=365)}
+    with engine.connect() as conn:
+        for label, sql in QUERIES:
+            print(label)
+            for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params):
+                print(f"    {row[-1]}")
+            elapsed = timed(lambda: conn.execute(text(sql), params).all(), args.repeat)
+            print(f"    {elapsed:.1f} ms\n")
+
+    # End to end through the API, with the response cache emptied before every call
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    endpoints = [
+        ("/api/pe-data/all", {}),
+        ("/api/pe-data/all", {"format": "columnar"}),
+        ("/api/pe-data/all", {"start_date": params["start"].isoformat()}),
+        (f"/api/pe-data/{params['company_id']}", {}),
+        (f"/api/pe-data/{params['company_id']}", {"start_date": params["start"].isoformat()}),
+    ]
+    print("Endpoints (uncached)")
+    for path, query in endpoints:
+        def call():
+            response_cache.clear()
+            client.get(path, params=query).raise_for_status()
+        label = path + ("?" + "&".join(f"{k}={v}" for k, v in query.items()) if query else "")
+        print(f"    {label:<55} {timed(call, args.repeat):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
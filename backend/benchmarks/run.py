@@ -0,0 +1,376 @@
+"""
+Benchmark scenarios for the API, the database writes and the scraper.
+
+Builds a scratch SQLite database with synthetic history, starts the API in a
+uvicorn subprocess and a stub NSE service in-process, then times:
+    api_pe_data_all, api_pe_data_all_columnar, api_pe_data_company, api_stats
+        GET requests from --concurrency client threads (response cache disabled)
+    api_stats_under_heavy_all
+        api_stats while another client keeps requesting the full history
+        from /api/pe-data/all, to show whether small requests wait behind it
+    save_pe_data_to_db
+        saving one day of P/E values, including the analytics refresh
+    scrape_batch, scrape_individual
+        scrape_all_nifty50_pe against the stub, via the batch endpoint and via
+        concurrent per-symbol requests with injected failures
+
+Results are written as JSON. When a baseline file exists, p50/p95 latencies
+and throughput are compared against it, regressions are listed and the exit
+status is 1.
+
+Usage (from backend/):
+    python -m benchmarks.run --save-baseline      # record benchmarks/baseline.json
+    python -m benchmarks.run                      # compare against it
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCHMARK_DIR.parent
+DEFAULT_BASELINE = BENCHMARK_DIR / "baseline.json"
+DEFAULT_OUTPUT = BENCHMARK_DIR / "results" / "latest.json"
+
+API_SCENARIOS = {
+    "api_pe_data_all": ("/api/pe-data/all", {}),
+    "api_pe_data_all_columnar": ("/api/pe-data/all", {"format": "columnar"}),
+    "api_pe_data_company": ("/api/pe-data/{company_id}", {}),
+    "api_stats": ("/api/stats", {}),
+}
+MIXED_SCENARIO = "api_stats_under_heavy_all"
+SCENARIOS = list(API_SCENARIOS) + [MIXED_SCENARIO, "save_pe_data_to_db", "scrape_batch", "scrape_individual"]
+
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {"p50_ms": False, "p95_ms": False, "throughput_per_s": True}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples_ms: List[float], wall_seconds: float, errors: int) -> Dict:
+    """Latency percentiles and throughput of one scenario"""
+    ordered = sorted(samples_ms)
+
+    def percentile(q: float) -> Optional[float]:
+        if not ordered:
+            return None
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 2)
+
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "mean_ms": round(statistics.mean(ordered), 2) if ordered else None,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1], 2) if ordered else None,
+        "throughput_per_s": round(len(ordered) / wall_seconds, 2) if wall_seconds > 0 else None,
+    }
+
+
+def run_load(call: Callable[[int], None], iterations: int, concurrency: int) -> Dict:
+    """Run call(i) for i in range(iterations) on `concurrency` threads"""
+    samples: List[float] = []
+    errors = 0
+
+    def one(i: int):
+        started = time.perf_counter()
+        call(i)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(one, i) for i in range(iterations)]:
+            try:
+                samples.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"    error: {e}")
+    return summarize(samples, time.perf_counter() - started, errors)
+
+
+class APIServer:
+    """The backend in a uvicorn subprocess, so client threads do not compete with it for the GIL"""
+
+    def __init__(self, port: int, workers: int):
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=os.environ.copy(),
+        )
+
+    def wait_ready(self, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            try:
+                if requests.get(f"{self.url}/api/stats", timeout=2).status_code == 200:
+                    return
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("API server did not become ready")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_api_scenario(server: APIServer, name: str, symbols: int, iterations: int, concurrency: int) -> Dict:
+    path, params = API_SCENARIOS[name]
+    sessions: Dict[int, requests.Session] = {}
+    rng = random.Random(0)
+    company_ids = [rng.randint(1, symbols) for _ in range(iterations)]
+
+    def call(i: int):
+        session = sessions.setdefault(i % concurrency, requests.Session())
+        response = session.get(server.url + path.format(company_id=company_ids[i]), params=params, timeout=120)
+        response.raise_for_status()
+        response.content
+
+    call(0)  # Warm up connections and SQLite's page cache
+    return run_load(call, iterations, concurrency)
+
+
+def run_mixed_scenario(server: APIServer, iterations: int, concurrency: int) -> Dict:
+    """
+    /api/stats latency while one client requests /api/pe-data/all back to back.
+    The heavy requests' own latencies are reported alongside.
+    """
+    stop = threading.Event()
+    heavy_ms: List[float] = []
+
+    def heavy_loop():
+        session = requests.Session()
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = session.get(f"{server.url}/api/pe-data/all", timeout=120)
+            response.raise_for_status()
+            heavy_ms.append((time.perf_counter() - started) * 1000)
+
+    sessions: Dict[int, requests.Session] = {}
+
+    def call(i: int):
+        session = sessions.setdefault(i % concurrency, requests.Session())
+        session.get(f"{server.url}/api/stats", timeout=120).raise_for_status()
+
+    call(0)
+    heavy = threading.Thread(target=heavy_loop, name="heavy-client", daemon=True)
+    heavy.start()
+    time.sleep(0.2)  # Let the first heavy request get going
+    try:
+        summary = run_load(call, iterations, concurrency)
+    finally:
+        stop.set()
+        heavy.join()
+    summary["heavy_requests"] = len(heavy_ms)
+    summary["heavy_p50_ms"] = round(statistics.median(heavy_ms), 2) if heavy_ms else None
+    return summary
+
+
+def run_save_scenario(iterations: int) -> Dict:
+    from app.scheduler import save_pe_data_to_db
+    from app.scraper import NIFTY_50_SYMBOLS
+
+    first_day = date.today() + timedelta(days=1)
+    rng = random.Random(0)
+
+    def call(i: int):
+        day = first_day + timedelta(days=i)
+        rows = [{"symbol": symbol, "pe_ratio": rng.uniform(10, 60), "date": day} for symbol in NIFTY_50_SYMBOLS]
+        if save_pe_data_to_db(rows) is None:
+            raise RuntimeError("save_pe_data_to_db failed")
+
+    # Writes are serialized by SQLite anyway, so they run one at a time
+    return run_load(call, iterations, 1)
+
+
+def run_scrape_scenario(stub, batch: bool, iterations: int, concurrency: int) -> Dict:
+    from app.scraper import scrape_all_nifty50_pe, NIFTY_50_SYMBOLS
+
+    stub.config.batch = batch
+    scraped: List[int] = []
+
+    def call(i: int):
+        scraped.append(len(scrape_all_nifty50_pe(use_batch=batch, concurrency=concurrency)))
+
+    summary = run_load(call, iterations, 1)
+    summary["symbols_scraped_mean"] = round(statistics.mean(scraped), 2) if scraped else None
+    summary["symbols"] = len(NIFTY_50_SYMBOLS)
+    return summary
+
+
+def compare(results: Dict, baseline: Dict, threshold: float, min_ms: float) -> List[str]:
+    """
+    Regressions of results against baseline.
+    A latency regresses when it is more than `threshold` (a fraction) and
+    `min_ms` above the baseline; throughput when it is `threshold` below it.
+    """
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            now, before = current.get(metric), previous.get(metric)
+            if now is None or not before:
+                continue
+            change = (now - before) / before
+            if higher_is_better:
+                regressed = change < -threshold
+            else:
+                regressed = change > threshold and now - before > min_ms
+            marker = "REGRESSION" if regressed else ""
+            print(f"  {name:<28} {metric:<18} {before:>10.2f} -> {now:>10.2f} ({change:+.1%}) {marker}")
+            if regressed:
+                regressions.append(f"{name} {metric}: {before} -> {now} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark scenarios and compare them against a baseline")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=40, help="Requests per API scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Client threads for API scenarios, scraper threads for scrapes")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--save-iterations", type=int, default=10)
+    parser.add_argument("--scrape-iterations", type=int, default=3)
+    parser.add_argument("--stub-latency", type=float, default=0.02, help="Seconds per symbol lookup in the stub")
+    parser.add_argument("--failure-rate", type=float, default=0.04, help="Share of stub lookups that fail")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline as well")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed relative slowdown before flagging")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Everything the app reads at import time has to be set first
+    workdir = tempfile.mkdtemp(prefix="pe-bench-")
+    stub_port = _free_port()
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "NSE_SERVICE_URL": f"http://127.0.0.1:{stub_port}",
+        "NSE_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "NSE_MIN_INTERVAL": "0",
+        "RESPONSE_CACHE_MAX_ENTRIES": "0",
+        "PROFILE_MODE": "off",
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from app.database import engine, init_db
+    from benchmarks.datagen import generate_history
+    from benchmarks.stub_nse import StubConfig, StubNSEService
+
+    init_db()
+    started = time.perf_counter()
+    rows = generate_history(engine, args.symbols, args.years)
+    print(f"Generated {rows} rows ({args.symbols} symbols x {args.years} years) in {time.perf_counter() - started:.1f}s")
+
+    results = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "symbols": args.symbols, "years": args.years, "requests": args.requests,
+                "concurrency": args.concurrency, "workers": args.workers,
+                "stub_latency": args.stub_latency, "failure_rate": args.failure_rate,
+            },
+        },
+        "scenarios": {},
+    }
+
+    stub = StubNSEService(port=stub_port, config=StubConfig(latency=args.stub_latency, failure_rate=args.failure_rate, seed=0))
+    server = None
+    with stub:
+        try:
+            api_selected = [name for name in selected if name in API_SCENARIOS]
+            if api_selected or MIXED_SCENARIO in selected:
+                server = APIServer(_free_port(), args.workers)
+                server.wait_ready()
+                for name in api_selected:
+                    print(f"Running {name}...")
+                    results["scenarios"][name] = run_api_scenario(
+                        server, name, args.symbols, args.requests, args.concurrency
+                    )
+                if MIXED_SCENARIO in selected:
+                    print(f"Running {MIXED_SCENARIO}...")
+                    results["scenarios"][MIXED_SCENARIO] = run_mixed_scenario(server, args.requests, args.concurrency)
+                server.stop()
+                server = None
+
+            if "save_pe_data_to_db" in selected:
+                print("Running save_pe_data_to_db...")
+                results["scenarios"]["save_pe_data_to_db"] = run_save_scenario(args.save_iterations)
+            for name, batch in (("scrape_batch", True), ("scrape_individual", False)):
+                if name in selected:
+                    print(f"Running {name}...")
+                    results["scenarios"][name] = run_scrape_scenario(stub, batch, args.scrape_iterations, args.concurrency)
+        finally:
+            if server is not None:
+                server.stop()
+
+    print()
+    for name, summary in results["scenarios"].items():
+        print(f"  {name:<28} p50 {summary['p50_ms']:>9} ms  p95 {summary['p95_ms']:>9} ms  "
+              f"{summary['throughput_per_s']:>8}/s  errors {summary['errors']}")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("meta", {}).get("params") != results["meta"]["params"]:
+        print("Warning: baseline was recorded with different parameters")
+    print(f"\nCompared with {args.baseline} ({baseline.get('meta', {}).get('created_at')}):")
+    regressions = compare(results, baseline, args.threshold, args.min_ms)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
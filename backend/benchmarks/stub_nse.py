@@ -0,0 +1,188 @@
+"""
+Local stand-in for the NSE service and the NSE website.
+
+Serves the endpoints the scraper uses, with configurable latency and
+failure rates, so scrapes can be benchmarked without network access:
+    GET  /api/pe/{symbol}                  (NSE_SERVICE_URL)
+    POST /api/pe/batch                     (NSE_SERVICE_URL)
+    GET  /api/pe/history/{symbol}          (NSE_SERVICE_URL, for backfills)
+    GET  /                                 (NSE_BASE_URL cookie warmup)
+    GET  /api/quote-equity?symbol=...      (NSE_BASE_URL direct fallback)
+
+Usage (from backend/):
+    python -m benchmarks.stub_nse --port 3001 --latency 0.05 --failure-rate 0.05
+then point the backend at it with NSE_SERVICE_URL=http://127.0.0.1:3001
+and NSE_BASE_URL=http://127.0.0.1:3001.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05  # Seconds per symbol lookup
+    jitter: float = 0.02  # Uniform +/- seconds added to latency
+    failure_rate: float = 0.0  # Share of service lookups answering success=false
+    error_rate: float = 0.0  # Share of service lookups answering HTTP 500
+    batch: bool = True  # Whether POST /api/pe/batch works (503 otherwise)
+    direct_failure_rate: float = 0.0  # Share of direct quote lookups without a P/E
+    seed: Optional[int] = None
+
+
+def _pe_for(symbol: str, day: date = None) -> float:
+    """Deterministic P/E per symbol (and day), so repeated runs save the same values"""
+    key = f"{symbol}:{day or date.today()}".encode()
+    return round(8 + (zlib.crc32(key) % 6000) / 100, 2)
+
+
+class StubNSEService:
+    """Threaded HTTP server; use as a context manager or call start()/stop()"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: StubConfig = None):
+        self.config = config or StubConfig()
+        self._random = random.Random(self.config.seed)
+        self._random_lock = threading.Lock()
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _roll(self, rate: float) -> bool:
+        with self._random_lock:
+            return self._random.random() < rate
+
+    def _delay(self):
+        with self._random_lock:
+            jitter = self._random.uniform(-self.config.jitter, self.config.jitter)
+        time.sleep(max(self.config.latency + jitter, 0))
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _lookup(self, symbol: str) -> dict:
+                stub._delay()
+                if stub._roll(stub.config.failure_rate):
+                    return {"symbol": symbol, "success": False, "pe_ratio": None, "message": "Injected failure"}
+                return {"symbol": symbol, "success": True, "pe_ratio": _pe_for(symbol)}
+
+            def do_GET(self):
+                stub.requests += 1
+                url = urlparse(self.path)
+                parts = [unquote(part) for part in url.path.strip("/").split("/")]
+
+                if url.path == "/":
+                    self._json(200, {"service": "stub"}, {"Set-Cookie": "nsit=stub; Path=/"})
+                elif parts[:2] == ["api", "pe"] and len(parts) == 4 and parts[2] == "history":
+                    query = parse_qs(url.query)
+                    start = date.fromisoformat(query["from"][0])
+                    end = date.fromisoformat(query["to"][0])
+                    days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+                    self._json(200, {"success": True, "symbol": parts[3], "data": [
+                        {"date": day.isoformat(), "pe_ratio": _pe_for(parts[3], day)} for day in days if day.weekday() < 5
+                    ]})
+                elif parts[:2] == ["api", "pe"] and len(parts) == 3:
+                    if stub._roll(stub.config.error_rate):
+                        stub._delay()
+                        self._json(500, {"success": False, "message": "Injected error"})
+                    else:
+                        self._json(200, self._lookup(parts[2]))
+                elif url.path == "/api/quote-equity":
+                    symbol = parse_qs(url.query).get("symbol", [""])[0]
+                    stub._delay()
+                    if stub._roll(stub.config.direct_failure_rate):
+                        self._json(200, {"info": {"symbol": symbol}})
+                    else:
+                        self._json(200, {"info": {"symbol": symbol}, "priceInfo": {"pe": _pe_for(symbol)}})
+                elif url.path.startswith("/get-quotes/"):
+                    self._json(200, {})
+                else:
+                    self._json(404, {"success": False, "message": "Not found"})
+
+            def do_POST(self):
+                stub.requests += 1
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if urlparse(self.path).path != "/api/pe/batch":
+                    self._json(404, {"success": False, "message": "Not found"})
+                    return
+                if not stub.config.batch:
+                    self._json(503, {"success": False, "message": "Batch disabled"})
+                    return
+                symbols = json.loads(body or b"{}").get("symbols", [])
+                self._json(200, {"success": True, "results": [self._lookup(symbol) for symbol in symbols]})
+
+        return Handler
+
+    def start(self) -> "StubNSEService":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-nse", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubNSEService":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the NSE service and website")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per symbol lookup")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of lookups answering success=false")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of per-symbol lookups answering HTTP 500")
+    parser.add_argument("--no-batch", action="store_true", help="Answer the batch endpoint with 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+        error_rate=args.error_rate, batch=not args.no_batch, seed=args.seed
+    )
+    stub = StubNSEService(args.host, args.port, config)
+    print(f"Stub NSE service listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,5 +12,8 @@ if __name__ == "__main__":
         port=port,
         reload=False,  # No reload in production
         workers=4 if os.getenv("WORKERS") is None else int(os.getenv("WORKERS")),
-        log_level="info"
+        log_level="info",
+        # Open /api/stream connections never finish on their own; close them
+        # after this many seconds instead of waiting forever on shutdown
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", 10))
     )
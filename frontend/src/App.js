@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import './App.css';
@@ -9,6 +9,9 @@ import './App.css';
 const API_BASE_URL = process.env.REACT_APP_API_URL || 
   (process.env.NODE_ENV === 'production' ? '' : 'http://localhost:8000');
 
+// How often the chart asks the backend for new P/E points when the browser has no EventSource
+const POLL_INTERVAL_MS = 60 * 1000;
+
 function App() {
   const [companies, setCompanies] = useState([]);
   const [selectedCompanies, setSelectedCompanies] = useState([]);
@@ -16,6 +19,8 @@ function App() {
   const [loading, setLoading] = useState(true);
   const [timeRange, setTimeRange] = useState('month'); // week, month, all
   const [stats, setStats] = useState(null);
+  // Delta sync cursor for the data currently in the chart
+  const cursorRef = useRef(null);
 
   useEffect(() => {
     fetchCompanies();
@@ -31,6 +36,29 @@ function App() {
     }
   }, [selectedCompanies, timeRange]);
 
+  useEffect(() => {
+    if (selectedCompanies.length === 0) {
+      return undefined;
+    }
+    if (typeof window.EventSource === 'undefined') {
+      // No Server-Sent Events support: poll for changes instead
+      const timer = setInterval(pollChanges, POLL_INTERVAL_MS);
+      return () => clearInterval(timer);
+    }
+    // The backend pushes new points as soon as an ingest commits; the browser
+    // reconnects by itself and is sent what it missed in between
+    const source = new EventSource(`${API_BASE_URL}/api/stream`);
+    source.addEventListener('pe', event => {
+      const changes = JSON.parse(event.data).changes.filter(c => selectedCompanies.includes(c.symbol));
+      if (changes.length > 0) {
+        setPeData(prev => mergeChanges(prev, changes));
+        fetchStats();
+      }
+    });
+    source.addEventListener('resync', () => fetchPEData());
+    return () => source.close();
+  }, [selectedCompanies, timeRange]);
+
   const fetchCompanies = async () => {
     try {
       setLoading(true);
@@ -77,6 +105,10 @@ function App() {
       }
       params.end_date = endDate.toISOString().split('T')[0];
 
+      // Take a cursor before the full load, so nothing written during it is missed
+      const changes = await axios.get(`${API_BASE_URL}/api/pe-data/changes`);
+      cursorRef.current = changes.data.cursor;
+
       const response = await axios.get(`${API_BASE_URL}/api/pe-data/all`, { params });
       
       // Filter for selected companies and format for chart
@@ -89,6 +121,48 @@ function App() {
     }
   };
 
+  const pollChanges = async () => {
+    if (!cursorRef.current) {
+      return;
+    }
+    try {
+      const response = await axios.get(`${API_BASE_URL}/api/pe-data/changes`, {
+        params: { cursor: cursorRef.current, symbols: selectedCompanies.join(',') }
+      });
+      if (response.data.resync_required) {
+        fetchPEData();
+        return;
+      }
+      cursorRef.current = response.data.cursor;
+      if (response.data.changes.length > 0) {
+        setPeData(prev => mergeChanges(prev, response.data.changes));
+        fetchStats();
+      }
+    } catch (error) {
+      console.error('Error polling P/E changes:', error);
+    }
+  };
+
+  const mergeChanges = (chartData, changes) => {
+    // Apply new or updated points to the chart rows, keyed by date
+    const dateMap = {};
+    chartData.forEach(row => {
+      dateMap[row.date] = { ...row };
+    });
+    // Backfilled points before a week/month window stay out of it
+    const earliest = timeRange !== 'all' && chartData.length > 0 ? chartData[0].date : null;
+    changes.forEach(change => {
+      if (earliest && change.date < earliest) {
+        return;
+      }
+      if (!dateMap[change.date]) {
+        dateMap[change.date] = { date: change.date };
+      }
+      dateMap[change.date][change.symbol] = change.pe_ratio;
+    });
+    return Object.values(dateMap).sort((a, b) => new Date(a.date) - new Date(b.date));
+  };
+
   const formatDataForChart = (companiesData) => {
     // Create a map of dates to data points
     const dateMap = {};
@@ -120,7 +194,18 @@ function App() {
   const handleManualScrape = async () => {
     try {
       const response = await axios.post(`${API_BASE_URL}/api/scrape-now`);
-      alert(`Scraping completed: ${response.data.message}`);
+      // The scrape runs in the background; poll the job until it finishes
+      let job = response.data;
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const statusResponse = await axios.get(`${API_BASE_URL}/api/scrape-jobs/${response.data.job_id}`);
+        job = statusResponse.data;
+      }
+      if (job.status === 'succeeded') {
+        alert(`Scraping completed: got P/E data for ${job.progress.done - job.progress.failed}/${job.progress.total} companies`);
+      } else {
+        alert('Scraping failed: ' + job.error);
+      }
       fetchPEData();
       fetchStats();
     } catch (error) {